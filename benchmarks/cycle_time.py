@@ -0,0 +1,80 @@
+"""Benchmarks PlateCrane transfer, remove_lid and replace_lid cycle times against the simulated controller.
+
+Runs every route of platecrane_driver.cycle_time and prints its commands, round trips, cycle time (split into
+controller motion, remaining serial wait and Python overhead) and per-primitive latency. The command and
+round trip counts are checked against the baselines in src/platecrane_driver/cycle_time_baseline.json,
+which tests/test_cycle_time.py checks as well.
+
+Usage:
+    python benchmarks/cycle_time.py --time-scale 0.1
+    python benchmarks/cycle_time.py --update-baseline
+"""
+
+import argparse
+import json
+import statistics
+from collections import defaultdict
+
+from platecrane_driver.cycle_time import (
+    BASELINE_PATH,
+    load_baseline,
+    regressions,
+    run_all,
+)
+
+
+def main():
+    """Runs the benchmark, prints a report and checks or updates the baselines."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--time-scale", type=float, default=0.0)
+    parser.add_argument("--read-mode", type=str, default="framed")
+    parser.add_argument("--pipeline-window", type=int, default=1)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run_all(args.time_scale, args.read_mode, args.pipeline_window)
+
+    print()
+    print(
+        f"{'route':<40} {'cmds':>5} {'trips':>6} {'cycle [s]':>10} "
+        f"{'motion [s]':>11} {'serial [s]':>11} {'python [s]':>11}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<40} {result['commands']:>5} {result['round_trips']:>6} "
+            f"{result['cycle_time']:>10.3f} {result['motion_time']:>11.3f} "
+            f"{result['serial_wait']:>11.3f} {result['overhead']:>11.3f}"
+        )
+
+    latencies = defaultdict(list)
+    for result in results.values():
+        for verb, values in result["latencies"].items():
+            latencies[verb] += values
+    print()
+    print(
+        f"{'primitive':<12} {'count':>6} {'mean [s]':>10} {'p50 [s]':>10} {'max [s]':>10}"
+    )
+    for verb, values in sorted(latencies.items()):
+        print(
+            f"{verb:<12} {len(values):>6} {statistics.mean(values):>10.3f} "
+            f"{statistics.median(values):>10.3f} {max(values):>10.3f}"
+        )
+
+    if args.update_baseline:
+        baseline = {
+            name: {key: result[key] for key in ("commands", "round_trips")}
+            for name, result in results.items()
+        }
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=4)
+            f.write("\n")
+        print(f"\nBaseline written to {BASELINE_PATH}")
+        return
+
+    messages = regressions(results, load_baseline())
+    print()
+    print("\n".join(messages) if messages else "No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
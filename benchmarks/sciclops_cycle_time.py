@@ -0,0 +1,74 @@
+"""Benchmarks Sciclops get_plate, remove_lid and plate_to_stack cycle times against the simulated robot.
+
+Runs every routine of platecrane_driver.sciclops_cycle_time and prints its commands, cycle time (split into
+robot motion and remaining time) and per-primitive latency. With --probe-towers the tower picks and places tap
+the towers instead of descending to the computed tower top. The command counts are checked against the
+baselines in src/platecrane_driver/sciclops_cycle_time_baseline.json, which tests/test_sciclops_simulator.py
+checks as well.
+
+Usage:
+    python benchmarks/sciclops_cycle_time.py --time-scale 0.1
+    python benchmarks/sciclops_cycle_time.py --update-baseline
+"""
+
+import argparse
+import json
+import statistics
+
+from platecrane_driver.sciclops_cycle_time import (
+    BASELINE_PATH,
+    load_baseline,
+    primitive_latencies,
+    regressions,
+    run_all,
+)
+
+
+def main():
+    """Runs the benchmark, prints a report and checks or updates the baselines."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--time-scale", type=float, default=0.0)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--probe-towers", action="store_true")
+    args = parser.parse_args()
+
+    results = run_all(args.time_scale, not args.probe_towers)
+    latencies = primitive_latencies(args.time_scale, not args.probe_towers)
+
+    print()
+    print(
+        f"{'routine':<32} {'cmds':>5} {'cycle [s]':>10} {'motion [s]':>11} {'other [s]':>10}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<32} {result['commands']:>5} {result['cycle_time']:>10.3f} "
+            f"{result['motion_time']:>11.3f} {result['overhead']:>10.3f}"
+        )
+
+    print()
+    print(
+        f"{'primitive':<12} {'count':>6} {'mean [s]':>10} {'p50 [s]':>10} {'max [s]':>10}"
+    )
+    for verb, values in sorted(latencies.items()):
+        print(
+            f"{verb:<12} {len(values):>6} {statistics.mean(values):>10.3f} "
+            f"{statistics.median(values):>10.3f} {max(values):>10.3f}"
+        )
+
+    if args.update_baseline:
+        baseline = {
+            name: {"commands": result["commands"]} for name, result in results.items()
+        }
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=4)
+            f.write("\n")
+        print(f"\nBaseline written to {BASELINE_PATH}")
+        return
+
+    messages = regressions(results, load_baseline())
+    print()
+    print("\n".join(messages) if messages else "No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Benchmarks per-command latency of the SerialPort read modes against the simulated PlateCrane controller.
+
+Usage:
+    python benchmarks/serial_read_latency.py --commands 20 --reply-delay 0.05
+"""
+
+import argparse
+import statistics
+import time
+
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.serial_port import READ_MODES, SerialPort
+
+
+def benchmark(read_mode, commands, reply_delay):
+    """Sends the given number of GETPOS commands and returns the per-command latencies in seconds."""
+    controller = PlateCraneSimulator(command_time=reply_delay)
+    port = SerialPort(host_path=controller.port_path, read_mode=read_mode)
+    latencies = []
+    try:
+        for _ in range(commands):
+            start = time.perf_counter()
+            port.send_command("GETPOS\r\n")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        port.connection.close()
+        port.connection_status.close()
+        controller.close()
+    return latencies
+
+
+def main():
+    """Runs the benchmark for every read mode and prints a summary."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", type=int, default=20)
+    parser.add_argument("--reply-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = {
+        read_mode: benchmark(read_mode, args.commands, args.reply_delay)
+        for read_mode in READ_MODES
+    }
+    print()
+    print(f"{'mode':<8} {'mean [s]':>10} {'p50 [s]':>10} {'max [s]':>10}")
+    for read_mode, latencies in results.items():
+        print(
+            f"{read_mode:<8} {statistics.mean(latencies):>10.3f} "
+            f"{statistics.median(latencies):>10.3f} {max(latencies):>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
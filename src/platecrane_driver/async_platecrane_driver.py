@@ -0,0 +1,417 @@
+"""Asyncio interface to the PlateCrane, mirroring the motion primitives of platecrane_driver.PlateCrane"""
+
+from typing import List
+
+from platecrane_driver import motion_plan
+from platecrane_driver.async_serial_port import AsyncSerialPort
+from platecrane_driver.error_codes import PlateCraneError
+from platecrane_driver.motion_plan import PlanStep, PoseTracker, SpeedManager
+from platecrane_driver.resource_registry import registry
+from platecrane_driver.resource_types import PlateResource
+from platecrane_driver.response_parser import (
+    is_error,
+    parse_point_list,
+    parse_position,
+)
+from platecrane_driver.route_cache import RouteCache
+from platecrane_driver.waypoints import WaypointManager, derived_poses
+
+
+class AsyncPlateCrane:
+    """Python asyncio interface that allows remote commands to be executed to the plate_crane.
+
+    Every hardware interaction is a coroutine, so many cranes (real or simulated) can be driven
+    from one event loop and callers can keep serving other requests while a transfer runs.
+    """
+
+    def __init__(
+        self,
+        host_path="/dev/ttyUSB4",
+        baud_rate=9600,
+        verify_interval=0,
+        use_waypoints=True,
+        routes=(),
+        strict_motion=False,
+    ):
+        """Initialization function. Call connect() before using the crane.
+
+        Args:
+            host_path (str): usb path of PlateCrane EX device
+            baud_rate (int): baud rate to use for communication with the PlateCrane EX device
+            verify_interval (int): number of moves after which the tracked pose is re-read with GETPOS (see PoseTracker)
+            use_waypoints (bool): keep locations and derived poses in device memory and move to them by name (see waypoints.py)
+            routes ([dict]): transfer routes (transfer keyword arguments) to compile at startup (see route_cache.py)
+            strict_motion (bool): move one axis at a time exactly as planned, instead of merging moves
+                within the safe envelope (see safe_envelope.py)
+
+        Returns:
+            None
+        """
+        self.__serial_port = AsyncSerialPort(host_path=host_path, baud_rate=baud_rate)
+        self.robot_error = "NO ERROR"
+        self.status = 0
+        self.error = ""
+
+        self.robot_status = ""
+        self.movement_state = "READY"
+        self.pose_tracker = PoseTracker(verify_interval=verify_interval)
+        self.waypoints = WaypointManager() if use_waypoints else None
+        self.route_cache = RouteCache(routes)
+        self.strict_motion = strict_motion
+        self.speed_manager = SpeedManager()
+
+    @property
+    def platecrane_current_position(self) -> list:
+        """Last known [R, Z, P, Y] joint values, or None if unknown"""
+        return self.pose_tracker.pose
+
+    async def connect(self):
+        """Opens the serial connection and runs the initialization actions"""
+        await self.__serial_port.connect()
+        await self.initialize()
+
+    async def disconnect(self):
+        """Closes the serial connection"""
+        await self.__serial_port.disconnect()
+
+    async def initialize(self):
+        """Initialization actions"""
+        await self.get_status()
+        if self.robot_status == "0":
+            await self.home()
+        await self.get_position()
+        await self.apply_speed(self.speed_manager.default_speed)
+        if self.waypoints is not None:
+            await self.sync_waypoints()
+
+    async def sync_waypoints(self):
+        """Loads the resource_defs locations and their derived poses into device memory. See PlateCrane.sync_waypoints"""
+        device_points = parse_point_list(
+            await self.__serial_port.send_command("LISTPOINTS\r\n")
+        )
+        to_load = self.waypoints.sync_plan(
+            derived_poses(registry.locations), device_points
+        )
+        for name, (R, Z, P, Y) in to_load.items():
+            await self.set_location(name, R, Z, P, Y)
+
+    async def home(self):
+        """Homes all of the axes. Returns to neutral position (above exchange)"""
+        await self.__serial_port.send_command("HOME\r\n", timeout=60)
+        self.pose_tracker.invalidate()
+
+    async def get_status(self):
+        """Checks status of plate_crane"""
+        self.robot_status = await self.__serial_port.send_command("STATUS\r\n")
+
+    async def free_joints(self):
+        """Unlocks the joints of the plate_crane"""
+        await self.__serial_port.send_command("limp TRUE\r\n")
+
+    async def lock_joints(self):
+        """Locks the joints of the plate_crane"""
+        await self.__serial_port.send_command("limp FALSE\r\n")
+
+    async def set_speed(self, speed: int):
+        """Sets the default speed of the plate crane arm. See PlateCrane.set_speed
+
+        Args:
+            speed (int): (units = % of full speed) Speed at which to move the PlateCrane EX. Appies to all axes
+        """
+        self.speed_manager.default_speed = speed
+        await self.apply_speed(speed)
+
+    async def apply_speed(self, speed: int) -> None:
+        """Sends SPEED if the arm does not already move at the given speed. See PlateCrane.apply_speed"""
+        if not self.speed_manager.needs_change(speed):
+            return
+        response = await self.__serial_port.send_command("SPEED %d\r\n" % speed)
+        if is_error(response) or not response:
+            self.speed_manager.invalidate()
+            print(f"SPEED {speed}% NOT ACKNOWLEDGED: {response}")
+        else:
+            self.speed_manager.acknowledged(speed)
+            print(f"SPEED SET TO {speed}%")
+
+    async def get_position(self) -> list:
+        """Returns list of joint values for current position of the PlateCrane EX arm
+
+        Returns:
+            current_position ([int]): [R, Z, P, Y] joint values
+
+        Raises:
+            PlateCraneError: the controller replied with an error code or a malformed position
+        """
+        response = await self.__serial_port.send_command("GETPOS\r\n")
+        try:
+            current_position = list(parse_position(response))
+        except PlateCraneError:
+            self.pose_tracker.invalidate()
+            raise
+        self.pose_tracker.measured(current_position)
+        return current_position
+
+    async def set_location(
+        self,
+        location_name: str = "TEMP_0",
+        R: int = 0,
+        Z: int = 0,
+        P: int = 0,
+        Y: int = 0,
+    ):
+        """Saves a new location into PlateCrane EX device memory"""
+        command = "LOADPOINT %s, %s, %s, %s, %s\r\n" % (location_name, R, Z, P, Y)
+        await self.__serial_port.send_command(command)
+        if self.waypoints is not None:
+            self.waypoints.loaded(location_name, [R, Z, P, Y])
+
+    async def delete_location(self, location_name: str = None):
+        """Deletes an existing location from the PlateCrane EX device memory"""
+        if not location_name:
+            raise Exception("No location name provided")
+        await self.__serial_port.send_command("DELETEPOINT %s\r\n" % (location_name))
+        if self.waypoints is not None:
+            self.waypoints.deleted(location_name)
+
+    async def gripper_open(self):
+        """Opens gripper"""
+        await self.__serial_port.send_command("OPEN\r\n")
+
+    async def gripper_close(self):
+        """Closes gripper"""
+        await self.__serial_port.send_command("CLOSE\r\n")
+
+    async def jog(self, axis, distance) -> None:
+        """Moves the specified axis the specified distance (units = motor steps)."""
+        response = await self.__serial_port.send_command(
+            "JOG %s,%d\r\n" % (axis, distance)
+        )
+        if is_error(response):
+            self.pose_tracker.invalidate()
+        else:
+            self.pose_tracker.jogged(axis, distance)
+
+    async def move_joint_angles(self, R: int, Z: int, P: int, Y: int) -> None:
+        """Move to a specified location (unit = motor steps). See PlateCrane.move_joint_angles"""
+        if self.waypoints is None:
+            point = "TEMP"
+            await self.set_location(point, R, Z, P, Y)
+        else:
+            point = self.waypoints.name_for([R, Z, P, Y])
+            if point is None:
+                point, needs_load = self.waypoints.slot_for([R, Z, P, Y])
+                if needs_load:
+                    await self.set_location(point, R, Z, P, Y)
+        try:
+            response = await self.__serial_port.send_command(
+                "MOVE %s\r\n" % point, timeout=60
+            )
+        except Exception as err:
+            print(err)
+            self.robot_error = err
+            self.pose_tracker.invalidate()
+        else:
+            self.move_status = "COMPLETED"
+            if is_error(response):
+                self.pose_tracker.invalidate()
+            else:
+                self.pose_tracker.commanded([R, Z, P, Y])
+        if self.waypoints is None:
+            await self.delete_location(point)
+
+    async def move_single_axis(self, axis: str, loc: str) -> None:
+        """Moves on a single axis, using an existing location in PlateCrane EX device memory as reference"""
+        if not loc:
+            raise Exception(
+                "PlateCraneLocationException: NoneType variable is not compatible as a location"
+            )
+        await self.__serial_port.send_command(
+            "MOVE_" + axis.upper() + " " + loc + "\r\n"
+        )
+        self.move_status = "COMPLETED"
+        self.pose_tracker.invalidate()
+
+    async def move_location(self, loc: str = None) -> None:
+        """Moves all joint to the given location."""
+        if not loc:
+            raise Exception(
+                "PlateCraneLocationException: NoneType variable is not compatible as a location"
+            )
+        await self.__serial_port.send_command("MOVE " + loc + "\r\n")
+        self.pose_tracker.invalidate()
+
+    async def execute_plan(self, plan: List[PlanStep]) -> None:
+        """Executes a motion plan (see motion_plan.py), only querying GETPOS at checkpoints. See PlateCrane.execute_plan"""
+        tracker = self.pose_tracker
+        if not self.strict_motion:
+            if tracker.pose is None:
+                await self.get_position()
+            plan = motion_plan.merge_safe_moves(plan, tracker.pose)
+        for step in plan:
+            if step.action == "move":
+                if tracker.needs_checkpoint(step.joints):
+                    await self.get_position()
+                target = tracker.resolve(step.joints)
+                if target == tracker.pose and not step.probe:
+                    continue
+                await self.apply_speed(self.speed_manager.speed_for(step))
+                await self.move_joint_angles(*target)
+                if step.probe:
+                    tracker.invalidate()
+            elif step.action == "gripper_open":
+                await self.gripper_open()
+            elif step.action == "gripper_close":
+                await self.gripper_close()
+            elif step.action == "set_speed":
+                await self.set_speed(step.value)
+            elif step.action == "jog":
+                await self.apply_speed(self.speed_manager.speed_for(step))
+                await self.jog(step.axis, step.value)
+
+    async def move_tower_neutral(self) -> None:
+        """Moves the tower to neutral position"""
+        await self.execute_plan(motion_plan.plan_tower_neutral())
+
+    async def move_arm_neutral(self) -> None:
+        """Moves the arm to neutral position"""
+        await self.execute_plan(motion_plan.plan_arm_neutral())
+
+    async def move_joints_neutral(self) -> None:
+        """Moves all joints neutral position"""
+        await self.move_arm_neutral()
+        await self.move_tower_neutral()
+
+    async def pick_plate_safe_approach(
+        self,
+        source: str,
+        plate_type: str,
+        grip_height_in_steps: int,
+    ) -> None:
+        """Picks a plate from a source type "nest" using a safe travel path. See PlateCrane.pick_plate_safe_approach"""
+        await self.execute_plan(
+            motion_plan.plan_pick_plate_safe_approach(
+                source=source, grip_height_in_steps=grip_height_in_steps
+            )
+        )
+
+    async def place_plate_safe_approach(
+        self,
+        target: str,
+        grip_height_in_steps: int,
+    ) -> None:
+        """Places a plate to a target location of type "nest" using a safe travel path. See PlateCrane.place_plate_safe_approach"""
+        await self.execute_plan(
+            motion_plan.plan_place_plate_safe_approach(
+                target=target, grip_height_in_steps=grip_height_in_steps
+            )
+        )
+
+    async def pick_plate_direct(
+        self,
+        source: str,
+        source_type: str,
+        plate_type: str,
+        grip_height_in_steps: int,
+        has_lid: bool,
+        incremental_lift: bool = False,
+    ) -> None:
+        """Picks a plate from a source location of type either "nest" or "stack" using a direct travel path. See PlateCrane.pick_plate_direct"""
+        await self.execute_plan(
+            motion_plan.plan_pick_plate_direct(
+                source=source,
+                source_type=source_type,
+                plate_type=plate_type,
+                grip_height_in_steps=grip_height_in_steps,
+                has_lid=has_lid,
+                incremental_lift=incremental_lift,
+            )
+        )
+
+    async def place_plate_direct(
+        self,
+        target: str,
+        target_type: str,
+        grip_height_in_steps: int,
+    ) -> None:
+        """Places a plate onto a target location of type either "nest" or "stack" using a direct travel path. See PlateCrane.place_plate_direct"""
+        await self.execute_plan(
+            motion_plan.plan_place_plate_direct(
+                target=target,
+                target_type=target_type,
+                grip_height_in_steps=grip_height_in_steps,
+            )
+        )
+
+    async def remove_lid(
+        self,
+        source: str,
+        target: str,
+        plate_type: str,
+        height_offset: int = 0,
+    ) -> None:
+        """Removes lid from a plate at source location and places lid at target location"""
+        plate = registry.plate(plate_type)
+        await self.transfer(
+            source=source,
+            target=target,
+            plate_type=plate_type,
+            height_offset=height_offset,
+            is_lid=True,
+            source_grip_height_in_steps=PlateResource.convert_to_steps(
+                plate.lid_removal_grip_height + height_offset
+            ),
+            target_grip_height_in_steps=PlateResource.convert_to_steps(
+                plate.plate_height_with_lid - plate.lid_height + height_offset
+            ),
+            incremental_lift=True,
+        )
+
+    async def replace_lid(
+        self,
+        source: str,
+        target: str,
+        plate_type: str,
+        height_offset: int = 0,
+    ) -> None:
+        """Replaces lid at source location onto a plate at the target location"""
+        plate = registry.plate(plate_type)
+        await self.transfer(
+            source=source,
+            target=target,
+            plate_type=plate_type,
+            height_offset=height_offset,
+            is_lid=True,
+            source_grip_height_in_steps=PlateResource.convert_to_steps(
+                plate.lid_grip_height + height_offset
+            ),
+            target_grip_height_in_steps=PlateResource.convert_to_steps(
+                plate.lid_removal_grip_height + height_offset
+            ),
+        )
+
+    async def transfer(
+        self,
+        source: str,
+        target: str,
+        plate_type: str,
+        height_offset: int = 0,  # units = mm
+        is_lid: bool = False,
+        has_lid: bool = False,
+        source_grip_height_in_steps: int = None,  # if removing/replacing lid
+        target_grip_height_in_steps: int = None,  # if removing/replacing lid
+        incremental_lift: bool = False,
+    ) -> None:
+        """Handles the transfer request. See PlateCrane.transfer for the arguments"""
+        await self.execute_plan(
+            self.route_cache.get(
+                source=source,
+                target=target,
+                plate_type=plate_type,
+                height_offset=height_offset,
+                is_lid=is_lid,
+                has_lid=has_lid,
+                source_grip_height_in_steps=source_grip_height_in_steps,
+                target_grip_height_in_steps=target_grip_height_in_steps,
+                incremental_lift=incremental_lift,
+            )
+        )
@@ -0,0 +1,126 @@
+"""Provides AsyncSerialPort class to interface with the plate_crane from an asyncio event loop."""
+
+import asyncio
+import time
+
+from serial import Serial
+
+from platecrane_driver.serial_port import ReplyFramer
+
+
+class _ReplyProtocol(asyncio.Protocol):
+    """Feeds bytes received on the serial transport into the framer of the pending command."""
+
+    def __init__(self):
+        """Creates a new _ReplyProtocol."""
+        self.framer = None
+        self.reply_complete = asyncio.Event()
+        self.closed = False
+
+    def data_received(self, data):
+        """Called by the read transport whenever bytes arrive."""
+        if self.framer is not None and self.framer.feed(data):
+            self.reply_complete.set()
+
+    def connection_lost(self, exc):
+        """Called by the read transport when the port is closed."""
+        self.closed = True
+        self.reply_complete.set()
+
+
+class AsyncSerialPort:
+    """
+    Description:
+    Asyncio interface that allows remote commands to be executed to the plate_crane.
+    Replies are read through an asyncio read transport on the serial file descriptor and framed
+    with the same ReplyFramer as SerialPort's 'framed' mode, so awaiting a reply never blocks the loop.
+    """
+
+    def __init__(self, host_path="/dev/ttyUSB2", baud_rate=9600):
+        """Creates a new AsyncSerialPort object. Call connect() before sending commands.
+        Params:
+        - host_path (str): The path to the serial port. Default is '/dev/ttyUSB2'.
+        - baud_rate (int): The baud rate of the serial port. Default is 9600.
+        """
+        self.host_path = host_path
+        self.baud_rate = baud_rate
+        self.connection = None
+
+        self.status = 0
+        self.error = ""
+
+        self._read_transport = None
+        self._write_transport = None
+        self._protocol = None
+        self._lock = None
+
+    async def connect(self):
+        """
+        Connect to serial port and attach asyncio transports / If wrong port entered inform user
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            self.connection = Serial(self.host_path, self.baud_rate, timeout=0)
+        except Exception as e:
+            raise Exception("Could not establish connection") from e
+
+        self._read_transport, self._protocol = await loop.connect_read_pipe(
+            _ReplyProtocol, self.connection
+        )
+        self._write_transport, _ = await loop.connect_write_pipe(
+            asyncio.BaseProtocol, self.connection
+        )
+        self._lock = asyncio.Lock()
+
+    async def disconnect(self):
+        """Closes the transports and the serial port."""
+        for transport in (self._read_transport, self._write_transport):
+            if transport is not None:
+                transport.close()
+        self._read_transport = None
+        self._write_transport = None
+        # Let the transports finish closing before the loop moves on
+        await asyncio.sleep(0)
+        print("Robot is successfully disconnected")
+
+    async def send_command(self, command, timeout=10, delay=0):
+        """
+        Sends provided command to the plate_crane and awaits its reply.
+        Commands are serialized, so concurrent callers never interleave bytes on the link.
+        """
+        async with self._lock:
+            print_command = command.strip("\r\n")
+            print(f"Sending command '{print_command}'")
+
+            send_time = time.time()
+            framer = ReplyFramer(command.strip("\r\n"))
+            self._protocol.framer = framer
+            self._protocol.reply_complete.clear()
+            self._write_transport.write(command.encode("utf-8"))
+
+            if delay:
+                await asyncio.sleep(delay)
+
+            await self._wait_for_reply(framer, timeout)
+            self._protocol.framer = None
+
+            response_msg, initial_command_msg = framer.response()
+            print(
+                f"Command '{initial_command_msg}': {response_msg} (elapsed time: {time.time() - send_time} seconds)"
+            )
+            return response_msg
+
+    async def _wait_for_reply(self, framer, timeout):
+        """Waits until the framer reports the final frame, the reply goes quiet, or the timeout passes."""
+        deadline = time.monotonic() + timeout
+        while not framer.complete:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._protocol.closed:
+                return
+            try:
+                await asyncio.wait_for(
+                    self._protocol.reply_complete.wait(),
+                    timeout=min(remaining, framer.frame_gap),
+                )
+            except asyncio.TimeoutError:
+                framer.check_quiet()
@@ -0,0 +1,97 @@
+"""Orders a batch of PlateCrane transfers to minimize base (R axis) travel.
+
+Base rotation dominates travel between transfers, so a batch is ordered greedily: starting from the
+current base angle, the next transfer is always the ready one whose source is closest in R to where
+the arm is (the target of the previous transfer).
+
+A transfer is ready once every earlier transfer (in request order) that shares a location with it
+has run, e.g. 'Stack1 -> Nest' has to stay before 'Nest -> Stack2'. Independent transfers are
+reordered freely.
+"""
+
+from typing import List, Optional, Sequence
+
+from pydantic import BaseModel
+
+from platecrane_driver.resource_registry import registry
+
+
+class TransferRequest(BaseModel):
+    """One transfer of a batch, see PlateCrane.transfer"""
+
+    source: str
+    """Source location name defined in resource_defs.py"""
+    target: str
+    """Target location name defined in resource_defs.py"""
+    plate_type: str
+    """Plate definition name defined in resource_defs.py"""
+    height_offset: int = 0
+    """Change in z height applied to the grip location (unit: mm)"""
+    has_lid: bool = False
+    """True if the plate has a lid"""
+
+
+def base_angle(location: str) -> int:
+    """Returns the R joint value of a location"""
+    return registry.location(location).joint_angles[0]
+
+
+def dependencies(transfers: Sequence[TransferRequest]) -> List[List[int]]:
+    """Returns, for every transfer, the indices of the earlier transfers it has to run after"""
+    result = []
+    for index, transfer in enumerate(transfers):
+        places = {transfer.source, transfer.target}
+        result.append(
+            [
+                earlier
+                for earlier in range(index)
+                if places & {transfers[earlier].source, transfers[earlier].target}
+            ]
+        )
+    return result
+
+
+def order_transfers(
+    transfers: Sequence[TransferRequest], start_r: Optional[int] = None
+) -> List[int]:
+    """Returns the indices of the transfers in execution order
+
+    Args:
+        transfers ([TransferRequest]): transfers in request order
+        start_r (int): current R joint value, defaults to the R of the Safe location
+    """
+    if start_r is None:
+        start_r = base_angle("Safe")
+    requires = dependencies(transfers)
+    done = set()
+    order = []
+    current_r = start_r
+    while len(order) < len(transfers):
+        ready = [
+            index
+            for index in range(len(transfers))
+            if index not in done and all(earlier in done for earlier in requires[index])
+        ]
+        # min() keeps request order on ties, so equally distant transfers are not swapped
+        chosen = min(
+            ready,
+            key=lambda index: abs(base_angle(transfers[index].source) - current_r),
+        )
+        order.append(chosen)
+        done.add(chosen)
+        current_r = base_angle(transfers[chosen].target)
+    return order
+
+
+def base_travel(
+    transfers: Sequence[TransferRequest], order: Sequence[int], start_r: int
+) -> int:
+    """Returns the total R travel (unit: motor steps) of running the transfers in the given order"""
+    travel = 0
+    current_r = start_r
+    for index in order:
+        source_r = base_angle(transfers[index].source)
+        target_r = base_angle(transfers[index].target)
+        travel += abs(source_r - current_r) + abs(target_r - source_r)
+        current_r = target_r
+    return travel
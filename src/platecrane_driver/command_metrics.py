@@ -0,0 +1,156 @@
+"""Structured per-command timing for the PlateCrane serial link.
+
+SerialPort records every command it sends into a CommandMetrics object (when enabled), grouped by
+command verb (MOVE, GETPOS, LOADPOINT, ...). Timings are kept in fixed-bucket histograms, so
+recording is O(log buckets) and memory does not grow with the number of commands.
+"""
+
+from bisect import bisect_left
+from typing import Dict, Optional
+
+BUCKET_BOUNDS = (
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1.0,
+    2.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+"""Upper bounds (unit: seconds) of the histogram buckets, the last bucket is unbounded"""
+
+
+def command_verb(command: str) -> str:
+    """Returns the verb of a command, e.g. 'LOADPOINT' for 'LOADPOINT TEMP0, 1, 2, 3, 4'"""
+    verb = command.split(" ", 1)[0].strip("\r\n").upper()
+    return verb or "<empty>"
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations (unit: seconds)"""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        """Creates an empty histogram with the given bucket upper bounds"""
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        """Adds a value to the histogram"""
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        """Returns the histogram as a JSON serializable dict"""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {
+                **{
+                    str(bound): count for bound, count in zip(self.bounds, self.buckets)
+                },
+                "+Inf": self.buckets[-1],
+            },
+        }
+
+
+class VerbMetrics:
+    """Timings and counters of one command verb"""
+
+    def __init__(self):
+        """Creates empty metrics"""
+        self.write_time = Histogram()
+        """Time spent writing the command to the port"""
+        self.first_byte_latency = Histogram()
+        """Time from the end of the write to the first received byte"""
+        self.round_trip = Histogram()
+        """Time from the start of the write to the final reply frame"""
+        self.commands = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def snapshot(self) -> dict:
+        """Returns the metrics as a JSON serializable dict"""
+        return {
+            "commands": self.commands,
+            "errors": self.errors,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "write_time": self.write_time.snapshot(),
+            "first_byte_latency": self.first_byte_latency.snapshot(),
+            "round_trip": self.round_trip.snapshot(),
+        }
+
+
+class CommandMetrics:
+    """Per-verb command metrics of a serial link"""
+
+    def __init__(self):
+        """Creates empty metrics"""
+        self.verbs: Dict[str, VerbMetrics] = {}
+
+    def _verb(self, verb: str) -> VerbMetrics:
+        """Returns the metrics of a verb, creating them on first use"""
+        metrics = self.verbs.get(verb)
+        if metrics is None:
+            metrics = self.verbs[verb] = VerbMetrics()
+        return metrics
+
+    def record(
+        self,
+        command: str,
+        write_time: float,
+        first_byte_latency: Optional[float],
+        round_trip: float,
+        bytes_out: int,
+        bytes_in: int,
+        error: bool = False,
+    ) -> None:
+        """Records one sent command
+
+        Args:
+            command (str): the command that was sent
+            write_time (float): seconds spent writing the command
+            first_byte_latency (float): seconds until the first reply byte, None if nothing was received
+            round_trip (float): seconds until the reply was complete (or the read timed out)
+            bytes_out (int): bytes written
+            bytes_in (int): bytes read for the reply, including the echo
+            error (bool): True if the reply was an error code
+        """
+        metrics = self._verb(command_verb(command))
+        metrics.commands += 1
+        metrics.errors += error
+        metrics.bytes_out += bytes_out
+        metrics.bytes_in += bytes_in
+        metrics.write_time.observe(write_time)
+        if first_byte_latency is not None:
+            metrics.first_byte_latency.observe(first_byte_latency)
+        metrics.round_trip.observe(round_trip)
+
+    def reset(self) -> None:
+        """Drops every recorded value"""
+        self.verbs = {}
+
+    def snapshot(self) -> dict:
+        """Returns {verb: metrics} as a JSON serializable dict"""
+        return {verb: metrics.snapshot() for verb, metrics in self.verbs.items()}
@@ -0,0 +1,181 @@
+"""Measures PlateCrane transfer, remove_lid and replace_lid routes against the simulated controller.
+
+For every route in ROUTES a fresh simulator and driver are started, then the route is run once and measured:
+    - commands: commands executed by the controller
+    - round trips: request/reply exchanges on the serial link (a pipelined batch counts once)
+    - cycle time, split into controller motion, remaining serial wait and Python overhead
+    - per-primitive (command verb) latency
+
+Command and round trip counts are compared against the baselines in cycle_time_baseline.json:
+tests/test_cycle_time.py fails if a route needs more of them than its baseline, and
+benchmarks/cycle_time.py reports the measurements and regenerates the baselines.
+"""
+
+import contextlib
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.serial_port import SerialPort
+
+BASELINE_PATH = Path(__file__).parent / "cycle_time_baseline.json"
+"""Stored command and round trip counts per route"""
+
+ROUTES = {
+    "transfer Stack1 -> Solo.Position2": (
+        "transfer",
+        {
+            "source": "Stack1",
+            "target": "Solo.Position2",
+            "plate_type": "flat_bottom_96well",
+        },
+    ),
+    "transfer Solo.Position2 -> Stack2": (
+        "transfer",
+        {
+            "source": "Solo.Position2",
+            "target": "Stack2",
+            "plate_type": "flat_bottom_96well",
+        },
+    ),
+    "transfer Stack3 -> Hidex.Nest": (
+        "transfer",
+        {
+            "source": "Stack3",
+            "target": "Hidex.Nest",
+            "plate_type": "flat_bottom_96well",
+            "has_lid": True,
+        },
+    ),
+    "transfer Hidex.Nest -> Peeler.Nest": (
+        "transfer",
+        {
+            "source": "Hidex.Nest",
+            "target": "Peeler.Nest",
+            "plate_type": "flat_bottom_96well",
+        },
+    ),
+    "remove_lid Solo.Position2 -> LidNest1": (
+        "remove_lid",
+        {
+            "source": "Solo.Position2",
+            "target": "LidNest1",
+            "plate_type": "flat_bottom_96well",
+        },
+    ),
+    "replace_lid LidNest1 -> Solo.Position2": (
+        "replace_lid",
+        {
+            "source": "LidNest1",
+            "target": "Solo.Position2",
+            "plate_type": "flat_bottom_96well",
+        },
+    ),
+}
+"""Representative routes: {name: (PlateCrane method, keyword arguments)}"""
+
+
+class SerialRecorder:
+    """Records the duration of every serial exchange by command verb"""
+
+    def __init__(self):
+        """Creates an empty recorder"""
+        self.latencies = defaultdict(list)
+        self.round_trips = 0
+        self.serial_time = 0.0
+        self._depth = 0
+
+    def record(self, verb, duration):
+        """Records one exchange"""
+        self.latencies[verb].append(duration)
+        self.round_trips += 1
+        self.serial_time += duration
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Wraps SerialPort so every exchange is recorded while the context is active.
+        Exchanges nested in another one (a pipelined batch falling back to send_command) are not counted again."""
+        recorder = self
+        send_command = SerialPort.send_command
+        send_pipelined = SerialPort.send_pipelined
+
+        def timed(function, verb_of):
+            def wrapper(port, *args, **kwargs):
+                recorder._depth += 1
+                start = time.perf_counter()
+                try:
+                    return function(port, *args, **kwargs)
+                finally:
+                    recorder._depth -= 1
+                    if recorder._depth == 0:
+                        recorder.record(
+                            verb_of(*args, **kwargs), time.perf_counter() - start
+                        )
+
+            return wrapper
+
+        SerialPort.send_command = timed(
+            send_command, lambda command, *_, **__: command.split()[0].upper()
+        )
+        SerialPort.send_pipelined = timed(send_pipelined, lambda *_, **__: "PIPELINED")
+        try:
+            yield self
+        finally:
+            SerialPort.send_command = send_command
+            SerialPort.send_pipelined = send_pipelined
+
+
+def run_route(name, time_scale=0.0, read_mode="framed", pipeline_window=1):
+    """Runs one route on a fresh simulator and driver and returns its measurements"""
+    method, kwargs = ROUTES[name]
+    simulator = PlateCraneSimulator(time_scale=time_scale)
+    try:
+        platecrane = PlateCrane(
+            simulator.port_path, read_mode=read_mode, pipeline_window=pipeline_window
+        )
+        commands_before = len(simulator.command_log)
+        busy_before = simulator.busy_time
+        with SerialRecorder().installed() as recorder:
+            start = time.perf_counter()
+            getattr(platecrane, method)(**kwargs)
+            cycle_time = time.perf_counter() - start
+        motion_time = simulator.busy_time - busy_before
+        return {
+            "commands": len(simulator.command_log) - commands_before,
+            "round_trips": recorder.round_trips,
+            "cycle_time": cycle_time,
+            "motion_time": motion_time,
+            "serial_wait": recorder.serial_time - motion_time,
+            "overhead": cycle_time - recorder.serial_time,
+            "latencies": dict(recorder.latencies),
+        }
+    finally:
+        simulator.close()
+
+
+def run_all(time_scale=0.0, read_mode="framed", pipeline_window=1):
+    """Runs every route and returns {name: measurements}"""
+    return {
+        name: run_route(name, time_scale, read_mode, pipeline_window) for name in ROUTES
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Returns the stored {name: {"commands": int, "round_trips": int}} baselines"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def regressions(results, baseline):
+    """Returns a message for every route that needs more commands or round trips than its baseline"""
+    messages = []
+    for name, result in results.items():
+        for key in ("commands", "round_trips"):
+            if name in baseline and result[key] > baseline[name][key]:
+                messages.append(
+                    f"{name}: {result[key]} {key}, baseline {baseline[name][key]}"
+                )
+    return messages
@@ -0,0 +1,128 @@
+"""Snapshot of the last known state of a PlateCrane or Sciclops, readable without touching the hardware.
+
+The drivers update their DeviceState from the command replies passing through them (GETPOS replies, OPEN,
+CLOSE, SPEED and STATUS replies, error codes, ...) and from their labware counters. Reading the state is a
+single attribute read: every update builds a new snapshot dict and swaps it in, so readers on other threads
+(e.g. REST status endpoints) neither lock nor see a half updated state.
+
+A StateRefresher can additionally refresh the state in the background, at a fixed interval and only while
+the device is idle:
+
+    refresher = StateRefresher(
+        lambda: executor.call(PlateCrane.refresh_state, priority=QUERY),
+        interval=5.0,
+        idle=lambda: not executor.busy(),
+    )
+    refresher.start()
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict
+
+FIELDS = {
+    "pose": None,
+    "gripper": None,
+    "speed": None,
+    "movement_state": "READY",
+    "status": None,
+    "last_error": None,
+    "labware": {},
+}
+"""Snapshot fields and their initial values:
+    - pose: last known joint values, None if unknown ([R, Z, P, Y] on the PlateCrane, [Z, R, Y, P] on the Sciclops)
+    - gripper: "open", "closed" or None if unknown
+    - speed: speed setting (unit: % of full speed), None if unknown
+    - movement_state: "READY", "BUSY" while a motion command runs, or "ERROR" after an error reply
+    - status: last reply to STATUS
+    - last_error: last error reply, with the command it answered
+    - labware: plate counts by location name
+"""
+
+
+class DeviceState:
+    """Last known state of a device, see FIELDS"""
+
+    def __init__(self, **values):
+        """Creates a new DeviceState, fields not given start at their FIELDS value"""
+        self._lock = threading.Lock()
+        self._snapshot: Dict[str, Any] = dict(FIELDS, **values, updated=None)
+
+    def update(self, **values) -> None:
+        """Sets fields of the state and the time of the update
+
+        Raises:
+            Exception: if a field is not one of FIELDS
+        """
+        unknown = set(values) - set(FIELDS)
+        if unknown:
+            raise Exception(f"Unknown device state fields: {sorted(unknown)}")
+        with self._lock:
+            self._snapshot = dict(self._snapshot, **values, updated=time.time())
+
+    def update_labware(self, **counts) -> None:
+        """Sets plate counts of locations, keeping the others"""
+        with self._lock:
+            labware = dict(self._snapshot["labware"], **counts)
+            self._snapshot = dict(self._snapshot, labware=labware, updated=time.time())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the current state, including the time of its last update ("updated", unix time).
+        The dict is shared with other readers and must not be modified."""
+        return self._snapshot
+
+    def __getitem__(self, field: str) -> Any:
+        """Returns one field of the current state"""
+        return self._snapshot[field]
+
+
+class StateRefresher:
+    """Background thread that refreshes a device state at a fixed interval while the device is idle"""
+
+    def __init__(
+        self,
+        refresh: Callable[[], Any],
+        interval: float,
+        idle: Callable[[], bool] = lambda: True,
+    ):
+        """Creates a new StateRefresher, call start() to start refreshing
+
+        Args:
+            refresh (callable): refreshes the state, e.g. runs the refresh_state method of the driver
+                through its HardwareExecutor
+            interval (float): seconds between refreshes
+            idle (callable): returns False while the device is busy, the refresh is skipped then
+        """
+        self.refresh = refresh
+        self.interval = interval
+        self.idle = idle
+        self.refreshes = 0
+        """Number of refreshes run so far"""
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts the refresher thread"""
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="state-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the refresher thread"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self) -> None:
+        """Refreshes the state every interval seconds until stopped"""
+        while not self._stopped.wait(self.interval):
+            if not self.idle():
+                continue
+            try:
+                self.refresh()
+                self.refreshes += 1
+            except Exception as err:
+                print(f"State refresh failed: {err}")
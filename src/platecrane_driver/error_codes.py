@@ -110,3 +110,74 @@ class ErrorResponse(Exception):
         if error_code not in messages:
             return ErrorResponse(f"Unknown error code: {error_code}")
         return ErrorResponse(messages[error_code])
+
+
+class PlateCraneError(Exception):
+    """
+    Error reported by the PlateCrane EX controller.
+    Corresponds to the bare error code replies 21, 14, 02, 1400, T1, ATS and TU.
+    """
+
+    @staticmethod
+    def from_response(response: str) -> PlateCraneError:
+        """Create a PlateCraneError from an error code reply."""
+        error_class = PLATECRANE_ERROR_CODES.get(response.strip())
+        if error_class is None:
+            return PlateCraneError(f"Unexpected response: '{response}'")
+        return error_class()
+
+
+class RAxisError(PlateCraneError):
+    """R (base rotation) axis error. Corresponds to the response 21."""
+
+    def __init__(self):
+        """Create a new RAxisError."""
+        super().__init__("R axis error")
+
+
+class ZAxisError(PlateCraneError):
+    """Z (vertical) axis error. Corresponds to the response 14."""
+
+    def __init__(self):
+        """Create a new ZAxisError."""
+        super().__init__("Z axis error")
+
+
+class InvalidLocationError(PlateCraneError):
+    """Unknown location name. Corresponds to the response 02."""
+
+    def __init__(self):
+        """Create a new InvalidLocationError."""
+        super().__init__("Invalid location, check that the point is loaded")
+
+
+class ZAxisCrashError(PlateCraneError):
+    """Z axis hit an obstacle, e.g. a plate. Corresponds to the response 1400."""
+
+    def __init__(self):
+        """Create a new ZAxisCrashError."""
+        super().__init__("Z axis crash")
+
+
+class SerialConnectionError(PlateCraneError):
+    """Serial connection issue, e.g. multiple access. Corresponds to the responses T1, ATS and TU."""
+
+    def __init__(self):
+        """Create a new SerialConnectionError."""
+        super().__init__("Serial connection issue")
+
+
+class MalformedReplyError(PlateCraneError):
+    """A reply did not have the expected format, e.g. because responses overlapped."""
+
+
+PLATECRANE_ERROR_CODES = {
+    "21": RAxisError,
+    "14": ZAxisError,
+    "02": InvalidLocationError,
+    "1400": ZAxisCrashError,
+    "T1": SerialConnectionError,
+    "ATS": SerialConnectionError,
+    "TU": SerialConnectionError,
+}
+"""Error code replies of the PlateCrane EX controller and their exceptions"""
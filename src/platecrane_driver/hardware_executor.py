@@ -0,0 +1,151 @@
+"""Runs every call to a device driver on one thread, in priority order.
+
+The PlateCrane serial port and the Sciclops USB link carry one command and its reply at a time. When two
+REST requests (or an action and a status poll) call the driver from different threads, their commands
+and replies interleave. A HardwareExecutor owns the driver instead: it creates the driver on its own
+thread, and no other thread calls it afterwards. Callers submit functions of the driver, e.g.
+
+    executor = HardwareExecutor(lambda: PlateCrane(host_path), name="platecrane")
+    executor.start()
+    executor.call(PlateCrane.transfer, "Stack1", "Solo.Position2", plate_type="flat_bottom_96well")
+
+Calls run in priority order (SAFETY, then ACTION, then QUERY) and in submission order within a priority.
+A running call is never interrupted, but a SAFETY call runs as soon as it ends, ahead of every queued
+action. Status polls should not call the driver at all: they read the DeviceState the driver keeps up to
+date from its replies (see device_state.py).
+"""
+
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+SAFETY = 0
+"""Priority of calls that bring the device into a safe state, e.g. move_safe"""
+
+ACTION = 1
+"""Priority of actions"""
+
+QUERY = 2
+"""Priority of status reads"""
+
+
+class HardwareExecutor:
+    """Owns a device driver and runs the calls submitted to it on a dedicated thread"""
+
+    def __init__(self, factory: Callable[[], Any], name: str = "device"):
+        """Creates a new HardwareExecutor, call start() before submitting calls
+
+        Args:
+            factory (callable): creates and returns the driver, called on the executor thread
+            name (str): device name, used for the thread name and in messages
+        """
+        self.factory = factory
+        self.name = name
+        self.driver = None
+        """The driver, only to be called through the executor"""
+        self.running: Optional[str] = None
+        """Name of the running call, None while idle"""
+        self.last_error: Optional[str] = None
+        """Exception of the last call that failed"""
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._thread = None
+
+    def start(self, timeout: float = None) -> Any:
+        """Starts the executor thread and waits until it created the driver
+
+        Returns:
+            The driver
+
+        Raises:
+            Exception: the exception of the factory, if it failed
+        """
+        started = Future()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(started,),
+            name=f"{self.name}-executor",
+            daemon=True,
+        )
+        self._thread.start()
+        return started.result(timeout=timeout)
+
+    def stop(self, timeout: float = None) -> None:
+        """Runs the calls queued so far and stops the executor thread"""
+        if self._thread is None:
+            return
+        self._queue.put((float("inf"), next(self._sequence), None))
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def submit(
+        self, function: Callable, *args, priority: int = ACTION, **kwargs
+    ) -> Future:
+        """Queues function(driver, *args, **kwargs) and returns a future that resolves to its result
+
+        Raises:
+            Exception: if the executor is not running
+        """
+        if self._thread is None or not self._thread.is_alive():
+            raise Exception(f"The {self.name} executor is not running")
+        future = Future()
+        self._queue.put(
+            (priority, next(self._sequence), (future, function, args, kwargs))
+        )
+        return future
+
+    def call(
+        self,
+        function: Callable,
+        *args,
+        priority: int = ACTION,
+        timeout: float = None,
+        **kwargs,
+    ) -> Any:
+        """Runs function(driver, *args, **kwargs) on the executor thread and returns its result.
+        Exceptions of the call are raised here."""
+        return self.submit(function, *args, priority=priority, **kwargs).result(
+            timeout=timeout
+        )
+
+    def busy(self) -> bool:
+        """True while a call is running or queued"""
+        return self.running is not None or not self._queue.empty()
+
+    def status(self) -> dict:
+        """Returns the running call, the number of queued calls and the last error, without waiting"""
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "last_error": self.last_error,
+        }
+
+    def _run(self, started: Future) -> None:
+        """Creates the driver and runs queued calls until stopped"""
+        try:
+            self.driver = self.factory()
+        except Exception as err:
+            started.set_exception(err)
+            return
+        started.set_result(self.driver)
+
+        while True:
+            _, _, item = self._queue.get()
+            if item is None:
+                return
+            future, function, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.running = getattr(function, "__name__", repr(function))
+            try:
+                result = function(self.driver, *args, **kwargs)
+            except Exception as err:
+                self.last_error = f"{self.running}: {err}"
+                print(f"{self.name} {self.last_error}")
+                future.set_exception(err)
+            else:
+                future.set_result(result)
+            finally:
+                self.running = None
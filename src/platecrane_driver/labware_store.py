@@ -0,0 +1,109 @@
+"""File-backed labware state for the Sciclops.
+
+The state lives in a JSON snapshot ({location: {key: value}}) plus an append-only journal of JSON
+lines next to it (<snapshot>.journal). Every update appends one line, so persisting a counter change
+costs the same no matter how much labware there is. After compact_every updates the journal is
+folded into a new snapshot, which is written to a temporary file and moved into place.
+
+On load the snapshot is read and the journal replayed on top of it, which recovers every update
+that reached the disk before a crash. A last line torn by a crash is cut off the journal before
+new entries are appended. Journal entries hold absolute values rather than increments,
+so replaying an entry that is already part of the snapshot is harmless.
+"""
+
+import copy
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Union
+
+
+class LabwareStore:
+    """Labware state persisted as a JSON snapshot plus an append-only journal"""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        defaults: Dict[str, Dict[str, Any]] = None,
+        compact_every: int = 100,
+    ):
+        """Loads the labware state, or starts from defaults if the snapshot does not exist yet
+
+        Args:
+            path (str): path of the JSON snapshot, the journal is stored next to it
+            defaults ({str: dict}): labware used when there is no snapshot, and for locations
+                missing from it
+            compact_every (int): number of journal entries after which the journal is compacted
+        """
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self.labware = copy.deepcopy(defaults or {})
+        if self.path.exists():
+            with open(self.path) as f:
+                for location, values in json.load(f).items():
+                    self.labware.setdefault(location, {}).update(values)
+        self.journal_entries = self._replay()
+        self._journal = open(self.journal_path, "a")
+
+    def _replay(self) -> int:
+        """Applies the journal to the loaded state and returns its number of entries.
+        An entry cut short by a crash is cut off the journal, so later entries are not appended to it."""
+        if not self.journal_path.exists():
+            return 0
+        entries = 0
+        good_bytes = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("missing line end")
+                    entry = json.loads(line)
+                except ValueError:
+                    # An update cut short by a crash, nothing after it reached the disk
+                    print(f"Ignoring incomplete labware journal entry: {line.strip()}")
+                    break
+                self.labware.setdefault(entry["location"], {}).update(entry["values"])
+                entries += 1
+                good_bytes += len(line)
+        if good_bytes < self.journal_path.stat().st_size:
+            os.truncate(self.journal_path, good_bytes)
+        return entries
+
+    def update(self, location: str, **values) -> None:
+        """Sets values of a location and appends them to the journal"""
+        with self._lock:
+            self.labware.setdefault(location, {}).update(values)
+            self._journal.write(
+                json.dumps({"location": location, "values": values}) + "\n"
+            )
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self.journal_entries += 1
+            if self.journal_entries >= self.compact_every:
+                self._compact()
+
+    def compact(self) -> None:
+        """Writes the current state to the snapshot and empties the journal"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Compacts the journal. Must hold the lock."""
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with open(temporary, "w") as f:
+            json.dump(self.labware, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self._journal.close()
+        self._journal = open(self.journal_path, "w")
+        self.journal_entries = 0
+
+    def close(self) -> None:
+        """Compacts the journal and closes it"""
+        with self._lock:
+            self._compact()
+            self._journal.close()
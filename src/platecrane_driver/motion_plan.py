@@ -0,0 +1,465 @@
+"""Compiles PlateCrane transfers into motion plans of absolute joint targets.
+
+A motion plan is a list of PlanStep primitives. Move targets are absolute [R, Z, P, Y] joint values,
+where an axis left as None keeps its commanded value from the previous step. The driver tracks the
+commanded pose locally (see PoseTracker), so it only has to query GETPOS at checkpoints instead of
+before every move. Move and jog steps may carry their own speed (e.g. slowing down inside a stack),
+otherwise they run at the default speed; SpeedManager sends SPEED only when the speed actually
+changes. Unless it runs in strict mode, it also merges consecutive moves that stay inside
+the safe envelope into multi-axis moves before executing a plan (see merge_safe_moves).
+"""
+
+from typing import List, Literal, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, ConfigDict
+
+from platecrane_driver.resource_registry import registry
+from platecrane_driver.resource_types import PlateResource
+from platecrane_driver.safe_envelope import SafeEnvelope
+from platecrane_driver.stack_tracker import (
+    APPROACH_CLEARANCE,
+    plate_top_steps,
+    stack_top_z,
+)
+
+STACK_SPEED = 50
+"""Speed of moves into and onto a stack (unit: % of full speed)"""
+
+JointTarget = Tuple[Optional[int], Optional[int], Optional[int], Optional[int]]
+"""[R, Z, P, Y] move target, None keeps the commanded value of that axis"""
+
+AXES = ("R", "Z", "P", "Y")
+"""Joint order used by the PlateCrane EX"""
+
+
+class PlanStep(BaseModel):
+    """A single primitive of a PlateCrane motion plan"""
+
+    model_config = ConfigDict(frozen=True)
+
+    action: Literal["move", "gripper_open", "gripper_close", "set_speed", "jog"]
+    """Primitive to execute"""
+    joints: Optional[JointTarget] = None
+    """Absolute joint target of a move step"""
+    axis: Optional[str] = None
+    """Axis of a jog step"""
+    value: Optional[int] = None
+    """Jog distance (unit: motor steps) or speed (unit: % of full speed)"""
+    speed: Optional[int] = None
+    """Speed of a move or jog step (unit: % of full speed), None runs it at the default speed"""
+    probe: bool = False
+    """True if the move is expected to stop early on contact (e.g. tapping the top of a stack).
+    The commanded pose is not trusted afterwards, so the next step starts from a checkpoint."""
+    verify: bool = False
+    """True if the move must reach its target, e.g. a descent to a predicted stack height.
+    If it stops short, the driver aborts the plan with a StackMismatchError."""
+    description: str = ""
+    """Human readable description of the step"""
+
+
+def move(
+    R=None,
+    Z=None,
+    P=None,
+    Y=None,
+    description="",
+    probe=False,
+    speed=None,
+    verify=False,
+) -> PlanStep:
+    """Creates a move step to the given absolute joint values"""
+    return PlanStep(
+        action="move",
+        joints=(R, Z, P, Y),
+        probe=probe,
+        speed=speed,
+        verify=verify,
+        description=description,
+    )
+
+
+def gripper_open() -> PlanStep:
+    """Creates a gripper open step"""
+    return PlanStep(action="gripper_open", description="open gripper")
+
+
+def gripper_close() -> PlanStep:
+    """Creates a gripper close step"""
+    return PlanStep(action="gripper_close", description="close gripper")
+
+
+def set_speed(speed: int) -> PlanStep:
+    """Creates a step that changes the default speed"""
+    return PlanStep(action="set_speed", value=speed, description=f"speed {speed}%")
+
+
+def jog(axis: str, distance: int, speed=None) -> PlanStep:
+    """Creates a relative single axis move step"""
+    return PlanStep(
+        action="jog",
+        axis=axis,
+        value=distance,
+        speed=speed,
+        description=f"jog {axis} {distance}",
+    )
+
+
+class PoseTracker:
+    """Tracks the commanded pose of the PlateCrane EX between GETPOS checkpoints"""
+
+    def __init__(self, verify_interval: int = 0):
+        """Creates a new PoseTracker
+
+        Args:
+            verify_interval (int): number of moves after which the pose is re-read from the
+                device even if it is known. 0 only re-reads after homing, faults and probing moves.
+        """
+        self.verify_interval = verify_interval
+        self.pose = None
+        self.moves_since_checkpoint = 0
+        self.on_change = None
+        """Optional callable, called with the pose (None if unknown) whenever it changes"""
+
+    def needs_checkpoint(self, joints: JointTarget = (None, None, None, None)) -> bool:
+        """True if the pose must be read from the device before moving to the given target"""
+        if self.pose is None:
+            return any(value is None for value in joints)
+        return bool(
+            self.verify_interval and self.moves_since_checkpoint >= self.verify_interval
+        )
+
+    def resolve(self, joints: JointTarget) -> List[int]:
+        """Turns a move target into absolute joint values using the commanded pose"""
+        return [
+            self.pose[index] if value is None else value
+            for index, value in enumerate(joints)
+        ]
+
+    def measured(self, pose: List[int]) -> None:
+        """Records a pose read from the device (a checkpoint)"""
+        self.pose = list(pose)
+        self.moves_since_checkpoint = 0
+        self._changed()
+
+    def commanded(self, pose: List[int]) -> None:
+        """Records a completed move to the given pose"""
+        self.pose = list(pose)
+        self.moves_since_checkpoint += 1
+        self._changed()
+
+    def jogged(self, axis: str, distance: int) -> None:
+        """Records a completed relative move"""
+        if self.pose is not None:
+            self.pose[AXES.index(axis.upper())] += distance
+            self.moves_since_checkpoint += 1
+            self._changed()
+
+    def invalidate(self) -> None:
+        """Forgets the pose, e.g. after homing, a fault or a probing move"""
+        self.pose = None
+        self._changed()
+
+    def _changed(self) -> None:
+        """Reports the pose to on_change"""
+        if self.on_change is not None:
+            self.on_change(None if self.pose is None else list(self.pose))
+
+
+class SpeedManager:
+    """Tracks the SPEED setting of the PlateCrane EX, so only actual changes are sent"""
+
+    def __init__(self, default_speed: int = 100):
+        """Creates a new SpeedManager
+
+        Args:
+            default_speed (int): speed of steps without their own speed (unit: % of full speed)
+        """
+        self.default_speed = default_speed
+        self.current = None
+        """Last speed the device acknowledged, None if unknown"""
+
+    def speed_for(self, step: PlanStep) -> int:
+        """Returns the speed a move or jog step runs at"""
+        return self.default_speed if step.speed is None else step.speed
+
+    def needs_change(self, speed: int) -> bool:
+        """True if SPEED has to be sent before running at the given speed"""
+        return speed != self.current
+
+    def acknowledged(self, speed: int) -> None:
+        """Records a speed change the device acknowledged"""
+        self.current = speed
+
+    def invalidate(self) -> None:
+        """Forgets the speed, e.g. after a failed SPEED command"""
+        self.current = None
+
+
+def merge_safe_moves(
+    plan: Sequence[PlanStep],
+    start: Optional[Sequence[int]],
+    envelope: Optional[SafeEnvelope] = None,
+) -> List[PlanStep]:
+    """Merges consecutive moves into multi-axis moves wherever the safe envelope allows it
+
+    A move is folded into the move before it if the arm stays inside the envelope all the way from
+    the pose before the earlier move to the target of the later one (see safe_envelope.py). Probing
+    and verified moves are never merged, and an axis a probe moved counts as unknown until a later move sets it.
+    Nothing is merged while an axis is unknown.
+
+    Args:
+        plan ([PlanStep]): motion plan to merge
+        start ([int]): [R, Z, P, Y] commanded pose the plan starts from, None if unknown
+        envelope (SafeEnvelope): envelope to check against, defaults to one built from the current
+            resource definitions
+
+    Returns:
+        The merged plan, with the same gripper, speed and jog steps in the same order
+    """
+    envelope = envelope or SafeEnvelope()
+    pose = list(start) if start is not None else [None] * len(AXES)
+    before = None
+    merged: List[PlanStep] = []
+    for step in plan:
+        if step.action == "move":
+            target = [
+                current if value is None else value
+                for current, value in zip(pose, step.joints)
+            ]
+            previous = merged[-1] if merged else None
+            if (
+                previous is not None
+                and previous.action == "move"
+                and not previous.probe
+                and not step.probe
+                and not previous.verify
+                and not step.verify
+                and previous.speed == step.speed
+                and envelope.contains(before, target)
+            ):
+                merged[-1] = move(
+                    *(
+                        earlier if later is None else later
+                        for earlier, later in zip(previous.joints, step.joints)
+                    ),
+                    speed=step.speed,
+                    description=f"{previous.description}; {step.description}",
+                )
+            else:
+                before = pose
+                merged.append(step)
+            if step.probe:
+                # A probe may stop anywhere along the axes it moves
+                target = [
+                    value if value == current else None
+                    for current, value in zip(pose, target)
+                ]
+            pose = target
+        else:
+            if step.action == "jog":
+                index = AXES.index(step.axis.upper())
+                if pose[index] is not None:
+                    pose = list(pose)
+                    pose[index] += step.value
+            merged.append(step)
+    return merged
+
+
+def plan_tower_neutral() -> List[PlanStep]:
+    """Moves the tower (Z axis) to the neutral height"""
+    return [
+        move(Z=registry.location("Safe").joint_angles[1], description="tower neutral")
+    ]
+
+
+def plan_arm_neutral() -> List[PlanStep]:
+    """Retracts the arm (Y axis) to the neutral extension"""
+    return [
+        move(Y=registry.location("Safe").joint_angles[3], description="arm neutral")
+    ]
+
+
+def plan_pick_plate_safe_approach(
+    source: str, grip_height_in_steps: int
+) -> List[PlanStep]:
+    """Compiles PlateCrane.pick_plate_safe_approach"""
+    R, Z, P, Y = registry.location(source).joint_angles
+    safe_approach_height = registry.location(source).safe_approach_height
+    return [
+        gripper_open(),
+        move(R=R, description=f"rotate base toward {source}"),
+        move(P=P, description="rotate gripper"),
+        move(Z=safe_approach_height, description="lower to safe approach height"),
+        move(Y=Y, description="extend arm over plate"),
+        move(Z=Z + grip_height_in_steps, description="lower to grip height"),
+        gripper_close(),
+        move(Z=safe_approach_height, description="raise to safe approach height"),
+        move(Y=registry.location("Safe").joint_angles[3], description="retract arm"),
+        *plan_tower_neutral(),
+        *plan_arm_neutral(),
+    ]
+
+
+def plan_place_plate_safe_approach(
+    target: str, grip_height_in_steps: int
+) -> List[PlanStep]:
+    """Compiles PlateCrane.place_plate_safe_approach"""
+    R, Z, P, Y = registry.location(target).joint_angles
+    safe_approach_height = registry.location(target).safe_approach_height
+    return [
+        move(R=R, description=f"rotate base toward {target}"),
+        move(P=P, description="rotate gripper"),
+        move(Z=safe_approach_height, description="lower to safe approach height"),
+        move(Y=Y, description="extend arm over target"),
+        move(Z=Z + grip_height_in_steps, description="lower to grip height"),
+        gripper_open(),
+        move(Z=safe_approach_height, description="raise to safe approach height"),
+        move(Y=registry.location("Safe").joint_angles[3], description="retract arm"),
+        *plan_tower_neutral(),
+        *plan_arm_neutral(),
+    ]
+
+
+def plan_pick_plate_direct(
+    source: str,
+    source_type: str,
+    plate_type: str,
+    grip_height_in_steps: int,
+    has_lid: bool,
+    incremental_lift: bool = False,
+    plates: Optional[int] = None,
+) -> List[PlanStep]:
+    """Compiles PlateCrane.pick_plate_direct
+
+    With the number of plates in a source stack, the arm descends at full speed to one plate above the
+    computed top of the stack before tapping it (see stack_tracker.py)
+    """
+    R, Z, P, Y = registry.location(source).joint_angles
+    steps = [move(R=R, description=f"rotate base toward {source}")]
+
+    if source_type == "stack":
+        plate_top_in_steps = plate_top_steps(plate_type, has_lid)
+        z_jog_down_from_plate_top = plate_top_in_steps - grip_height_in_steps
+        steps += [
+            gripper_close(),
+            move(R=R, P=P, Y=Y, description="move arm above stack"),
+        ]
+        if plates:
+            top_z = stack_top_z(source, plate_type, has_lid, plates)
+            steps.append(
+                move(
+                    Z=top_z + plate_top_in_steps + APPROACH_CLEARANCE,
+                    verify=True,
+                    description=f"descend to one plate above {plates} plates",
+                )
+            )
+        steps += [
+            move(
+                R=R,
+                Z=Z,
+                P=P,
+                Y=Y,
+                probe=True,
+                speed=STACK_SPEED,
+                description="tap top of stack",
+            ),
+            jog("Z", 1000),
+            gripper_open(),
+            jog("Z", -(1000 + z_jog_down_from_plate_top)),
+        ]
+    else:  # if source_type == nest:
+        steps += [
+            gripper_open(),
+            move(R=R, Z=Z + grip_height_in_steps, P=P, Y=Y, description="grip height"),
+        ]
+
+    steps.append(gripper_close())
+    if incremental_lift:
+        steps += [jog("Z", 100) for _ in range(5)]
+    return steps + plan_tower_neutral() + plan_arm_neutral()
+
+
+def plan_place_plate_direct(
+    target: str, target_type: str, grip_height_in_steps: int
+) -> List[PlanStep]:
+    """Compiles PlateCrane.place_plate_direct"""
+    R, Z, P, Y = registry.location(target).joint_angles
+    steps = [
+        move(R=R, description=f"rotate base toward {target}"),
+        move(P=P, Y=Y, description="extend arm over target"),
+    ]
+    steps.append(
+        move(
+            Z=Z + grip_height_in_steps,
+            speed=STACK_SPEED if target_type == "stack" else None,
+            description="lower to grip height",
+        )
+    )
+    steps.append(gripper_open())
+    return steps + plan_tower_neutral() + plan_arm_neutral() + plan_tower_neutral()
+
+
+def plan_transfer(
+    source: str,
+    target: str,
+    plate_type: str,
+    height_offset: int = 0,
+    is_lid: bool = False,
+    has_lid: bool = False,
+    source_grip_height_in_steps: int = None,
+    target_grip_height_in_steps: int = None,
+    incremental_lift: bool = False,
+    source_plates: int = None,
+) -> List[PlanStep]:
+    """Compiles PlateCrane.transfer into a motion plan. See PlateCrane.transfer for the arguments,
+    source_plates is the number of plates in a source stack if known (see plan_pick_plate_direct)"""
+    source_type = registry.location(source).location_type
+    target_type = registry.location(target).location_type
+
+    if not is_lid:
+        plate = registry.plate(plate_type)
+        grip_height_in_steps = (
+            PlateResource.convert_to_steps(plate.grip_height + height_offset)
+            if height_offset
+            else plate.grip_height_steps
+        )
+        source_grip_height_in_steps = grip_height_in_steps
+        target_grip_height_in_steps = grip_height_in_steps
+
+    # PICK PLATE FROM SOURCE LOCATION
+    if source_type == "stack" or (
+        source_type == "nest" and not registry.location(source).safe_approach_height
+    ):
+        steps = plan_pick_plate_direct(
+            source=source,
+            source_type=source_type,
+            plate_type=plate_type,
+            grip_height_in_steps=source_grip_height_in_steps,
+            has_lid=has_lid,
+            incremental_lift=incremental_lift,
+            plates=source_plates,
+        )
+    elif source_type == "nest":
+        steps = plan_pick_plate_safe_approach(
+            source=source, grip_height_in_steps=source_grip_height_in_steps
+        )
+    else:
+        raise Exception("Source location type not defined correctly")
+
+    # PLACE PLATE AT TARGET LOCATION
+    if target_type == "stack" or (
+        target_type == "nest" and not registry.location(target).safe_approach_height
+    ):
+        steps += plan_place_plate_direct(
+            target=target,
+            target_type=target_type,
+            grip_height_in_steps=target_grip_height_in_steps,
+        )
+    elif target_type == "nest":
+        steps += plan_place_plate_safe_approach(
+            target=target, grip_height_in_steps=target_grip_height_in_steps
+        )
+    else:
+        raise Exception("Target location type not defined correctly")
+
+    return steps
@@ -1,13 +1,39 @@
 """Handle Proper Interfacing with the PlateCrane"""
 
-import re
 import time
-
-from platecrane_driver.resource_defs import locations, plate_definitions
+from collections import deque
+from typing import List, Optional, Sequence, Union
+
+from platecrane_driver import motion_plan
+from platecrane_driver.batch_transfer import (
+    TransferRequest,
+    base_travel,
+    order_transfers,
+)
+from platecrane_driver.command_metrics import CommandMetrics, command_verb
+from platecrane_driver.device_state import DeviceState
+from platecrane_driver.error_codes import PlateCraneError, ZAxisCrashError
+from platecrane_driver.motion_plan import PlanStep, PoseTracker, SpeedManager
+from platecrane_driver.resource_registry import registry
 from platecrane_driver.resource_types import PlateResource
+from platecrane_driver.response_parser import (
+    is_error,
+    parse_point_list,
+    parse_position,
+    parse_status,
+)
+from platecrane_driver.route_cache import RouteCache
 from platecrane_driver.serial_port import (
     SerialPort,  # use when running through WEI REST clients
 )
+from platecrane_driver.stack_tracker import (
+    PickRecord,
+    StackMismatchError,
+    StackTracker,
+    stack_top_z,
+)
+from platecrane_driver.travel_time import MoveRecord, TravelTimeModel
+from platecrane_driver.waypoints import WaypointManager, derived_poses
 
 # from serial_port import SerialPort      # use when running through the driver
 # from resource_defs import locations, plate_definitions
@@ -26,41 +52,159 @@ from platecrane_driver.serial_port import (
 """
 
 
+PIPELINED_ACTIONS = ("gripper_open", "gripper_close", "jog")
+"""Plan step actions that can be sent back-to-back without waiting for each reply"""
+
+MOTION_VERBS = frozenset(
+    ["MOVE", "MOVE_R", "MOVE_Z", "MOVE_P", "MOVE_Y", "JOG", "HOME"]
+)
+"""Commands that move the arm, the device state is BUSY while one of them runs"""
+
+
 class PlateCrane:
     """Python interface that allows remote commands to be executed to the plate_crane."""
 
     __serial_port: SerialPort
 
-    def __init__(self, host_path="/dev/ttyUSB4", baud_rate=9600):
+    def __init__(
+        self,
+        host_path="/dev/ttyUSB4",
+        baud_rate=9600,
+        read_mode="legacy",
+        verify_interval=0,
+        use_waypoints=True,
+        routes=(),
+        pipeline_window=1,
+        metrics=False,
+        travel_model=None,
+        move_history=1000,
+        strict_motion=False,
+        stack_counts=None,
+        predict_stack_picks=True,
+    ):
         """Initialization function
 
         Args:
             host_path (str): usb path of PlateCrane EX device
             baud_rate (int): baud rate to use for communication with the PlateCrane EX device
+            read_mode (str): serial reply read mode, either "legacy" or "framed" (see SerialPort)
+            verify_interval (int): number of moves after which the tracked pose is re-read with GETPOS.
+                0 (default) only re-reads after homing, faults and probing moves.
+            use_waypoints (bool): keep the resource_defs locations and their derived poses in device memory
+                and move to them by name (see waypoints.py). Otherwise every move loads and deletes a TEMP point.
+            routes ([dict]): transfer routes, given as transfer keyword arguments, to compile at startup.
+                Every route is compiled once and cached until resource_defs changes (see route_cache.py).
+            pipeline_window (int): number of non-motion commands (OPEN, CLOSE, JOG, LOADPOINT) that may be
+                in flight at once in "framed" read mode. 1 (default) sends one command at a time.
+            metrics (bool): record per-command timings by command verb (see command_metrics.py)
+            travel_model (TravelTimeModel): model used by estimate_transfer_time, defaults to
+                TravelTimeModel.from_travel_times() (see travel_time.py)
+            move_history (int): number of recent moves kept for calibrate_travel_time
+            strict_motion (bool): move one axis at a time exactly as planned. Otherwise consecutive moves
+                that stay inside the safe envelope are merged into multi-axis moves (see safe_envelope.py).
+            stack_counts ({str: int}): known plate counts by stack location name, the others are learned
+                from the first probing pick (see stack_tracker.py)
+            predict_stack_picks (bool): pick from stacks with a known plate count by descending at full speed
+                to one plate above the computed top before tapping it. Otherwise every stack pick taps the top
+                of the stack all the way from the neutral height.
 
         Returns:
             None
         """
 
         # define variables
-        self.__serial_port = SerialPort(host_path=host_path, baud_rate=baud_rate)
+        self.__serial_port = SerialPort(
+            host_path=host_path,
+            baud_rate=baud_rate,
+            read_mode=read_mode,
+            pipeline_window=pipeline_window,
+            metrics=metrics,
+        )
         self.robot_error = "NO ERROR"
         self.status = 0
         self.error = ""
 
         self.robot_status = ""
         self.movement_state = "READY"
-        self.platecrane_current_position = None
+        self.pose_tracker = PoseTracker(verify_interval=verify_interval)
+        self.waypoints = WaypointManager() if use_waypoints else None
+        self.route_cache = RouteCache(routes)
+        self.strict_motion = strict_motion
+        self.speed_manager = SpeedManager()
+        self.travel_model = travel_model or TravelTimeModel.from_travel_times()
+        self.recorded_moves = deque(maxlen=move_history)
+        """Recent MoveRecords of moves from a known pose"""
+        self.stack_tracker = StackTracker(stack_counts)
+        self.predict_stack_picks = predict_stack_picks
+        self.stack_picks = deque(maxlen=move_history)
+        """Recent PickRecords of picks from stacks"""
+        self.last_probe_pose = None
+        """Pose read right after the last probing move, e.g. the top of a stack"""
+        self.probing = False
+        """True while a probing move runs, the Z axis contact it stops on is not kept as an error"""
+        self.state = DeviceState(labware=dict(self.stack_tracker.counts))
+        """Last known state, updated from the command replies (see device_state.py)"""
+        self.pose_tracker.on_change = lambda pose: self.state.update(pose=pose)
+        self.stack_tracker.on_change = lambda stack, count: self.state.update_labware(
+            **{stack: count}
+        )
+        self.__serial_port.on_send = self._observe_command
+        self.__serial_port.on_reply = self._observe_reply
 
         # initialize actions
         self.initialize()
 
+    @property
+    def metrics(self) -> Optional[CommandMetrics]:
+        """Per-command metrics of the serial link, None if metrics are disabled"""
+        return self.__serial_port.metrics
+
+    @property
+    def speed(self) -> int:
+        """Speed the arm currently moves at (unit: % of full speed), the default speed if unknown"""
+        current = self.speed_manager.current
+        return self.speed_manager.default_speed if current is None else current
+
+    @property
+    def platecrane_current_position(self) -> list:
+        """Last known [R, Z, P, Y] joint values, or None if unknown"""
+        return self.pose_tracker.pose
+
     def initialize(self):
         """Initialization actions"""
         self.get_status()
         if self.robot_status == "0":
             self.home()
-        self.platecrane_current_position = self.get_position()
+        self.get_position()
+        self.apply_speed(self.speed_manager.default_speed)
+        if self.waypoints is not None:
+            self.sync_waypoints()
+
+    def sync_waypoints(self):
+        """Loads the resource_defs locations and their derived poses into device memory.
+
+        They are stored under the waypoint prefix (W_Safe for Safe, see WaypointManager), so points taught on
+        the controller are left alone. Points already stored with the same joint values (checked with
+        LISTPOINTS) are not rewritten.
+        """
+        device_points = parse_point_list(
+            self.__serial_port.send_command("LISTPOINTS\r\n")
+        )
+        to_load = self.waypoints.sync_plan(
+            derived_poses(registry.locations), device_points
+        )
+        responses = self.__serial_port.send_pipelined(
+            [
+                "LOADPOINT %s, %s, %s, %s, %s\r\n" % (name, R, Z, P, Y)
+                for name, (R, Z, P, Y) in to_load.items()
+            ]
+        )
+        for (name, pose), response in zip(to_load.items(), responses):
+            if not self._is_fault(response):
+                self.waypoints.loaded(name, pose)
+        print(
+            f"WAYPOINTS SYNCED: {len(self.waypoints.waypoints)} total, {len(to_load)} loaded"
+        )
 
     def home(self):
         """Homes all of the axes. Returns to neutral position (above exchange)
@@ -75,12 +219,51 @@ class PlateCrane:
         # Moves axes to home position
         command = "HOME\r\n"
         self.__serial_port.send_command(command, timeout=60)
+        self.pose_tracker.invalidate()
 
     def get_status(self):
         """Checks status of plate_crane"""
         command = "STATUS\r\n"
         self.robot_status = self.__serial_port.send_command(command)
 
+    def refresh_state(self) -> dict:
+        """Reads the status and the position of the arm, updating the device state
+
+        Returns:
+            The snapshot of the device state (see device_state.py)
+        """
+        self.get_status()
+        try:
+            self.get_position()
+        except PlateCraneError as err:
+            print(f"POSITION NOT REFRESHED: {err}")
+        return self.state.snapshot()
+
+    def _observe_command(self, command: str) -> None:
+        """Marks the device state BUSY while a motion command runs"""
+        if command_verb(command) in MOTION_VERBS:
+            self.state.update(movement_state="BUSY")
+
+    def _observe_reply(self, command: str, response: str) -> None:
+        """Updates the device state from the reply to a command"""
+        verb = command_verb(command)
+        if self._is_fault(response):
+            error = PlateCraneError.from_response(response.strip().splitlines()[-1])
+            if self.probing and isinstance(error, ZAxisCrashError):
+                self.state.update(movement_state="READY")
+            else:
+                self.state.update(
+                    movement_state="ERROR", last_error=f"{command}: {error}"
+                )
+        elif verb in MOTION_VERBS:
+            self.state.update(movement_state="READY")
+        elif verb in ("OPEN", "CLOSE"):
+            self.state.update(gripper="open" if verb == "OPEN" else "closed")
+        elif verb == "SPEED" and response:
+            self.state.update(speed=int(command.split()[1]))
+        elif verb == "STATUS":
+            self.state.update(status=response.strip())
+
     def free_joints(self):
         """Unlocks the joints of the plate_crane"""
         command = "limp TRUE\r\n"
@@ -94,16 +277,37 @@ class PlateCrane:
     def set_speed(self, speed: int):
         """Sets the speed of the plate crane arm.
 
+        The speed becomes the default speed of every following move and jog without a speed of
+        its own (see SpeedManager). Nothing is sent if the arm already moves at that speed.
+
         Args:
             speed (int): (units = % of full speed) Speed at which to move the PlateCrane EX. Appies to all axes
 
         Returns:
             None
         """
-        command = "SPEED " + str(speed)
-        self.__serial_port.send_command(command, timeout=0, delay=1)
-        self.get_position()
-        print(f"SPEED SET TO {speed}%")
+        self.speed_manager.default_speed = speed
+        self.apply_speed(speed)
+
+    def apply_speed(self, speed: int) -> None:
+        """Sends SPEED if the arm does not already move at the given speed and waits for the reply.
+
+        Args:
+            speed (int): (units = % of full speed) Speed at which to move the PlateCrane EX
+
+        Returns:
+            None
+        """
+        if not self.speed_manager.needs_change(speed):
+            return
+        command = "SPEED %d\r\n" % speed
+        response = self.__serial_port.send_command(command)
+        if self._is_fault(response) or not response:
+            self.speed_manager.invalidate()
+            print(f"SPEED {speed}% NOT ACKNOWLEDGED: {response}")
+        else:
+            self.speed_manager.acknowledged(speed)
+            print(f"SPEED SET TO {speed}%")
 
     def get_location_list(self):
         """Displays all location information stored in the Plate Crane EX robot's memory"""
@@ -112,15 +316,11 @@ class PlateCrane:
         out_msg = self.__serial_port.send_command(command)
 
         try:
-            # Checks if specified format is found in feedback
-            exp = r"0000 (.*\w)"  # Format of feedback that indicates that the rest of the line is the status
-            find_status = re.search(exp, out_msg)
-            self.status = find_status[1]
-
+            self.status = parse_status(out_msg).message
             print(self.status)
 
-        except Exception as err:
-            print("Error in get_status")
+        except PlateCraneError as err:
+            print("Error in get_location_list")
             self.robot_error = err
 
     def get_location_joint_values(self, location: str = None) -> list:
@@ -141,14 +341,15 @@ class PlateCrane:
                 - Z (arm vertical axis)
                 - P (gripper rotation)
                 - Y (arm extension)
+
+        Raises:
+            InvalidLocationError: the location is not stored in device memory
+            MalformedReplyError: the reply did not contain joint values
         """
 
         command = "GETPOINT " + location + "\r\n"
 
-        joint_values = list(self.__serial_port.send_command(command).split(" "))
-        joint_values = [eval(x.strip(",")) for x in joint_values]
-
-        return joint_values
+        return list(parse_position(self.__serial_port.send_command(command)))
 
     def get_position(self) -> list:
         """Returns list of joint values for current position of the PlateCrane EX arm
@@ -162,22 +363,23 @@ class PlateCrane:
                 - Z (arm vertical axis)
                 - P (gripper rotation)
                 - Y (arm extension)
+
+        Raises:
+            PlateCraneError: the controller replied with an error code
+            MalformedReplyError: the reply did not contain joint values
         """
 
         command = "GETPOS\r\n"
 
         try:
-            # collect coordinates of current position
-            current_position = list(self.__serial_port.send_command(command).split(" "))
-            print(current_position)
-            current_position = [eval(x.strip(",")) for x in current_position]
-            print(current_position)
-        except Exception:
-            # Fall back: overlapping serial responses were detected. Wait 5 seconds then resend latest command
-            time.sleep(5)
-            current_position = list(self.__serial_port.send_command(command).split(" "))
-            current_position = [eval(x.strip(",")) for x in current_position]
+            current_position = list(
+                parse_position(self.__serial_port.send_command(command))
+            )
+        except PlateCraneError:
+            self.pose_tracker.invalidate()
+            raise
 
+        self.pose_tracker.measured(current_position)
         return current_position
 
     def set_location(
@@ -209,6 +411,8 @@ class PlateCrane:
             str(Y),
         )
         self.__serial_port.send_command(command)
+        if self.waypoints is not None:
+            self.waypoints.loaded(location_name, [R, Z, P, Y])
 
     def delete_location(self, location_name: str = None):
         """Deletes an existing location from the PlateCrane EX device memory
@@ -224,6 +428,8 @@ class PlateCrane:
 
         command = "DELETEPOINT %s\r\n" % (location_name)
         self.__serial_port.send_command(command)
+        if self.waypoints is not None:
+            self.waypoints.deleted(location_name)
 
     def gripper_open(self):
         """Opens gripper"""
@@ -261,11 +467,19 @@ class PlateCrane:
         """
 
         command = "JOG %s,%d\r\n" % (axis, distance)
-        self.__serial_port.send_command(command)
+        response = self.__serial_port.send_command(command)
+        if self._is_fault(response):
+            self.pose_tracker.invalidate()
+        else:
+            self.pose_tracker.jogged(axis, distance)
 
     def move_joint_angles(self, R: int, Z: int, P: int, Y: int) -> None:
         """Move to a specified location
 
+        With waypoints enabled, a synced waypoint is moved to by name (one transaction) and
+        any other pose is loaded into a reusable ring slot first. Otherwise a TEMP point is
+        loaded, moved to and deleted again.
+
         Args:
             R (int): base rotation (unit = motor steps)
             Z (int): vertical axis (unit = motor steps)
@@ -273,20 +487,146 @@ class PlateCrane:
             Y (int): arm extension (unit = motor steps)
         """
 
-        self.set_location("TEMP", R, Z, P, Y)
-        command = "MOVE TEMP\r\n"
+        if self.waypoints is None:
+            point = "TEMP"
+            self.set_location(point, R, Z, P, Y)
+        else:
+            point = self.waypoints.name_for([R, Z, P, Y])
+            if point is None:
+                point, needs_load = self.waypoints.slot_for([R, Z, P, Y])
+                if needs_load:
+                    self.set_location(point, R, Z, P, Y)
+        command = "MOVE %s\r\n" % point
+        start_pose = self.pose_tracker.pose
 
         try:
-            self.__serial_port.send_command(command, timeout=60)
+            start = time.perf_counter()
+            response = self.__serial_port.send_command(command, timeout=60)
+            seconds = time.perf_counter() - start
 
         except Exception as err:
             print(err)
             self.robot_error = err
+            self.pose_tracker.invalidate()
         else:
             self.move_status = "COMPLETED"
-            pass
+            if self._is_fault(response):
+                self.pose_tracker.invalidate()
+            else:
+                self.pose_tracker.commanded([R, Z, P, Y])
+                if start_pose is not None:
+                    self.recorded_moves.append(
+                        MoveRecord(tuple(start_pose), (R, Z, P, Y), self.speed, seconds)
+                    )
+
+        if self.waypoints is None:
+            self.delete_location(point)
+
+    @staticmethod
+    def _is_fault(response: str) -> bool:
+        """Checks if a reply is one of the controller's error codes"""
+        return is_error(response)
 
-        self.delete_location("TEMP")
+    def execute_plan(self, plan: List[PlanStep]) -> None:
+        """Executes a motion plan (see motion_plan.py)
+
+        The commanded pose is tracked locally, so GETPOS is only sent at checkpoints:
+        when the pose is unknown (after homing or a fault), right after a probing move (kept in
+        last_probe_pose) or when the configured verify_interval has elapsed. Moves to the pose the arm
+        already holds are skipped. Unless strict_motion is set, moves are merged within the safe envelope
+        first (see merge_safe_moves).
+
+        Args:
+            plan ([PlanStep]): steps to execute, in order
+
+        Raises:
+            StackMismatchError: a verified move stopped short of its target
+
+        Returns:
+            None
+        """
+        tracker = self.pose_tracker
+        if not self.strict_motion:
+            if tracker.pose is None:
+                self.get_position()
+            plan = motion_plan.merge_safe_moves(plan, tracker.pose)
+        run = []
+        for step in plan:
+            if step.action in PIPELINED_ACTIONS:
+                run.append(step)
+                continue
+            self._execute_run(run)
+            run = []
+            if step.action == "move":
+                if tracker.needs_checkpoint(step.joints):
+                    self.get_position()
+                target = tracker.resolve(step.joints)
+                if target == tracker.pose and not step.probe:
+                    continue
+                self.apply_speed(self.speed_manager.speed_for(step))
+                self.probing = step.probe
+                try:
+                    self.move_joint_angles(*target)
+                finally:
+                    self.probing = False
+                if step.probe:
+                    tracker.invalidate()
+                    self.last_probe_pose = self.get_position()
+                elif step.verify and tracker.pose is None:
+                    if self.get_position() != target:
+                        raise StackMismatchError(
+                            f"Stopped at {tracker.pose} instead of {target}: {step.description}"
+                        )
+            elif step.action == "gripper_open":
+                self.gripper_open()
+            elif step.action == "gripper_close":
+                self.gripper_close()
+            elif step.action == "set_speed":
+                self.set_speed(step.value)
+        self._execute_run(run)
+
+    def _execute_run(self, run: List[PlanStep]) -> None:
+        """Executes consecutive gripper and jog steps, pipelined if a pipeline window is configured.
+
+        Every reply is checked against its own command, so a faulted jog still invalidates the tracked pose.
+        Jogs that need another speed are sent one at a time, after the SPEED change.
+        """
+        jog_speeds = {
+            self.speed_manager.speed_for(step) for step in run if step.action == "jog"
+        }
+        if (
+            len(run) < 2
+            or self.__serial_port.pipeline_window == 1
+            or len(jog_speeds) > 1
+        ):
+            for step in run:
+                if step.action == "gripper_open":
+                    self.gripper_open()
+                elif step.action == "gripper_close":
+                    self.gripper_close()
+                elif step.action == "jog":
+                    self.apply_speed(self.speed_manager.speed_for(step))
+                    self.jog(step.axis, step.value)
+            return
+        for speed in jog_speeds:
+            self.apply_speed(speed)
+
+        commands = []
+        for step in run:
+            if step.action == "jog":
+                commands.append("JOG %s,%d\r\n" % (step.axis, step.value))
+            else:
+                commands.append(
+                    "OPEN\r\n" if step.action == "gripper_open" else "CLOSE\r\n"
+                )
+        responses = self.__serial_port.send_pipelined(commands)
+        for step, response in zip(run, responses):
+            if step.action != "jog":
+                continue
+            if self._is_fault(response):
+                self.pose_tracker.invalidate()
+            else:
+                self.pose_tracker.jogged(step.axis, step.value)
 
     def move_single_axis(self, axis: str, loc: str) -> None:
         """Moves on a single axis, using an existing location in PlateCrane EX device memory as reference
@@ -314,6 +654,8 @@ class PlateCrane:
         command = "MOVE_" + axis.upper() + " " + loc + "\r\n"
         self.__serial_port.send_command(command)
         self.move_status = "COMPLETED"
+        # device memory locations are not tracked locally
+        self.pose_tracker.invalidate()
 
     def move_location(self, loc: str = None) -> None:
         """Moves all joint to the given location.
@@ -334,6 +676,8 @@ class PlateCrane:
 
         cmd = "MOVE " + loc + "\r\n"
         self.__serial_port.send_command(cmd)
+        # device memory locations are not tracked locally
+        self.pose_tracker.invalidate()
 
     def move_tower_neutral(self) -> None:
         """Moves the tower to neutral position
@@ -343,24 +687,12 @@ class PlateCrane:
                 Change this, and other related methods below, to use only access
                 locations in resource_defs
         """
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations["Safe"].joint_angles[1],
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
+        self.execute_plan(motion_plan.plan_tower_neutral())
 
     def move_arm_neutral(self) -> None:
         """Moves the arm to neutral position"""
 
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=locations["Safe"].joint_angles[3],
-        )
+        self.execute_plan(motion_plan.plan_arm_neutral())
 
     def move_gripper_neutral(self) -> None:
         """Moves the gripper to neutral position"""
@@ -371,7 +703,7 @@ class PlateCrane:
         self.move_joint_angles(
             R=current_pos[0],
             Z=current_pos[1],
-            P=locations,
+            P=registry.location("Safe").joint_angles[2],
             Y=current_pos[3],
         )
 
@@ -398,79 +730,12 @@ class PlateCrane:
         """
         print("PICK PLATE SAFE APPROACH CALLED")
 
-        # open the gripper
-        self.gripper_open()
-
-        # Rotate base (R axis) toward plate location
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=locations[source].joint_angles[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # Rotate gripper
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=locations[source].joint_angles[2],
-            Y=current_pos[3],
-        )
-
-        # Lower z axis to safe_approach_z height
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations[source].safe_approach_height,
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # extend arm over plate and rotate gripper to correct orientation
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=locations[source].joint_angles[3],
-        )
-
-        # Lower arm (z axis) to correct plate grip height
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations[source].joint_angles[1] + grip_height_in_steps,
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # grip the plate
-        self.gripper_close()
-
-        # Move arm with plate back to safe approach height
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations[source].safe_approach_height,
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # retract arm (Y axis) as much as possible (to same Y axis value as Safe location)
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=locations["Safe"].joint_angles[3],
+        self.execute_plan(
+            motion_plan.plan_pick_plate_safe_approach(
+                source=source, grip_height_in_steps=grip_height_in_steps
+            )
         )
 
-        # move rest of joints to neutral location
-        self.move_tower_neutral()
-        self.move_arm_neutral()
-
     def place_plate_safe_approach(
         self,
         target: str,
@@ -486,76 +751,12 @@ class PlateCrane:
         Returns:
             None
         """
-
-        # Rotate base (R axis) toward target location
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=locations[target].joint_angles[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # Rotate gripper to correct orientation
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=locations[target].joint_angles[2],
-            Y=current_pos[3],
-        )
-
-        # Lower z axis to safe_approach_z height
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations[target].safe_approach_height,
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # extend arm over plate
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=locations[target].joint_angles[3],
-        )
-
-        # lower arm (z axis) to correct plate grip height
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations[target].joint_angles[1] + grip_height_in_steps,
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        self.gripper_open()
-
-        # Back away using safe approach path
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations[target].safe_approach_height,
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # retract arm (Y axis) as much as possible (to same Y axis value as Safe location)
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=locations["Safe"].joint_angles[3],
+        self.execute_plan(
+            motion_plan.plan_place_plate_safe_approach(
+                target=target, grip_height_in_steps=grip_height_in_steps
+            )
         )
 
-        # move arm to safe location
-        self.move_tower_neutral()
-        self.move_arm_neutral()
-
     def pick_plate_direct(
         self,
         source: str,
@@ -564,11 +765,14 @@ class PlateCrane:
         grip_height_in_steps: int,
         has_lid: bool,
         incremental_lift: bool = False,
+        plates: int = None,
     ) -> None:
         """Picks a plate from a source location of type either "nest" or "stack" using a direct travel path
 
         "nest" transfers: gripper open, direct to grab plate z height
         "stack" transfers: gripper closed, touch top of plate, z up, z down to correct grab plate height
+        "stack" transfers with a known plate count: gripper open, full speed to one plate above the
+            computed top of the stack, slowly down to the grab plate height
 
         Args:
             source (str): source location name defined in resource_defs.py
@@ -581,94 +785,22 @@ class PlateCrane:
                     - grab plate at grip_height_in_steps
                     - raise 100 steps along z axis (repeat 5x)
                     - continue with rest of transfer
+            plates (int): number of plates in a source stack, None to find its top by tapping it
 
         Returns:
             None
         """
-
-        # Rotate R axis (base rotation) over the plate
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=locations[source].joint_angles[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        if source_type == "stack":
-            # close the gripper
-            self.gripper_close()
-
-            # move the arm directly above the stack
-            self.move_joint_angles(
-                R=locations[source].joint_angles[0],
-                Z=current_pos[1],
-                P=locations[source].joint_angles[2],
-                Y=locations[source].joint_angles[3],
-            )
-
-            # decrease the plate crane speed
-            self.set_speed(50)
-
-            # move down in z height to tap the top of the plates in stack
-            self.move_joint_angles(
-                R=locations[source].joint_angles[0],
-                Z=locations[source].joint_angles[
-                    1
-                ],  # this is the only axis that should need to move
-                P=locations[source].joint_angles[2],
-                Y=locations[source].joint_angles[3],
-            )
-
-            # set plate crane back to full speed
-            self.set_speed(100)
-
-            # Move up, open gripper, grab plate at correct height
-            self.jog("Z", 1000)
-            self.gripper_open()
-
-            # Calculate z travel from grip height with/without lid
-            if has_lid:
-                z_jog_down_from_plate_top = (
-                    PlateResource.convert_to_steps(
-                        plate_definitions[plate_type].plate_height_with_lid
-                    )
-                    - grip_height_in_steps
-                )
-            else:
-                z_jog_down_from_plate_top = (
-                    PlateResource.convert_to_steps(
-                        plate_definitions[plate_type].plate_height
-                    )
-                    - grip_height_in_steps
-                )
-
-            # Move down to correct z height to grip plate
-            self.jog("Z", -(1000 + z_jog_down_from_plate_top))
-
-        else:  # if source_type == nest:
-            self.gripper_open()
-
-            self.move_joint_angles(
-                R=locations[source].joint_angles[0],
-                Z=locations[source].joint_angles[1] + grip_height_in_steps,
-                P=locations[source].joint_angles[2],
-                Y=locations[source].joint_angles[3],
+        self.execute_plan(
+            motion_plan.plan_pick_plate_direct(
+                source=source,
+                source_type=source_type,
+                plate_type=plate_type,
+                grip_height_in_steps=grip_height_in_steps,
+                has_lid=has_lid,
+                incremental_lift=incremental_lift,
+                plates=plates,
             )
-
-        # open the gripper
-        self.gripper_close()
-
-        if incremental_lift:
-            self.jog("Z", 100)
-            self.jog("Z", 100)
-            self.jog("Z", 100)
-            self.jog("Z", 100)
-            self.jog("Z", 100)
-
-        # return arm to safe location
-        self.move_tower_neutral()
-        self.move_arm_neutral()
+        )
 
     def place_plate_direct(
         self,
@@ -690,48 +822,14 @@ class PlateCrane:
         TODO:
             * use target_type variable to slow approach in "stack" transfers to avoid striking other plates
         """
-
-        # Rotate base (R axis) to target location
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=locations[target].joint_angles[0],
-            Z=current_pos[1],
-            P=current_pos[2],
-            Y=current_pos[3],
-        )
-
-        # Extend arm over plate location (Y axis) and rotate gripper to correct orientation (P axis)
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=current_pos[1],
-            P=locations[target].joint_angles[2],
-            Y=locations[target].joint_angles[3],
-        )
-
-        if target_type == "stack":
-            # lower plate crane speed
-            self.set_speed(50)
-
-        # Lower arm (z axis) to plate grip height
-        current_pos = self.get_position()
-        self.move_joint_angles(
-            R=current_pos[0],
-            Z=locations[target].joint_angles[1] + grip_height_in_steps,
-            P=current_pos[2],
-            Y=current_pos[3],
+        self.execute_plan(
+            motion_plan.plan_place_plate_direct(
+                target=target,
+                target_type=target_type,
+                grip_height_in_steps=grip_height_in_steps,
+            )
         )
 
-        if target_type == "stack":
-            # return plate crane to sull speed
-            self.set_speed(100)
-
-        # open gripper to release the plate
-        self.gripper_open()
-
-        self.move_tower_neutral()
-        self.move_joints_neutral()
-
     def _is_location_joint_values(self, location: str, name: str = "temp") -> str:
         """
         If the location was provided as joint values, transfer joint values into a saved location
@@ -780,11 +878,11 @@ class PlateCrane:
 
         # Calculate grip height in motor steps
         source_grip_height_in_steps = PlateResource.convert_to_steps(
-            plate_definitions[plate_type].lid_removal_grip_height + height_offset
+            registry.plate(plate_type).lid_removal_grip_height + height_offset
         )
         target_grip_height_in_steps = PlateResource.convert_to_steps(
-            plate_definitions[plate_type].plate_height_with_lid
-            - plate_definitions[plate_type].lid_height
+            registry.plate(plate_type).plate_height_with_lid
+            - registry.plate(plate_type).lid_height
             + height_offset
         )
 
@@ -821,10 +919,10 @@ class PlateCrane:
         """
         # Calculate grip height in motor steps
         source_grip_height_in_steps = PlateResource.convert_to_steps(
-            plate_definitions[plate_type].lid_grip_height + height_offset
+            registry.plate(plate_type).lid_grip_height + height_offset
         )
         target_grip_height_in_steps = PlateResource.convert_to_steps(
-            plate_definitions[plate_type].lid_removal_grip_height + height_offset
+            registry.plate(plate_type).lid_removal_grip_height + height_offset
         )
 
         # Pass to transfer function but specify that it is a lid we're transferring
@@ -874,86 +972,229 @@ class PlateCrane:
                     - raise 100 steps along z axis (repeat 5x)
                     - continue with rest of transfer
 
+        Plates picked from or placed onto stacks update the stack plate counts (see stack_tracker.py).
+        A pick from a stack with a known count descends at full speed to one plate above the computed top and
+        only taps the rest of the way, the tap corrects the count. If the full speed descent stops short, the
+        count becomes unknown, the tower is raised and the transfer runs again tapping all the way.
+
         Raises:
             TODO
 
         Returns:
             None
         """
+        route = dict(
+            source=source,
+            target=target,
+            plate_type=plate_type,
+            height_offset=height_offset,
+            is_lid=is_lid,
+            has_lid=has_lid,
+            source_grip_height_in_steps=source_grip_height_in_steps,
+            target_grip_height_in_steps=target_grip_height_in_steps,
+            incremental_lift=incremental_lift,
+        )
+        from_stack = not is_lid and self.stack_tracker.is_stack(source)
+        plates = None
+        if from_stack and self.predict_stack_picks:
+            plates = self.stack_tracker.count(source)
+        start_pose = self.pose_tracker.pose
+        start = time.perf_counter()
+        self.last_probe_pose = None
+        try:
+            self.execute_plan(self.route_cache.get(**route, source_plates=plates))
+        except StackMismatchError as err:
+            print(f"STACK {source}: {err}, probing instead")
+            self.stack_tracker.invalidate(source)
+            plates = None
+            # Leave the stack before closing the gripper, it may reach around the top plate
+            self.execute_plan(motion_plan.plan_tower_neutral())
+            self.execute_plan(self.route_cache.get(**route))
+
+        if from_stack:
+            self._record_stack_pick(
+                route, plates, start_pose, time.perf_counter() - start
+            )
+        if not is_lid and self.stack_tracker.is_stack(target):
+            self.stack_tracker.placed(target)
 
-        # Extract the source and target location_types
-        source_type = locations[source].location_type
-        target_type = locations[target].location_type
+    def _record_stack_pick(
+        self, route: dict, plates: Optional[int], start_pose, seconds: float
+    ) -> PickRecord:
+        """Updates the plate count of the source stack of route after a pick and records the pick
 
-        # Determine source and target grip heights from bottom of plate (converted from mm to z motor steps)
-        """If the transfer function is called from either remove_lid() or replace_lid(),
-        these values will be precalculated and passed in. Otherwise they need to be calculated here."""
-        if not is_lid:
-            grip_height_in_steps = PlateResource.convert_to_steps(
-                plate_definitions[plate_type].grip_height + height_offset
+        Args:
+            route (dict): transfer keyword arguments
+            plates (int): plate count the pick was predicted from, None or 0 if it probed
+            start_pose ([int]): pose the transfer started from, None if unknown
+            seconds (float): duration of the transfer
+        """
+        stack = route["source"]
+        probed = not plates
+        saved_seconds = 0.0
+        if not probed:
+            saved_seconds = self.estimate_stack_pick_savings(route, plates, start_pose)
+        if self.last_probe_pose is not None:
+            measured = self.stack_tracker.measured(
+                stack,
+                self.last_probe_pose[1],
+                route["plate_type"],
+                route["has_lid"],
             )
-            source_grip_height_in_steps = grip_height_in_steps
-            target_grip_height_in_steps = grip_height_in_steps
+            if not probed and measured != plates:
+                print(
+                    f"STACK {stack}: counted {plates} plates, the tap found {measured}"
+                )
+            plates = measured
+        self.stack_tracker.picked(stack)
+        record = PickRecord(stack, plates, probed, seconds, saved_seconds)
+        self.stack_picks.append(record)
+        print(f"STACK PICK: {record}")
+        return record
+
+    def estimate_stack_pick_savings(
+        self, route: dict, plates: int, start_pose=None
+    ) -> float:
+        """Estimates the seconds a pick predicted from the plate count saves over tapping the top of the stack
+        all the way from the neutral height
+
+        Both plans are estimated with travel_model, their taps stopping at the top of plates plates.
 
-        # is safe approach required for source and/or target?
-        source_use_safe_approach = (
-            False if locations[source].safe_approach_height == 0 else True
+        Args:
+            route (dict): transfer keyword arguments with a stack as source
+            plates (int): plates in the source stack
+            start_pose ([int]): pose the transfer starts from, the Safe location if None
+        """
+        top_z = stack_top_z(
+            route["source"], route["plate_type"], route["has_lid"], plates
         )
-        target_use_safe_approach = (
-            False if locations[target].safe_approach_height == 0 else True
+
+        def tap_stops_at_top(plan):
+            """Returns plan with its tap ending on the top of plates plates"""
+            return [
+                step.model_copy(
+                    update={"joints": (step.joints[0], top_z, *step.joints[2:])}
+                )
+                if step.probe
+                else step
+                for step in plan
+            ]
+
+        probing = tap_stops_at_top(self.route_cache.get(**route))
+        predicted = tap_stops_at_top(
+            self.route_cache.get(**route, source_plates=plates)
         )
+        start = start_pose or registry.location("Safe").joint_angles
+        return self.travel_model.estimate_plan(
+            probing, start=start, speed=self.speed
+        ) - self.travel_model.estimate_plan(predicted, start=start, speed=self.speed)
 
-        # PICK PLATE FROM SOURCE LOCATION
-        if source_type == "stack":
-            self.pick_plate_direct(
-                source=source,
-                source_type=source_type,  # "stack"
-                plate_type=plate_type,
-                grip_height_in_steps=source_grip_height_in_steps,
-                has_lid=has_lid,
-                incremental_lift=incremental_lift,
-            )
+    def estimate_transfer_time(
+        self,
+        source: str,
+        target: str,
+        plate_type: str,
+        height_offset: int = 0,
+        has_lid: bool = False,
+    ) -> float:
+        """Estimates the seconds transfer would take from the current pose and speed, without moving
 
-        elif source_type == "nest":
-            if source_use_safe_approach:
-                self.pick_plate_safe_approach(
-                    source=source,
-                    plate_type=plate_type,
-                    grip_height_in_steps=source_grip_height_in_steps,
-                )
-            else:
-                self.pick_plate_direct(
-                    source=source,
-                    source_type=source_type,  # nest
-                    plate_type=plate_type,
-                    grip_height_in_steps=source_grip_height_in_steps,
-                    has_lid=has_lid,
-                    incremental_lift=incremental_lift,
-                )
-        else:
-            raise Exception("Source location type not defined correctly")
+        Uses the same compiled plan as transfer (see route_cache.py) and travel_model (see travel_time.py).
+        If the pose is unknown, the estimate starts from the Safe location. A tap on the top of a stack is
+        estimated as a move down to the stack floor.
 
-        # PLACE PLATE AT TARGET LOCATION
-        if target_type == "stack":
-            self.place_plate_direct(
-                target=target,
-                target_type=target_type,
-                grip_height_in_steps=target_grip_height_in_steps,
-            )
-        elif target_type == "nest":
-            if target_use_safe_approach:
-                self.place_plate_safe_approach(
-                    target=target,
-                    grip_height_in_steps=target_grip_height_in_steps,
-                )
-            else:
-                self.place_plate_direct(
-                    target=target,
-                    target_type=target_type,
-                    grip_height_in_steps=target_grip_height_in_steps,
-                )
+        Args:
+            source (str): source location name defined in resource_defs.py
+            target (str): target location name defined in resource_defs.py
+            plate_type (str): plate definition name defined in resource_defs.py
+            height_offset (int): change in z height applied to the grip location (unit: mm)
+            has_lid (bool): True if the plate has a lid
+
+        Returns:
+            Estimated seconds
+        """
+        plates = None
+        if self.predict_stack_picks and self.stack_tracker.is_stack(source):
+            plates = self.stack_tracker.count(source)
+        plan = self.route_cache.get(
+            source=source,
+            target=target,
+            plate_type=plate_type,
+            height_offset=height_offset,
+            has_lid=has_lid,
+            source_plates=plates,
+        )
+        start = self.pose_tracker.pose or registry.location("Safe").joint_angles
+        if not self.strict_motion:
+            plan = motion_plan.merge_safe_moves(plan, start)
+        return self.travel_model.estimate_plan(plan, start=start, speed=self.speed)
+
+    def calibrate_travel_time(self, min_records: int = 2) -> TravelTimeModel:
+        """Fits travel_model to the recorded moves and returns it
+
+        Axes with fewer than min_records recorded single-axis moves keep their current profile.
+        """
+        self.travel_model = TravelTimeModel.calibrate(
+            self.recorded_moves, base=self.travel_model, min_records=min_records
+        )
+        print(f"TRAVEL TIME PROFILES: {self.travel_model.profile()}")
+        return self.travel_model
+
+    def batch_transfer(
+        self,
+        transfers: Sequence[Union[TransferRequest, dict]],
+        optimize_order: bool = True,
+    ) -> dict:
+        """Runs several transfers one after another, ordered to minimize base rotation
+
+        Transfers that share a location keep their relative order, independent ones are reordered
+        (see batch_transfer.py). Each transfer is a separate transfer() call: it ends with the tower
+        raised and the arm retracted above its target, and the next one rotates the base from there.
+        The neutral moves between transfers are kept, the safe envelope never allows merging them
+        into the next transfer's first moves (see safe_envelope.py).
+
+        Args:
+            transfers ([TransferRequest]): transfers to run, as TransferRequest or dicts of its fields
+            optimize_order (bool): False runs the transfers in the given order
+
+        Returns:
+            {"order": [int], "moves": [{"index", "source", "target", "seconds"}], "total_seconds": float,
+            "base_travel": int}, where base_travel is the R axis travel (unit: motor steps) of the order
+        """
+        transfers = [TransferRequest.model_validate(t) for t in transfers]
+        for transfer in transfers:
+            self.route_cache.get(**transfer.model_dump())  # reject bad routes up front
+
+        pose = self.pose_tracker.pose
+        start_r = (
+            pose[0] if pose is not None else registry.location("Safe").joint_angles[0]
+        )
+        if optimize_order:
+            order = order_transfers(transfers, start_r=start_r)
         else:
-            raise Exception("Target location type not defined correctly")
+            order = list(range(len(transfers)))
+
+        moves = []
+        batch_start = time.perf_counter()
+        for index in order:
+            transfer = transfers[index]
+            start = time.perf_counter()
+            self.transfer(**transfer.model_dump())
+            moves.append(
+                {
+                    "index": index,
+                    "source": transfer.source,
+                    "target": transfer.target,
+                    "seconds": time.perf_counter() - start,
+                }
+            )
+            print(f"Transfer {len(moves)}/{len(order)}: {moves[-1]}")
+        return {
+            "order": order,
+            "moves": moves,
+            "total_seconds": time.perf_counter() - batch_start,
+            "base_travel": base_travel(transfers, order, start_r),
+        }
 
 
 if __name__ == "__main__":
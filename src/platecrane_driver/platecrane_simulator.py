@@ -0,0 +1,321 @@
+"""Simulated PlateCrane EX controller on a pseudo-terminal, for testing and benchmarking without hardware.
+
+The simulator opens a pty and answers the command set used by the driver on its slave end, so
+PlateCrane and the REST node run against it unmodified (pass the printed path as the device):
+
+    python -m platecrane_driver.platecrane_simulator --time-scale 0.1
+    python src/platecrane_rest_node.py --device /dev/pts/5
+"""
+
+import argparse
+import os
+import queue
+import select
+import threading
+import time
+import tty
+from typing import Dict, List, Optional, Tuple
+
+from platecrane_driver.motion_plan import AXES
+from platecrane_driver.resource_defs import locations
+from platecrane_driver.travel_time import DEFAULT_TRAVEL_TIMES, travel_ranges
+
+
+class PlateCraneSimulator:
+    """Answers PlateCrane EX serial commands on a pty.
+
+    Every command line is echoed as soon as it arrives and queued. Commands are executed one at a
+    time, in order, like on the controller, and each is answered with a single reply line
+    ('0000 Success', a position, or an error code) after its simulated execution time.
+    LISTPOINTS is answered with one line per stored point followed by '0000 Success'.
+
+    Stacks given to the simulator hold plates: a move into a stack stops on its plates and is answered
+    with '1400'. The closed gripper stops on the top plate, the open gripper reaches around it down to the
+    plate below, and a held plate stops on the top plate. Closing the gripper around the top plate takes it,
+    opening the gripper over a stack puts the held plate on top. Plates picked elsewhere are not tracked.
+    """
+
+    def __init__(
+        self,
+        travel_times: Dict[str, float] = None,
+        time_scale: float = 1.0,
+        command_time: float = 0.01,
+        gripper_time: float = 0.5,
+        line_timeout: float = 0.5,
+        homed: bool = True,
+        stacks: Dict[str, List[int]] = None,
+        taught_points: Dict[str, List[int]] = None,
+    ):
+        """Creates the pty and starts answering commands
+
+        Args:
+            travel_times ({str: float}): seconds per axis to cross its travel range at 100% speed,
+                defaults to DEFAULT_TRAVEL_TIMES
+            time_scale (float): multiplier applied to every motion and gripper time, 0 makes them instant
+            command_time (float): seconds the controller needs to answer any command
+            gripper_time (float): seconds an OPEN or CLOSE takes
+            line_timeout (float): seconds of silence after which an unterminated command is executed
+                (older drivers sent SPEED without a line ending)
+            homed (bool): False makes STATUS report "0", so the driver homes on startup
+            stacks ({str: [int]}): plate heights (unit: Z motor steps) in stack locations, bottom plate first.
+                Without stacks, no move is ever obstructed.
+            taught_points ({str: [int]}): points stored in device memory at startup, like the points taught
+                on the controller. Defaults to every resource_defs location under its own name.
+        """
+        self.travel_times = dict(DEFAULT_TRAVEL_TIMES, **(travel_times or {}))
+        self.ranges = travel_ranges()
+        self.time_scale = time_scale
+        self.command_time = command_time
+        self.gripper_time = gripper_time
+        self.line_timeout = line_timeout
+
+        self.homed = homed
+        self.pose = list(locations["Safe"].joint_angles)
+        if taught_points is None:
+            taught_points = {
+                name: location.joint_angles for name, location in locations.items()
+            }
+        self.points: Dict[str, List[int]] = {
+            name: list(point) for name, point in taught_points.items()
+        }
+        self.speed = 100
+        self.gripper_open = True
+        self.stacks = {name: list(plates) for name, plates in (stacks or {}).items()}
+        self.held: Optional[Tuple[int, int]] = None
+        """(height, grip height) of the plate held in the gripper, None if none is tracked"""
+        self.contacts: List[Tuple[str, int]] = []
+        """(stack, speed) of every move that stopped on the plates of a stack, in order"""
+        self.command_log: List[str] = []
+        """Every executed command, in order"""
+        self.busy_time = 0.0
+        """Total seconds spent moving axes and the gripper"""
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port_path = os.ttyname(self.slave_fd)
+        self._write_lock = threading.Lock()
+        self._commands = queue.Queue()
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._read_commands, daemon=True),
+            threading.Thread(target=self._execute_commands, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self) -> None:
+        """Stops the simulator and closes the pty"""
+        self._running = False
+        self._commands.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def _write_line(self, line: str) -> None:
+        """Writes one line to the driver"""
+        with self._write_lock:
+            os.write(self.master_fd, line.encode("utf-8") + b"\r\n")
+
+    def _read_commands(self) -> None:
+        """Echoes and queues every command line written by the driver"""
+        buffer = b""
+        while self._running:
+            ready, _, _ = select.select([self.master_fd], [], [], self.line_timeout)
+            if not ready:
+                # Execute a command that was sent without a line ending
+                if buffer.strip():
+                    self._queue(buffer)
+                buffer = b""
+                continue
+            try:
+                buffer += os.read(self.master_fd, 1024)
+            except OSError:
+                return
+            buffer = buffer.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    self._queue(line)
+
+    def _queue(self, line: bytes) -> None:
+        """Echoes a command and queues it for execution"""
+        command = line.decode("utf-8", errors="replace").strip()
+        self._write_line(command)
+        self._commands.put(command)
+
+    def _execute_commands(self) -> None:
+        """Executes queued commands one at a time"""
+        while self._running:
+            command = self._commands.get()
+            if command is None:
+                return
+            time.sleep(self.command_time)
+            self.command_log.append(command)
+            for line in self.execute(command):
+                self._write_line(line)
+
+    def motion_time(self, target: List[int]) -> float:
+        """Seconds needed to move from the current pose to target. Axes move simultaneously."""
+        return (
+            self.time_scale
+            * max(
+                abs(goal - current) / self.ranges[axis] * self.travel_times[axis]
+                for axis, current, goal in zip(AXES, self.pose, target)
+            )
+            / (self.speed / 100)
+        )
+
+    def stack_at(self, pose: List[int]) -> Optional[str]:
+        """Returns the simulated stack the arm is over at pose, None if there is none"""
+        for name in self.stacks:
+            R, _, P, Y = locations[name].joint_angles
+            if (pose[0], pose[2], pose[3]) == (R, P, Y):
+                return name
+        return None
+
+    def floor_z(self, pose: List[int]) -> Optional[int]:
+        """Returns the lowest Z the arm can reach at pose, None if nothing is below it"""
+        stack = self.stack_at(pose)
+        if stack is None:
+            return None
+        plates = self.stacks[stack]
+        top = locations[stack].joint_angles[1] + sum(plates)
+        if self.held is not None:
+            return top + self.held[1]
+        if self.gripper_open and plates:
+            return top - plates[-1]
+        return top
+
+    def move_to(self, target: List[int]) -> str:
+        """Moves to target, or until the arm hits a plate, and returns the reply"""
+        target = list(target)
+        reply = "0000 Success"
+        floor = self.floor_z(target)
+        if floor is not None and target[1] < floor:
+            target[1] = floor
+            reply = "1400"
+            self.contacts.append((self.stack_at(target), self.speed))
+        duration = self.motion_time(target)
+        time.sleep(duration)
+        self.busy_time += duration
+        self.pose = target
+        return reply
+
+    def actuate_gripper(self, open_gripper: bool) -> None:
+        """Opens or closes the gripper, taking or releasing the top plate of a stack"""
+        time.sleep(self.time_scale * self.gripper_time)
+        self.busy_time += self.time_scale * self.gripper_time
+        self.gripper_open = open_gripper
+        stack = self.stack_at(self.pose)
+        if open_gripper:
+            if stack is not None and self.held is not None:
+                self.stacks[stack].append(self.held[0])
+            self.held = None
+        elif stack is not None and self.stacks[stack]:
+            plates = self.stacks[stack]
+            bottom = locations[stack].joint_angles[1] + sum(plates[:-1])
+            if self.pose[1] < bottom + plates[-1]:
+                self.held = (plates.pop(), self.pose[1] - bottom)
+
+    def execute(self, command: str) -> List[str]:
+        """Executes a single command and returns its reply lines"""
+        verb, _, args = command.partition(" ")
+        verb = verb.upper()
+        args = [arg.strip() for arg in args.split(",")] if args.strip() else []
+
+        try:
+            if verb == "GETPOS":
+                return [", ".join(str(value) for value in self.pose)]
+            if verb in ("STATUS", "GETSTATUS"):
+                return ["1" if self.homed else "0"]
+            if verb == "HOME":
+                self.move_to(locations["Safe"].joint_angles)
+                self.homed = True
+                return ["0000 Success"]
+            if verb == "LOADPOINT":
+                self.points[args[0]] = [int(value) for value in args[1:5]]
+                return ["0000 Success"]
+            if verb == "DELETEPOINT":
+                if self.points.pop(args[0], None) is None:
+                    return ["02"]
+                return ["0000 Success"]
+            if verb == "GETPOINT":
+                if args[0] not in self.points:
+                    return ["02"]
+                return [", ".join(str(value) for value in self.points[args[0]])]
+            if verb == "LISTPOINTS":
+                return [
+                    f"{index}:{name}, " + ", ".join(str(value) for value in point)
+                    for index, (name, point) in enumerate(self.points.items())
+                ] + ["0000 Success"]
+            if verb == "MOVE":
+                if args[0] not in self.points:
+                    return ["02"]
+                return [self.move_to(self.points[args[0]])]
+            if verb.startswith("MOVE_") and verb[5:] in AXES:
+                if args[0] not in self.points:
+                    return ["02"]
+                index = AXES.index(verb[5:])
+                target = list(self.pose)
+                target[index] = self.points[args[0]][index]
+                return [self.move_to(target)]
+            if verb == "JOG":
+                index = AXES.index(args[0].upper())
+                target = list(self.pose)
+                target[index] += int(args[1])
+                return [self.move_to(target)]
+            if verb == "SPEED":
+                self.speed = max(1, min(100, int(args[0])))
+                return ["0000 Success"]
+            if verb in ("OPEN", "CLOSE"):
+                self.actuate_gripper(verb == "OPEN")
+                return ["0000 Success"]
+            if verb == "GETGRIPPERISOPEN":
+                return ["1" if self.gripper_open else "0"]
+            if verb == "GETGRIPPERISCLOSED":
+                return ["0" if self.gripper_open else "1"]
+            if verb == "LIMP":
+                return ["0000 Success"]
+        except (IndexError, ValueError):
+            return ["02"]
+        return ["0001 Unknown command"]
+
+
+def main():
+    """Runs a simulator until interrupted and prints the device path to connect to"""
+    parser = argparse.ArgumentParser(description="Simulated PlateCrane EX controller")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--command-time", type=float, default=0.01)
+    parser.add_argument(
+        "--unhomed", action="store_true", help="Report an unhomed robot on STATUS"
+    )
+    for axis in AXES:
+        parser.add_argument(
+            f"--{axis.lower()}-travel-time",
+            type=float,
+            default=DEFAULT_TRAVEL_TIMES[axis],
+            help=f"Seconds for the {axis} axis to cross its travel range at 100%% speed",
+        )
+    args = parser.parse_args()
+
+    simulator = PlateCraneSimulator(
+        travel_times={
+            axis: getattr(args, f"{axis.lower()}_travel_time") for axis in AXES
+        },
+        time_scale=args.time_scale,
+        command_time=args.command_time,
+        homed=not args.unhomed,
+    )
+    print(simulator.port_path, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Registry of the PlateCrane and Sciclops resource definitions.
+
+The registry loads every resource definition once and keeps it as frozen NamedTuples in read-only
+dicts, so lookups by name are O(1) and cannot change a definition by accident:
+    - PlateCrane locations and plates from resource_defs, with Z values precomputed in motor steps
+    - Sciclops plates from sciclops_plate_resources.json
+
+Lookups check the JSON files for a new mtime at most every check_interval seconds and reload them
+when one changed. refresh() checks right away and also notices edits of the resource_defs
+objects. Every reload increments generation, which is what compiled transfer plans are keyed on
+(see route_cache.py).
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from platecrane_driver import resource_defs
+from platecrane_driver.resource_types import PlateResource
+
+RESOURCE_DIR = Path(__file__).parent
+"""Directory of the packaged resource files"""
+
+
+class LocationEntry(NamedTuple):
+    """A PlateCrane location"""
+
+    name: str
+    """Name of the location in resource_defs"""
+    joint_angles: Tuple[int, int, int, int]
+    """R, Z, P, Y joint values (unit: motor steps)"""
+    location_type: str
+    """Either stack or nest"""
+    safe_approach_height: Optional[int]
+    """Safe Z height to extend the arm from (unit: motor steps), None or 0 if there is none"""
+
+
+class PlateEntry(NamedTuple):
+    """A PlateCrane plate type, with its heights also converted to Z axis motor steps"""
+
+    name: str
+    plate_height: float
+    grip_height: float
+    plate_height_with_lid: Optional[float]
+    lid_height: Optional[float]
+    lid_grip_height: Optional[float]
+    lid_removal_grip_height: Optional[float]
+    plate_height_steps: int
+    grip_height_steps: int
+    plate_height_with_lid_steps: Optional[int]
+    lid_height_steps: Optional[int]
+    lid_grip_height_steps: Optional[int]
+    lid_removal_grip_height_steps: Optional[int]
+
+
+class SciclopsPlateEntry(NamedTuple):
+    """A Sciclops plate type of sciclops_plate_resources.json"""
+
+    name: str
+    height: float
+    grab_exchange: float
+    """Downward jog to grip the plate on the exchange"""
+    grab_lid_exchange: float
+    """Downward jog to grip the lid of a plate on the exchange, 0 if the plate has no lid"""
+    grab_tower: float
+    """Downward jog to grip the plate in a tower, from 10 above the top of the plate"""
+    grab_lid_tower: float
+    grab_lid_nest: float
+
+
+def _steps(value: Optional[float]) -> Optional[int]:
+    """Converts a plate measurement to motor steps, keeping None"""
+    return None if value is None else PlateResource.convert_to_steps(value)
+
+
+def _location_entry(name: str, location) -> LocationEntry:
+    """Validates a resource_defs Location into a LocationEntry"""
+    if len(location.joint_angles) != 4:
+        raise Exception(f"Location '{name}' must have 4 joint angles")
+    return LocationEntry(
+        name=name,
+        joint_angles=tuple(location.joint_angles),
+        location_type=location.location_type,
+        safe_approach_height=location.safe_approach_height,
+    )
+
+
+def _plate_entry(name: str, plate: PlateResource) -> PlateEntry:
+    """Converts a resource_defs PlateResource into a PlateEntry"""
+    return PlateEntry(
+        name=name,
+        **plate.model_dump(),
+        plate_height_steps=_steps(plate.plate_height),
+        grip_height_steps=_steps(plate.grip_height),
+        plate_height_with_lid_steps=_steps(plate.plate_height_with_lid),
+        lid_height_steps=_steps(plate.lid_height),
+        lid_grip_height_steps=_steps(plate.lid_grip_height),
+        lid_removal_grip_height_steps=_steps(plate.lid_removal_grip_height),
+    )
+
+
+def _load_json_entries(path: Path, entry_type) -> Mapping[str, tuple]:
+    """Loads {name: fields} from a JSON file and validates every entry into entry_type.
+    An 'example' entry documents the fields and is skipped."""
+    with open(path) as f:
+        definitions = json.load(f)
+    adapter = TypeAdapter(entry_type)
+    return MappingProxyType(
+        {
+            name: adapter.validate_python({"name": name, **fields})
+            for name, fields in definitions.items()
+            if name != "example"
+        }
+    )
+
+
+def _definitions_fingerprint() -> int:
+    """Returns a hash of the resource_defs locations and plates"""
+    return hash(
+        (
+            tuple(
+                (
+                    name,
+                    tuple(location.joint_angles),
+                    location.location_type,
+                    location.safe_approach_height,
+                )
+                for name, location in resource_defs.locations.items()
+            ),
+            tuple(
+                (name, tuple(plate.model_dump().items()))
+                for name, plate in resource_defs.plate_definitions.items()
+            ),
+        )
+    )
+
+
+class ResourceRegistry:
+    """Frozen, hot-reloaded resource definitions with O(1) lookups by name"""
+
+    def __init__(
+        self,
+        sciclops_plate_file: Path = RESOURCE_DIR / "sciclops_plate_resources.json",
+        check_interval: float = 1.0,
+    ):
+        """Loads every resource definition
+
+        Args:
+            sciclops_plate_file (Path): JSON file of SciclopsPlateEntry definitions
+            check_interval (float): minimum seconds between two mtime checks during lookups
+        """
+        self.files = {
+            "sciclops_plates": (Path(sciclops_plate_file), SciclopsPlateEntry),
+        }
+        self.check_interval = check_interval
+        self.generation = 0
+        """Incremented on every reload"""
+        self.locations: Mapping[str, LocationEntry] = MappingProxyType({})
+        self.plates: Mapping[str, PlateEntry] = MappingProxyType({})
+        self.sciclops_plates: Mapping[str, SciclopsPlateEntry] = MappingProxyType({})
+        self._mtimes: Dict[str, int] = {}
+        self._fingerprint = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _load_definitions(self) -> None:
+        """Loads the resource_defs locations and plates"""
+        self.locations = MappingProxyType(
+            {
+                name: _location_entry(name, location)
+                for name, location in resource_defs.locations.items()
+            }
+        )
+        self.plates = MappingProxyType(
+            {
+                name: _plate_entry(name, plate)
+                for name, plate in resource_defs.plate_definitions.items()
+            }
+        )
+
+    def _reload_files(self) -> bool:
+        """Reloads the JSON files whose mtime changed, returns True if any did. Must hold the lock."""
+        changed = False
+        for attribute, (path, entry_type) in self.files.items():
+            mtime = os.stat(path).st_mtime_ns
+            if mtime != self._mtimes.get(attribute):
+                setattr(self, attribute, _load_json_entries(path, entry_type))
+                self._mtimes[attribute] = mtime
+                changed = True
+        return changed
+
+    def refresh(self) -> int:
+        """Reloads every source that changed since it was loaded and returns the generation"""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            changed = self._reload_files()
+            fingerprint = _definitions_fingerprint()
+            if fingerprint != self._fingerprint:
+                self._load_definitions()
+                self._fingerprint = fingerprint
+                changed = True
+            if changed:
+                self.generation += 1
+            return self.generation
+
+    def _check_files(self) -> None:
+        """Reloads changed JSON files if check_interval passed since the last check"""
+        if time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            if self._reload_files():
+                self.generation += 1
+
+    def _lookup(self, attribute: str, name: str, description: str):
+        """Returns a definition by name
+
+        Raises:
+            Exception: if the name is not defined
+        """
+        self._check_files()
+        entry = getattr(self, attribute).get(name)
+        if entry is None:
+            raise Exception(f"{description} '{name}' is not defined")
+        return entry
+
+    def location(self, name: str) -> LocationEntry:
+        """Returns a PlateCrane location"""
+        return self._lookup("locations", name, "Location")
+
+    def plate(self, name: str) -> PlateEntry:
+        """Returns a PlateCrane plate type"""
+        return self._lookup("plates", name, "Plate type")
+
+    def sciclops_plate(self, name: str) -> SciclopsPlateEntry:
+        """Returns a Sciclops plate type"""
+        return self._lookup("sciclops_plates", name, "Sciclops plate type")
+
+
+registry = ResourceRegistry()
+"""Registry of the packaged resource definitions, shared by the drivers"""
@@ -0,0 +1,97 @@
+"""Parses PlateCrane EX replies with precompiled patterns.
+
+Every parser returns a typed result or raises a PlateCraneError (see error_codes.py) right away:
+an error code reply raises its specific error, anything else that does not match raises
+MalformedReplyError. Replies may contain leftover lines of an earlier command (legacy read mode),
+so parsers use the last line that matches.
+"""
+
+import re
+from typing import Dict, NamedTuple, Tuple
+
+from platecrane_driver.error_codes import (
+    PLATECRANE_ERROR_CODES,
+    MalformedReplyError,
+    PlateCraneError,
+)
+
+POSITION_LINE = re.compile(r"^(-?\d+),?\s+(-?\d+),?\s+(-?\d+),?\s+(-?\d+)$")
+"""A GETPOS or GETPOINT reply, e.g. '182220, 2500, 460, -308'"""
+
+POINT_LINE = re.compile(
+    r"^(?:\d+:)?\s*([^,\s]+)\s*,?\s*(-?\d+)\s*,?\s*(-?\d+)\s*,?\s*(-?\d+)\s*,?\s*(-?\d+)$"
+)
+"""One LISTPOINTS entry, e.g. '28:SealerNest, 210256, -1050, 491, 5730'"""
+
+STATUS_LINE = re.compile(r"^(\d{4})(?:\s+(.*\S))?\s*$")
+"""A status line, e.g. '0000 Success'"""
+
+
+class StatusReply(NamedTuple):
+    """A parsed status line"""
+
+    code: int
+    """Status code, 0 on success"""
+    message: str
+    """Text following the status code"""
+
+
+def _lines(response: str):
+    """Returns the non-empty, stripped lines of a reply"""
+    return [line.strip() for line in response.splitlines() if line.strip()]
+
+
+def check_error(response: str) -> None:
+    """Raises the PlateCraneError of an error code reply, does nothing otherwise"""
+    lines = _lines(response)
+    if lines and lines[-1] in PLATECRANE_ERROR_CODES:
+        raise PlateCraneError.from_response(lines[-1])
+
+
+def is_error(response: str) -> bool:
+    """True if a reply ends with an error code"""
+    lines = _lines(response)
+    return bool(lines) and lines[-1] in PLATECRANE_ERROR_CODES
+
+
+def parse_position(response: str) -> Tuple[int, int, int, int]:
+    """Parses a GETPOS or GETPOINT reply into (R, Z, P, Y)
+
+    Raises:
+        PlateCraneError: the reply is an error code, or MalformedReplyError if it has no position
+    """
+    check_error(response)
+    for line in reversed(_lines(response)):
+        match = POSITION_LINE.match(line)
+        if match:
+            return tuple(int(value) for value in match.groups())
+    raise MalformedReplyError(f"Expected a position, got '{response.strip()}'")
+
+
+def parse_status(response: str) -> StatusReply:
+    """Parses the status line ('0000 Success') that ends a reply
+
+    Raises:
+        PlateCraneError: the reply is an error code, or MalformedReplyError if it has no status line
+    """
+    check_error(response)
+    for line in reversed(_lines(response)):
+        match = STATUS_LINE.match(line)
+        if match:
+            return StatusReply(code=int(match[1]), message=match[2] or "")
+    raise MalformedReplyError(f"Expected a status line, got '{response.strip()}'")
+
+
+def parse_point_list(response: str) -> Dict[str, Tuple[int, int, int, int]]:
+    """Parses a LISTPOINTS reply into {name: (R, Z, P, Y)}. Lines that are not points are ignored.
+
+    Raises:
+        PlateCraneError: the reply is an error code
+    """
+    check_error(response)
+    points = {}
+    for line in _lines(response):
+        match = POINT_LINE.match(line)
+        if match:
+            points[match[1]] = tuple(int(value) for value in match.groups()[1:])
+    return points
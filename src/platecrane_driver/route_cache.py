@@ -0,0 +1,135 @@
+"""Caches compiled PlateCrane transfer plans so repeated routes go straight to execution.
+
+A route is one set of transfer arguments (source, target, plate_type, lid state, height offset, ...).
+The first transfer along a route validates it against the resource registry and compiles it with
+motion_plan.plan_transfer; later transfers along the same route reuse the immutable plan.
+The whole cache is dropped as soon as the registry generation changes, i.e. when a resource
+definition was reloaded (see resource_registry.py).
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Union
+
+from platecrane_driver import motion_plan
+from platecrane_driver.motion_plan import PlanStep
+from platecrane_driver.resource_registry import registry
+
+LOCATION_TYPES = ("stack", "nest")
+"""Location types a transfer can pick from or place at"""
+
+
+def validate_route(source: str, target: str, plate_type: str) -> None:
+    """Checks that a route only refers to defined locations and plate types
+
+    Raises:
+        Exception: if a location or plate type is unknown or a location cannot be transferred to/from
+    """
+    for role, name in (("Source", source), ("Target", target)):
+        if name not in registry.locations:
+            raise Exception(f"{role} location '{name}' is not defined in resource_defs")
+        if registry.locations[name].location_type not in LOCATION_TYPES:
+            raise Exception(f"{role} location type not defined correctly")
+    if plate_type not in registry.plates:
+        raise Exception(f"Plate type '{plate_type}' is not defined in resource_defs")
+
+
+def load_routes(path: Union[str, Path]) -> List[dict]:
+    """Loads a list of routes (transfer keyword arguments) from a JSON file, e.g.
+
+    [{"source": "Stack1", "target": "Solo.Position2", "plate_type": "flat_bottom_96well"}]
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+class RouteCache:
+    """Compiled transfer plans, keyed by every argument that changes the plan
+
+    The key is (source, target, plate_type, has_lid, height_offset) plus the lid transfer
+    arguments (is_lid, source/target grip heights, incremental_lift), which remove_lid and
+    replace_lid set, and the plate count of a source stack, which PlateCrane sets once it is known.
+    """
+
+    def __init__(self, routes: Iterable[dict] = ()):
+        """Creates a new RouteCache
+
+        Args:
+            routes ([dict]): routes to compile right away, each given as transfer keyword arguments
+        """
+        self._plans: Dict[tuple, Tuple[PlanStep, ...]] = {}
+        self._generation = registry.refresh()
+        self.hits = 0
+        self.misses = 0
+        self.warm(routes)
+
+    def __len__(self) -> int:
+        """Number of compiled routes"""
+        return len(self._plans)
+
+    def warm(self, routes: Iterable[dict]) -> None:
+        """Compiles the given routes (transfer keyword arguments) ahead of time"""
+        for route in routes:
+            self.get(**route)
+
+    def clear(self) -> None:
+        """Drops every compiled route"""
+        self._plans.clear()
+        self._generation = registry.generation
+
+    def get(
+        self,
+        source: str,
+        target: str,
+        plate_type: str,
+        height_offset: int = 0,
+        is_lid: bool = False,
+        has_lid: bool = False,
+        source_grip_height_in_steps: int = None,
+        target_grip_height_in_steps: int = None,
+        incremental_lift: bool = False,
+        source_plates: int = None,
+    ) -> Tuple[PlanStep, ...]:
+        """Returns the compiled plan of a transfer, compiling and caching it on first use.
+        See PlateCrane.transfer for the arguments and motion_plan.plan_transfer for source_plates.
+
+        Raises:
+            Exception: if the route refers to undefined locations or plate types
+        """
+        if registry.refresh() != self._generation:
+            self.clear()
+        key = (
+            source,
+            target,
+            plate_type,
+            has_lid,
+            height_offset,
+            is_lid,
+            source_grip_height_in_steps,
+            target_grip_height_in_steps,
+            incremental_lift,
+            source_plates,
+        )
+        plan = self._plans.get(key)
+        if plan is not None:
+            self.hits += 1
+            return plan
+
+        self.misses += 1
+        validate_route(source, target, plate_type)
+        plan = tuple(
+            motion_plan.plan_transfer(
+                source=source,
+                target=target,
+                plate_type=plate_type,
+                height_offset=height_offset,
+                is_lid=is_lid,
+                has_lid=has_lid,
+                source_grip_height_in_steps=source_grip_height_in_steps,
+                target_grip_height_in_steps=target_grip_height_in_steps,
+                incremental_lift=incremental_lift,
+                source_plates=source_plates,
+            )
+        )
+        self._plans[key] = plan
+        return plan
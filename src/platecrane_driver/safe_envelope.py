@@ -0,0 +1,81 @@
+"""Safe envelope of the PlateCrane EX, used to run several axes of a motion plan at once.
+
+Motion plans move one axis at a time. Two consecutive moves can be sent as a single multi-axis move
+when every pose the arm may pass through on the way is safe. The axes of a move run concurrently at
+their own speeds, so the path between two poses is not a straight line: the whole box spanned by the
+start and end pose counts as reachable. The box is safe if
+
+    - every joint stays within joint_bounds()
+    - the base (R) and the gripper (P) only rotate with the arm retracted (Y at most the neutral Y)
+      and the tower at or above the neutral Z
+    - whenever the arm is extended, base and gripper hold the pose of a location with a
+      safe_approach_height and the tower stays at or above that height
+
+Anything else, e.g. extending over a stack or lowering into a nest, is never merged.
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+from platecrane_driver.platecrane_joint_limits import platecrane_joint_limits
+from platecrane_driver.resource_registry import registry
+
+AXES = ("R", "Z", "P", "Y")
+"""Joint order used by the PlateCrane EX"""
+
+
+def joint_bounds() -> Dict[str, Tuple[int, int]]:
+    """Returns the (min, max) joint values of each axis (unit: motor steps)
+
+    The bounds span platecrane_joint_limits and every location in resource_defs, since the
+    reference joint limits do not cover all taught positions.
+    """
+    bounds = {}
+    for index, axis in enumerate(AXES):
+        values = [
+            location.joint_angles[index] for location in registry.locations.values()
+        ]
+        values += platecrane_joint_limits[axis]
+        bounds[axis] = (min(values), max(values))
+    return bounds
+
+
+class SafeEnvelope:
+    """Decides whether the arm may move between two poses in a single multi-axis move"""
+
+    def __init__(self, neutral: str = "Safe"):
+        """Builds the envelope from the current resource definitions
+
+        Args:
+            neutral (str): location whose Z is the travel height and whose Y is the retracted arm
+        """
+        _, self.travel_z, _, self.retracted_y = registry.location(neutral).joint_angles
+        self.bounds = [joint_bounds()[axis] for axis in AXES]
+        self.approach_heights: Dict[Tuple[int, int], int] = {}
+        """{(R, P): safe approach height} of the locations that have one"""
+        for location in registry.locations.values():
+            if location.safe_approach_height:
+                R, _, P, _ = location.joint_angles
+                self.approach_heights[(R, P)] = location.safe_approach_height
+
+    def contains(
+        self, start: Sequence[Optional[int]], end: Sequence[Optional[int]]
+    ) -> bool:
+        """True if every pose between start and end ([R, Z, P, Y]) is safe. Unknown axes (None) are never safe."""
+        if None in start or None in end:
+            return False
+        low = [min(a, b) for a, b in zip(start, end)]
+        high = [max(a, b) for a, b in zip(start, end)]
+        if not all(
+            lower <= value <= upper
+            for (lower, upper), values in zip(self.bounds, zip(low, high))
+            for value in values
+        ):
+            return False
+        rotates = low[0] != high[0] or low[2] != high[2]
+        extended = high[3] > self.retracted_y
+        if rotates:
+            return not extended and low[1] >= self.travel_z
+        if extended:
+            approach_height = self.approach_heights.get((low[0], low[2]))
+            return approach_height is not None and low[1] >= approach_height
+        return True
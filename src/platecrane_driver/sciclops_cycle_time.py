@@ -0,0 +1,120 @@
+"""Measures Sciclops get_plate, remove_lid and plate_to_stack routines against the simulated robot.
+
+For every routine in ROUTINES a fresh simulator and driver are started, the routine is run once to load the
+labware points and then measured on a second run. The plate counts of the towers are set on the driver, so
+tower picks and places descend to the computed tower top (predict_tower_tops=False taps the towers instead):
+    - commands: commands executed by the robot
+    - cycle time, split into robot motion and remaining time (USB link, reply timeouts and Python)
+    - per-primitive (command verb) latency
+
+Command counts are compared against the baselines in sciclops_cycle_time_baseline.json:
+tests/test_sciclops_simulator.py fails if a routine needs more commands than its baseline,
+and benchmarks/sciclops_cycle_time.py reports the measurements and regenerates the baselines.
+"""
+
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from platecrane_driver.resource_registry import registry
+from platecrane_driver.sciclops_driver import SCICLOPS
+from platecrane_driver.sciclops_simulator import SciclopsSimulator
+
+BASELINE_PATH = Path(__file__).parent / "sciclops_cycle_time_baseline.json"
+"""Stored command counts per routine"""
+
+ROUTINES = {
+    "get_plate tower2": ("get_plate", {"location": "tower2"}),
+    "get_plate tower2, remove lid": (
+        "get_plate",
+        {"location": "tower2", "remove_lid": True},
+    ),
+    "remove_lid to trash": ("remove_lid", {"trash": True}),
+    "plate_to_stack tower3": ("plate_to_stack", {"tower": "tower3", "add_lid": False}),
+}
+"""Representative routines: {name: (SCICLOPS method, keyword arguments)}"""
+
+
+def prepare_labware(sciclops, simulator):
+    """Fills tower2, empties tower3 and puts a lidded plate on the exchange, so every routine has something
+    to move"""
+    height = registry.sciclops_plate("96_well").height
+    simulator.towers.update(tower2=[height] * 10, tower3=[])
+    sciclops.set_tower_count("tower2", 10)
+    sciclops.set_tower_count("tower3", 0)
+    sciclops.labware["exchange"].update(howmany=1, type="96_well", has_lid=True)
+    sciclops.labware["lidnest1"]["howmany"] = 0
+
+
+def run_routine(name, time_scale=0.0, predict_tower_tops=True):
+    """Runs one routine on a fresh simulator and driver and returns its measurements"""
+    method, kwargs = ROUTINES[name]
+    simulator = SciclopsSimulator(time_scale=time_scale)
+    sciclops = SCICLOPS(
+        backend=simulator.backend, predict_tower_tops=predict_tower_tops
+    )
+    try:
+        prepare_labware(sciclops, simulator)
+        getattr(sciclops, method)(**kwargs)
+        prepare_labware(sciclops, simulator)
+
+        commands_before = len(simulator.command_log)
+        busy_before = simulator.busy_time
+        start = time.perf_counter()
+        getattr(sciclops, method)(**kwargs)
+        cycle_time = time.perf_counter() - start
+        motion_time = simulator.busy_time - busy_before
+        return {
+            "commands": len(simulator.command_log) - commands_before,
+            "cycle_time": cycle_time,
+            "motion_time": motion_time,
+            "overhead": cycle_time - motion_time,
+        }
+    finally:
+        sciclops.disconnect_robot()
+        simulator.close()
+
+
+def primitive_latencies(time_scale=0.0, predict_tower_tops=True):
+    """Returns {verb: [seconds]} of every command sent while running all routines once"""
+    latencies = defaultdict(list)
+    send = SCICLOPS.send_command
+
+    def timed(sciclops, command, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return send(sciclops, command, *args, **kwargs)
+        finally:
+            verb = command.split()[0].upper() if command.strip() else ""
+            latencies[verb].append(time.perf_counter() - start)
+
+    SCICLOPS.send_command = timed
+    try:
+        for name in ROUTINES:
+            run_routine(name, time_scale, predict_tower_tops)
+    finally:
+        SCICLOPS.send_command = send
+    return latencies
+
+
+def run_all(time_scale=0.0, predict_tower_tops=True):
+    """Runs every routine and returns {name: measurements}"""
+    return {
+        name: run_routine(name, time_scale, predict_tower_tops) for name in ROUTINES
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Returns the stored {name: {"commands": int}} baselines"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def regressions(results, baseline):
+    """Returns a message for every routine that needs more commands than its baseline"""
+    return [
+        f"{name}: {result['commands']} commands, baseline {baseline[name]['commands']}"
+        for name, result in results.items()
+        if name in baseline and result["commands"] > baseline[name]["commands"]
+    ]
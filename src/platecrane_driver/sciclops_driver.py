@@ -1,11 +1,76 @@
 """Driver for the Hudson Robotics Sciclops robot."""
 
 import asyncio
+import functools
 import re
+import time
 
 import usb.core
 import usb.util
 
+from platecrane_driver.device_state import DeviceState
+from platecrane_driver.labware_store import LabwareStore
+from platecrane_driver.resource_registry import registry
+from platecrane_driver.sciclops_monitor import CompletionMonitor
+
+SAFE_Z = 23.5188
+"""Z of the raised arm, tower picks and places start at it (unit: mm)"""
+
+TOWER_BOTTOM_Z = -421.8625
+"""Z at which the closed gripper touches the floor of an empty tower (unit: mm)"""
+
+TOWER_APPROACH = 5.0
+"""Margin above one plate over the predicted top of a tower the full speed descent into it stops at
+(unit: mm). A tower holding one plate more than its count is then only touched at low speed."""
+
+COUNT_TOLERANCE = 0.25
+"""Largest deviation of a probed tower height from a whole number of plates (unit: plate heights)
+that is still turned into a plate count"""
+
+MOTION_VERBS = frozenset(["MOVE", "JOG", "HOME", "RESET"])
+"""Commands that move the arm, the device state is BUSY while one of them runs"""
+
+REPLY_STATUS = re.compile(r"(?:^|\s)(\d{4})(?: ([^\r\n]*))?\r?$", re.MULTILINE)
+"""A status line ending a reply, e.g. '0000 Success' or '0010 Point not found'"""
+
+PLATE_SENSOR_READINGS = {
+    "1": True,
+    "TRUE": True,
+    "YES": True,
+    "0": False,
+    "FALSE": False,
+    "NO": False,
+}
+"""GETPLATEPRESENT readings and whether they mean a plate is present"""
+
+POSITION = re.compile(r"Z:([-.\d]+), R:([-.\d]+), Y:([-.\d]+), P:([-.\d]+)")
+"""The position of a GETPOS reply"""
+
+POINT_PREFIX = "W_"
+"""Prefix of the named points coalesce_moves loads for labware locations (W_neutral for neutral), so points
+taught on the Sciclops under the location names are never overwritten"""
+
+LISTED_POINT = re.compile(
+    r"([^\s:]+): Z:([-.\d]+), R:([-.\d]+), Y:([-.\d]+), P:([-.\d]+)"
+)
+"""A named point of a LISTPOINTS reply"""
+
+
+def counted_routine(routine):
+    """Records how many commands a SCICLOPS routine sent in SCICLOPS.routine_command_counts"""
+
+    @functools.wraps(routine)
+    def wrapper(self, *args, **kwargs):
+        start = self.command_count
+        try:
+            return routine(self, *args, **kwargs)
+        finally:
+            count = self.command_count - start
+            self.routine_command_counts[routine.__name__] = count
+            print(f"{routine.__name__}: {count} commands")
+
+    return wrapper
+
 
 class SCICLOPS:
     """
@@ -13,11 +78,60 @@ class SCICLOPS:
     Python interface that allows remote commands to be executed to the Sciclops.
     """
 
-    def __init__(self, VENDOR_ID=0x7513, PRODUCT_ID=0x0002):
-        """Creates a new SCICLOPS driver object. The default VENDOR_ID and PRODUCT_ID are for the Sciclops robot."""
+    def __init__(
+        self,
+        VENDOR_ID=0x7513,
+        PRODUCT_ID=0x0002,
+        first_byte_timeout=30.0,
+        inter_byte_timeout=0.5,
+        coalesce_moves=True,
+        labware_file=None,
+        backend=None,
+        predict_tower_tops=True,
+        exchange_sensor=False,
+    ):
+        """Creates a new SCICLOPS driver object. The default VENDOR_ID and PRODUCT_ID are for the Sciclops robot.
+        first_byte_timeout and inter_byte_timeout (seconds) bound replies that never send a status line,
+        see CompletionMonitor. Moves (MOTION_VERBS) wait for their status line however long the motion takes.
+        coalesce_moves makes moves to labware locations use persistent named points (one MOVE once the point
+        is loaded) and skips SETSPEED commands that do not change the speed.
+        labware_file is the path of a JSON file the labware state (plate counts, lids) is kept in across
+        restarts, see LabwareStore. Without it, the state only lives in memory.
+        backend is the pyusb backend the Sciclops is searched with, e.g. SciclopsSimulator.backend.
+        By default pyusb picks the backend of the installed libusb.
+        predict_tower_tops makes picks from and places onto towers with a known plate count descend at
+        full speed to the height computed from the count, instead of tapping the top of the tower at
+        low speed, see known_towers.
+        exchange_sensor enables get_plates and plates_to_stack with more than one plate. Between plates they
+        poll GETPLATEPRESENT, assuming it reads a plate sensor of the exchange. What the command reports on the
+        robot (exchange or gripper sensor) is not confirmed yet, so this is off by default."""
         self.VENDOR_ID = VENDOR_ID
         self.PRODUCT_ID = PRODUCT_ID
+        self.backend = backend
+        self.coalesce_moves = coalesce_moves
+        self.points = {}
+        """Named points under POINT_PREFIX known to be loaded on the Sciclops, {name: (R, Z, P, Y)}"""
+        self.speed = None
+        """Last speed set on the Sciclops, None if unknown"""
+        self.command_count = 0
+        """Number of commands sent since the driver was created"""
+        self.routine_command_counts = {}
+        """Number of commands the last run of each routine sent, {routine name: count}"""
+        self.predict_tower_tops = predict_tower_tops
+        self.exchange_sensor = exchange_sensor
+        self.known_towers = set()
+        """Towers whose plate count was measured by a tap (or set with set_tower_count) and has been
+        kept up to date by this driver since. Picks from every other tower tap the top of the tower."""
+        self.state = DeviceState()
+        """Last known state, updated from the command replies (see device_state.py)"""
         self.host_path = self.connect_sciclops()
+        self.monitor = CompletionMonitor(
+            self.host_path,
+            first_byte_timeout=first_byte_timeout,
+            inter_byte_timeout=inter_byte_timeout,
+            motion_verbs=MOTION_VERBS,
+        )
+        self.monitor.start()
         self.TEACH_PLATE = 15.0
         self.STD_FINGER_LENGTH = 17.2
         self.COMPRESSION_DISTANCE = 3.35
@@ -33,9 +147,18 @@ class SCICLOPS:
         # self.HOMEMSG = ""
         # self.OPENMSG = ""
         # self.CLOSEMSG = ""
-        self.labware = self.load_labware()
-        self.plate_info = self.load_plate_info()
+        self.labware_store = None
+        self.labware = self.load_labware(labware_file)
+        self.state.update_labware(
+            **{
+                location: info["howmany"]
+                for location, info in self.labware.items()
+                if "howmany" in info
+            }
+        )
         self.success_count = 0
+        if self.coalesce_moves:
+            self.sync_points()
         self.status = self.get_status()
         self.error = self.get_error()
         self.movement_state = "READY"
@@ -44,7 +167,9 @@ class SCICLOPS:
         """
         Connect to USB device. If wrong device, inform user
         """
-        host_path = usb.core.find(idVendor=self.VENDOR_ID, idProduct=self.PRODUCT_ID)
+        host_path = usb.core.find(
+            idVendor=self.VENDOR_ID, idProduct=self.PRODUCT_ID, backend=self.backend
+        )
 
         if host_path is None:
             raise Exception("Could not establish connection.")
@@ -55,6 +180,9 @@ class SCICLOPS:
 
     def disconnect_robot(self):
         """Disconnects from the sciclops robot."""
+        self.monitor.stop()
+        if self.labware_store:
+            self.labware_store.close()
         try:
             usb.util.dispose_resources(self.host_path)
         except Exception as err:
@@ -64,35 +192,16 @@ class SCICLOPS:
 
     def load_plate_info(self):
         """
-        hard-codes size information for any possible plates
+        Returns size information for every plate type, see sciclops_plate_resources.json
         """
-        plates = {
-            "96_well": {
-                "height": 16.2562,
-                "grab_exchange": -30,  # downward motion from Z = -356.5375
-                "grab_lid_exchange": -21,  # downward motion from Z = -356.5375
-                "grab_tower": -18,  # downward motion from 10 above top of plate
-                "grab_lid_tower": -13,
-                "grab_lid_nest": -12,
-            },
-            "pcr_plate": {
-                "height": 15.2762,
-                "grab_exchange": -28,  # from Z = -356.5375
-                "grab_lid_exchange": 0,  # downward motion from Z = -356.5375, no lid
-                "grab_tower": -17,  # downward motion from 10 above top of plate
-                "grab_lid_tower": 0,  # no lid
-                "grab_lid_nest": 0,  # no lid
-            },
-        }
-
-        return plates
+        return registry.sciclops_plates
 
     def load_labware(self, labware_file=None):
         """
         Loads plate information which affects get_plate function.
+        If a labware_file is given, the labware is loaded from and persisted to it (the defaults below
+        are used for locations it does not contain yet).
         """
-        if labware_file:
-            pass  # will load file in the future
 
         # Dictionary for plate information
         labware = {
@@ -170,36 +279,99 @@ class SCICLOPS:
             "trash": {"pos": {"Z": 23.5188, "R": 259.2688, "Y": 62.7497, "P": 98.2670}},
         }
 
+        if labware_file:
+            self.labware_store = LabwareStore(labware_file, defaults=labware)
+            return self.labware_store.labware
+
         return labware
 
-    def send_command(self, command):
+    def update_labware(self, location, **values):
         """
-        Sends provided command to Sciclops and stores data outputted by the sciclops.
+        Sets labware values of a location, persisting them if a labware file is used.
         """
+        if self.labware_store:
+            self.labware_store.update(location, **values)
+        else:
+            self.labware[location].update(values)
+        if "howmany" in values:
+            self.state.update_labware(**{location: values["howmany"]})
 
-        self.host_path.write(4, command)
-
-        response_buffer = "Write: " + command
-        msg = None
+    def send_command(self, command, timeout=None):
+        """
+        Sends provided command to Sciclops and stores data outputted by the sciclops.
+        The reply is read by the completion monitor, this returns as soon as its status line arrives
+        (or once a reply timeout of the monitor or timeout seconds expire, with whatever was read).
+        timeout defaults to 60 seconds, and to no limit for moves, whose status line only arrives once
+        the motion ended.
+        """
 
-        # Adds SciClops output to response_buffer
-        while msg != command:
-            # or "success" not in msg or "error" in msg
-            try:
-                response = self.host_path.read(0x83, 200, timeout=5000)
-            except Exception:
-                break
-            msg = "".join(chr(i) for i in response)
-            response_buffer = response_buffer + "Read: " + msg
+        verb = command.split(" ", 1)[0].strip("\r\n").upper()
+        if verb in MOTION_VERBS:
+            self.state.update(movement_state="BUSY")
+        elif timeout is None:
+            timeout = 60
+        response_buffer = self.monitor.send(command, timeout=timeout)
+        self.command_count += 1
 
         print(response_buffer)
 
         self.success_count = self.success_count + response_buffer.count("0000 Success")
 
         self.get_error(response_buffer)
+        self.observe_reply(command.strip("\r\n"), verb, response_buffer)
 
         return response_buffer
 
+    def observe_reply(self, command, verb, response_buffer):
+        """
+        Updates the device state from the reply to a command (see device_state.py).
+        The pose is known after GETPOS and after a MOVE to a point loaded by this driver, and unknown
+        after a JOG (probing jogs stop early) or HOME.
+        """
+        status_lines = REPLY_STATUS.findall(response_buffer or "")
+        if not status_lines:
+            return
+        code, message = status_lines[-1]
+        if code != "0000":
+            self.state.update(
+                movement_state="ERROR", last_error=f"{command}: {code} {message}"
+            )
+            return
+
+        values = {}
+        if verb in MOTION_VERBS:
+            values["movement_state"] = "READY"
+            point = (
+                self.points.get(command.split(" ", 1)[-1]) if verb == "MOVE" else None
+            )
+            values["pose"] = (
+                None if point is None else [point[1], point[0], point[3], point[2]]
+            )
+        elif verb == "GETPOS":
+            position = POSITION.search(response_buffer)
+            values["pose"] = (
+                None
+                if position is None
+                else [float(value) for value in position.groups()]
+            )
+        elif verb in ("OPEN", "CLOSE"):
+            values["gripper"] = "open" if verb == "OPEN" else "closed"
+        elif verb == "SETSPEED":
+            values["speed"] = int(command.split()[1])
+        elif verb == "STATUS":
+            values["status"] = message
+        if values:
+            self.state.update(**values)
+
+    def refresh_state(self):
+        """
+        Reads the status and the position of the Sciclops, updating the device state.
+        Returns the snapshot of the device state.
+        """
+        self.get_status()
+        self.get_position()
+        return self.state.snapshot()
+
     def get_error(self, response_buffer=None):
         """
         Gets error message from the feedback.
@@ -231,6 +403,7 @@ class SCICLOPS:
         R: Base turning axis
         Y: Extension axis
         P: Gripper turning axis
+        Returns the position [Z, R, Y, P], None if the reply holds none.
         """
 
         command = "GETPOS\r\n"  # Command interpreted by Sciclops
@@ -249,7 +422,8 @@ class SCICLOPS:
 
             print(self.current_pos)
         except Exception:
-            pass
+            return None
+        return self.current_pos
 
     def get_status(self):
         """
@@ -333,6 +507,7 @@ class SCICLOPS:
 
         command = "RESET\r\n"  # Command interpreted by Sciclops
         out_msg = self.send_command(command)
+        self.speed = None
 
         try:
             # Checks if specified format is found in feedback
@@ -426,6 +601,7 @@ class SCICLOPS:
         except Exception:
             pass
 
+    @counted_routine
     def home(self, axis=""):
         """
         Homes all of the axes. Returns to neutral position (above exchange)
@@ -434,6 +610,7 @@ class SCICLOPS:
         # Moves axes to home position
         command = "HOME\r\n"  # Command interpreted by Sciclops
         out_msg = self.send_command(command)
+        self.speed = None
 
         try:
             # Checks if specified format is found in feedback
@@ -547,17 +724,22 @@ class SCICLOPS:
 
     def set_speed(self, speed):
         """
-        Changes speed of Sciclops
+        Changes speed of Sciclops. Does nothing if coalesce_moves is set and the speed is unchanged.
         """
 
+        if self.coalesce_moves and speed == self.speed:
+            return
+
         command = "SETSPEED %d\r\n" % speed  # Command interpreted by Sciclops
         out_msg = self.send_command(command)
+        self.speed = None
 
         try:
             # Checks if specified format is found in feedback
             exp = r"0000 (.*\w)"  # Format of feedback that indicates success message
             set_speed_msg = re.search(exp, out_msg)
             self.SETSPEEDMSG = set_speed_msg[1]
+            self.speed = speed
             print(self.SETSPEEDMSG)
         except Exception:
             pass
@@ -598,19 +780,23 @@ class SCICLOPS:
         except Exception:
             pass
 
-    def loadpoint(self, R, Z, P, Y):
+    def loadpoint(self, R, Z, P, Y, name=None):
         """
-        Adds point to listpoints function
+        Adds point to listpoints function. The point is named "R:<R>" unless a name is given.
         """
 
-        command = "LOADPOINT R:%s, Z:%s, P:%s, Y:%s, R:%s\r\n" % (
-            R,
+        if name is None:
+            name = "R:%s" % R
+        command = "LOADPOINT %s, Z:%s, P:%s, Y:%s, R:%s\r\n" % (
+            name,
             Z,
             P,
             Y,
             R,
         )  # Command interpreted by Sciclops
         out_msg = self.send_command(command)
+        if "0000" in out_msg:
+            self.points[name] = (R, Z, P, Y)
         try:
             # Checks if specified format is found in feedback
             loadpoint_msg_index = out_msg.find(
@@ -620,13 +806,16 @@ class SCICLOPS:
         except Exception:
             pass
 
-    def deletepoint(self, R, Z, P, Y):
+    def deletepoint(self, R, Z, P, Y, name=None):
         """
-        Deletes point from listpoints function
+        Deletes point from listpoints function. The point is named "R:<R>" unless a name is given.
         """
 
-        command = "DELETEPOINT R:%s\r\n" % R  # Command interpreted by Sciclops
+        if name is None:
+            name = "R:%s" % R
+        command = "DELETEPOINT %s\r\n" % name  # Command interpreted by Sciclops
         out_msg = self.send_command(command)
+        self.points.pop(name, None)
         try:
             # Checks if specified format is found in feedback
             deletepoint_msg_index = out_msg.find(
@@ -636,9 +825,60 @@ class SCICLOPS:
         except Exception:
             pass
 
+    def sync_points(self):
+        """
+        Reads the points under POINT_PREFIX from LISTPOINTS into self.points, so points a previous run
+        loaded are moved to without loading them again, and stale ones are reloaded before their first use.
+        Points whose line cannot be parsed are left out and reloaded as well.
+        """
+
+        out_msg = self.send_command("LISTPOINTS\r\n")
+        self.points = {
+            match[1]: tuple(float(match[group]) for group in (3, 2, 5, 4))
+            for match in LISTED_POINT.finditer(out_msg or "")
+            if match[1].startswith(POINT_PREFIX)
+        }
+
+    def point_name(self, R, Z, P, Y):
+        """
+        Returns the named point (POINT_PREFIX and the labware location) at the specified coordinates,
+        None if there is no labware location there
+        """
+
+        for name, info in self.labware.items():
+            pos = info["pos"]
+            if (pos["R"], pos["Z"], pos["P"], pos["Y"]) == (R, Z, P, Y):
+                return POINT_PREFIX + name
+        return None
+
     def move(self, R, Z, P, Y):
         """
-        Moves to specified coordinates
+        Moves to specified coordinates.
+        With coalesce_moves, a labware location is kept loaded as a named point, so moving there again
+        is a single MOVE instead of LOADPOINT, MOVE and DELETEPOINT.
+        """
+
+        name = self.point_name(R, Z, P, Y) if self.coalesce_moves else None
+        if name is None:
+            self.move_temporary(R, Z, P, Y)
+            return
+
+        if self.points.get(name) != (R, Z, P, Y):
+            self.loadpoint(R, Z, P, Y, name=name)
+
+        out_msg_move = self.send_command("MOVE %s\r\n" % name)
+        try:
+            # Checks if specified format is found in feedback
+            move_msg_index = out_msg_move.find(
+                "0000"
+            )  # Format of feedback that indicates success message
+            self.MOVEMSG = out_msg_move[move_msg_index + 4 :]
+        except Exception:
+            pass
+
+    def move_temporary(self, R, Z, P, Y):
+        """
+        Moves to specified coordinates through a temporary point
         """
 
         self.loadpoint(R, Z, P, Y)
@@ -670,6 +910,7 @@ class SCICLOPS:
             self.labware[loc]["pos"]["Y"],
         )
 
+    @counted_routine
     def get_plate(self, location, remove_lid=False, trash=False):
         """
         Grabs plate and places on exchange. Paramater is the stack that the Sciclops is requested to remove the plate from.
@@ -682,50 +923,45 @@ class SCICLOPS:
         # if self.labware['exchange']['howmany'] != 0:
         #     print("PLATE ALREADY ON THE EXCHANGE")
         # else:
-        tower_info = self.labware[location]
-        plate_type = tower_info["type"]
+        self.clear_arm()
+        self.tower_to_exchange(location, remove_lid=remove_lid, trash=trash)
 
-        # Move arm up and to neutral position to avoid hitting any objects
+        # Move back to neutral
+        self.move_loc("neutral")
+
+    def clear_arm(self):
+        """
+        Retracts and raises the arm at low speed and moves it to the neutral position, to avoid hitting any objects
+        """
         self.open()
-        self.set_speed(10)  #
+        self.set_speed(10)
         self.jog("Y", -1000)
         self.jog("Z", 1000)
         self.set_speed(12)
-        self.move(
-            R=self.labware["neutral"]["pos"]["R"],
-            Z=23.5188,
-            P=self.labware["neutral"]["pos"]["P"],
-            Y=self.labware["neutral"]["pos"]["Y"],
-        )
+        self.move_loc("neutral")
 
-        # check coordinates
-        asyncio.run(self.check_complete_loop())
+    def tower_to_exchange(self, location, remove_lid=False, trash=False):
+        """
+        Moves the top plate of a tower onto the exchange, starting with the arm raised and ending above the exchange
+        (or at neutral if the lid was removed). See get_plate for the arguments.
+        """
+        tower_info = self.labware[location]
 
         # Move above desired tower
         self.set_speed(100)
         self.move(
             R=tower_info["pos"]["R"],
-            Z=23.5188,
+            Z=SAFE_Z,
             P=tower_info["pos"]["P"],
             Y=tower_info["pos"]["Y"],
         )
-        # check coordinates
-        asyncio.run(self.check_complete_loop())
 
         # Remove plate from tower
-        self.close()
-        self.set_speed(15)
-        self.jog("Z", -1000)
-        # move up certain amount
-        self.jog("Z", 10)
-        self.open()
-        grab_height = self.plate_info[plate_type]["grab_tower"]
-        self.jog("Z", grab_height)
+        if not self.grab_predicted(location):
+            self.grab_probing(location)
         self.close()
         self.set_speed(100)
         self.jog("Z", 1000)
-        # check coordinates
-        # asyncio.run(self.check_complete_loop())
 
         # Place in exchange
         self.move(
@@ -734,39 +970,122 @@ class SCICLOPS:
             P=self.labware["exchange"]["pos"]["P"],
             Y=self.labware["exchange"]["pos"]["Y"],
         )
-        # check coordinates
-        # asyncio.run(self.check_complete_loop())
         self.jog("Z", -380)
         self.set_speed(5)
         self.jog("Z", -30)
         self.open()
         self.set_speed(100)
         self.jog("Z", 1000)
-        # check coordinates
-        # asyncio.run(self.check_complete_loop())
-        self.labware["exchange"]["howmany"] += 1
-        self.labware["exchange"]["type"] = self.labware[location]["type"]
-        self.labware["exchange"]["size"] = self.labware[location]["size"]
-        self.labware["exchange"]["has_lid"] = self.labware[location]["has_lid"]
+        self.update_labware(
+            "exchange",
+            howmany=self.labware["exchange"]["howmany"] + 1,
+            type=self.labware[location]["type"],
+            size=self.labware[location]["size"],
+            has_lid=self.labware[location]["has_lid"],
+        )
 
         # check if lid needs to be removed
         if remove_lid:
             self.remove_lid(trash=trash)
         else:
-            self.labware["exchange"]["has_lid"] = True
+            self.update_labware("exchange", has_lid=True)
 
-        # Move back to neutral
-        self.move(
-            R=self.labware["neutral"]["pos"]["R"],
-            Z=23.5188,
-            P=self.labware["neutral"]["pos"]["P"],
-            Y=self.labware["neutral"]["pos"]["Y"],
+        # update labware
+        self.update_labware(location, howmany=self.labware[location]["howmany"] - 1)
+
+    def tower_known(self, tower):
+        """
+        True if the top of a tower is computed from its plate count instead of tapped
+        """
+        return (
+            self.predict_tower_tops
+            and tower in self.known_towers
+            and self.labware[tower]["howmany"] > 0
         )
-        # check coordinates
-        # asyncio.run(self.check_complete_loop())
 
-        # update labware
-        self.labware[location]["howmany"] -= 1
+    def tower_top_z(self, tower, howmany=None):
+        """
+        Returns the Z at which the closed gripper touches the top of a tower of howmany plates
+        (by default its labware count), from the height of its plate type
+        """
+        if howmany is None:
+            howmany = self.labware[tower]["howmany"]
+        plate_height = registry.sciclops_plate(self.labware[tower]["type"]).height
+        return TOWER_BOTTOM_Z + plate_height * howmany
+
+    def set_tower_count(self, tower, howmany):
+        """
+        Sets the plate count of a tower and trusts it, so picks from the tower skip the tap
+        """
+        if howmany < 0:
+            raise Exception(f"Invalid plate count {howmany} for {tower}")
+        self.update_labware(tower, howmany=howmany)
+        self.known_towers.add(tower)
+
+    def measure_tower(self, tower, contact_z):
+        """
+        Sets the plate count of a tower from the Z a tap touched its top at and returns it.
+        Returns None and stops trusting the count if the height is not close to a whole number of plates.
+        """
+        plate_height = registry.sciclops_plate(self.labware[tower]["type"]).height
+        plates = (contact_z - TOWER_BOTTOM_Z) / plate_height
+        howmany = round(plates)
+        if howmany < 0 or abs(plates - howmany) > COUNT_TOLERANCE:
+            print(f"{tower}: tapped height {contact_z} is no whole plate count")
+            self.known_towers.discard(tower)
+            return None
+        if howmany != self.labware[tower]["howmany"]:
+            print(f"{tower}: {howmany} plates, not {self.labware[tower]['howmany']}")
+        self.update_labware(tower, howmany=howmany)
+        self.known_towers.add(tower)
+        return howmany
+
+    def grab_probing(self, tower):
+        """
+        Taps the top plate of a tower at low speed with the closed gripper and lowers the open gripper
+        around it, starting with the arm raised above the tower. The tapped height updates the plate count.
+        """
+        self.close()
+        self.set_speed(15)
+        self.jog("Z", -1000)
+        position = self.get_position()
+        if position is not None:
+            self.measure_tower(tower, position[0])
+        # move up certain amount
+        self.jog("Z", 10)
+        self.open()
+        grab_height = registry.sciclops_plate(self.labware[tower]["type"]).grab_tower
+        self.jog("Z", grab_height)
+
+    def grab_predicted(self, tower):
+        """
+        Lowers the open gripper around the top plate of a tower with a known plate count, at full speed to
+        one plate height plus TOWER_APPROACH above the predicted top and at low speed for the rest, starting
+        with the arm raised above the tower. Returns False (with the arm raised again) if the tower count is not known or the
+        descent stopped short, the tower is higher than its count then.
+        """
+        if not self.tower_known(tower):
+            return False
+        plate = registry.sciclops_plate(self.labware[tower]["type"])
+        # The tap stops on the top plate, jogs 10 up and then grab_tower down
+        grip_z = self.tower_top_z(tower) + 10 + plate.grab_tower
+        # JOG takes whole millimeters. An extra plate would end below the fast descent.
+        fast = round(self.tower_top_z(tower) + plate.height + TOWER_APPROACH - SAFE_Z)
+        slow = round(grip_z - SAFE_Z - fast)
+        self.open()
+        self.set_speed(100)
+        self.jog("Z", fast)
+        self.set_speed(15)
+        self.jog("Z", slow)
+        position = self.get_position()
+        if position is not None and abs(position[0] - (SAFE_Z + fast + slow)) < 1:
+            return True
+
+        print(f"{tower}: descent stopped at {position}, tapping the tower")
+        self.known_towers.discard(tower)
+        self.set_speed(100)
+        self.jog("Z", 1000)
+        return False
 
     def limp(self, limp_bool):
         """
@@ -814,20 +1133,13 @@ class SCICLOPS:
         """Check a stack to see if there's room for another plate, returns True if there is room, False if not."""
         # save z height of stack Z = -36
         tower_z_height = -50
-        tower_z_bottom = -421.8625
-        # get type of plate in desired tower
-        plate_type = self.labware[tower]["type"]
-        # get height of plate type
-        plate_height = self.plate_info[plate_type]["height"]
-        # number of plates in stack
-        num_stack = self.labware[tower]["howmany"]
-        total_height = plate_height * num_stack
-        remaining = total_height + tower_z_bottom
+        remaining = self.tower_top_z(tower)
         if remaining < tower_z_height:  # room for another plate
             return True
         else:  # stack full
             return False
 
+    @counted_routine
     def remove_lid(self, trash):
         """Remove lid, (self, lidnest, plate_type), removes lid from plate in exchange, trash bool will throw lid into trash"""
         #  move above plate exchange
@@ -839,8 +1151,6 @@ class SCICLOPS:
             P=self.labware["exchange"]["pos"]["P"],
             Y=self.labware["exchange"]["pos"]["Y"],
         )
-        # check coordinates
-        asyncio.run(self.check_complete_loop())
         plate_type = self.labware["exchange"]["type"]
 
         # check to make sure plate has lid
@@ -850,14 +1160,12 @@ class SCICLOPS:
             # remove lid
             self.jog("Z", -380)
             self.set_speed(7)
-            lid_height = self.plate_info[plate_type]["grab_lid_exchange"]
+            lid_height = registry.sciclops_plate(plate_type).grab_lid_exchange
             self.jog("Z", lid_height)
             self.close()
 
             self.set_speed(100)
             self.jog("Z", 1000)
-            # check coordinates
-            asyncio.run(self.check_complete_loop())
 
             if trash:
                 # move above trash
@@ -867,7 +1175,6 @@ class SCICLOPS:
                     P=self.labware["trash"]["pos"]["P"],
                     Y=self.labware["trash"]["pos"]["Y"],
                 )
-                asyncio.run(self.check_complete_loop())
 
                 # drop in trash
                 self.jog("Z", -400)
@@ -881,11 +1188,9 @@ class SCICLOPS:
                     P=self.labware["neutral"]["pos"]["P"],
                     Y=self.labware["neutral"]["pos"]["Y"],
                 )
-                # check coordinates
-                asyncio.run(self.check_complete_loop())
 
                 # update labware
-                self.labware["exchange"]["has_lid"] = False
+                self.update_labware("exchange", has_lid=False)
             else:
                 # find empty plate nest
                 lid_nest = self.check_for_empty_nest()
@@ -897,15 +1202,11 @@ class SCICLOPS:
                     P=self.labware[lid_nest]["pos"]["P"],
                     Y=self.labware[lid_nest]["pos"]["Y"],
                 )
-                # check coordinates
-                asyncio.run(self.check_complete_loop())
 
                 # place in lid nest
                 self.jog("Z", -400)
                 self.open()
                 self.jog("Z", 1000)
-                # check coordinates
-                asyncio.run(self.check_complete_loop())
 
                 # return to home
                 self.move(
@@ -914,14 +1215,16 @@ class SCICLOPS:
                     P=self.labware["neutral"]["pos"]["P"],
                     Y=self.labware["neutral"]["pos"]["Y"],
                 )
-                # check coordinates
-                asyncio.run(self.check_complete_loop())
 
                 # update labware dict
-                self.labware[lid_nest]["howmany"] += 1
-                self.labware[lid_nest]["type"] = self.labware["exchange"]["type"]
-                self.labware["exchange"]["has_lid"] = False
+                self.update_labware(
+                    lid_nest,
+                    howmany=self.labware[lid_nest]["howmany"] + 1,
+                    type=self.labware["exchange"]["type"],
+                )
+                self.update_labware("exchange", has_lid=False)
 
+    @counted_routine
     def replace_lid(self):
         """Plate on exchange, replace lid (self, plateinfo, lidnest)"""
         # find a lid
@@ -941,8 +1244,6 @@ class SCICLOPS:
                 P=self.labware[lid_nest]["pos"]["P"],
                 Y=self.labware[lid_nest]["pos"]["Y"],
             )
-            # check coordinates
-            asyncio.run(self.check_complete_loop())
 
             # grab lid
             self.close()
@@ -951,12 +1252,11 @@ class SCICLOPS:
             self.jog("Z", -1000)
             self.jog("Z", 10)
             self.open()
-            lid_height = self.plate_info[plate_type]["grab_lid_nest"]
+            lid_height = registry.sciclops_plate(plate_type).grab_lid_nest
             self.jog("Z", lid_height)
             self.close()
             self.set_speed(100)
             self.jog("Z", 1000)
-            asyncio.run(self.check_complete_loop())
 
             # move above exchange
             self.move(
@@ -965,14 +1265,11 @@ class SCICLOPS:
                 P=self.labware["exchange"]["pos"]["P"],
                 Y=self.labware["exchange"]["pos"]["Y"],
             )
-            # check coordinates
-            asyncio.run(self.check_complete_loop())
 
             # place lid onto plate
             self.jog("Z", -400)
             self.open()
             self.jog("Z", 1000)
-            asyncio.run(self.check_complete_loop())
 
             # return to home
             self.move(
@@ -981,86 +1278,189 @@ class SCICLOPS:
                 P=self.labware["neutral"]["pos"]["P"],
                 Y=self.labware["neutral"]["pos"]["Y"],
             )
-            # check coordinates
-            asyncio.run(self.check_complete_loop())
 
             # update labware dict
-            self.labware[lid_nest]["howmany"] -= 1
-            self.labware["exchange"]["has_lid"] = True
+            self.update_labware(lid_nest, howmany=self.labware[lid_nest]["howmany"] - 1)
+            self.update_labware("exchange", has_lid=True)
 
+    @counted_routine
     def plate_to_stack(self, tower, add_lid):
         """Plate from exchange to stack (self, tower, plateinfo)"""
-        # Move arm up and to neutral position to avoid hitting any objects
-        self.open()
-        self.set_speed(10)
-        self.jog("Y", -1000)
-        self.jog("Z", 1000)
-        self.set_speed(12)
-        self.move(
-            R=self.labware["neutral"]["pos"]["R"],
-            Z=23.5188,
-            P=self.labware["neutral"]["pos"]["P"],
-            Y=self.labware["neutral"]["pos"]["Y"],
-        )
-        asyncio.run(self.check_complete_loop())
-        plate_type = self.labware["exchange"]["type"]
+        self.clear_arm()
         if add_lid:
             self.check_for_lid()
             self.replace_lid()
 
         # TODO: check to see if given stack is full, use function to account for different labware, maybe checks all stacks to find one with same labware?
 
+        self.exchange_to_tower(tower)
+
+        # move to home
+        self.move_loc("neutral")
+
+    def exchange_to_tower(self, tower):
+        """
+        Moves the plate on the exchange onto a tower, starting with the arm raised and ending above the tower
+        """
+        plate_type = self.labware["exchange"]["type"]
+
         # move over exchange
         self.open()
-        self.move(
-            R=self.labware["exchange"]["pos"]["R"],
-            Z=23.5188,
-            P=self.labware["exchange"]["pos"]["P"],
-            Y=self.labware["exchange"]["pos"]["Y"],
-        )
-        # check coordinates
-        asyncio.run(self.check_complete_loop())
+        self.move_loc("exchange")
         # grab plate
         self.set_speed(100)
         self.jog("Z", -380)
-        grab_height = self.plate_info[plate_type]["grab_exchange"]
+        grab_height = registry.sciclops_plate(plate_type).grab_exchange
         self.jog("Z", grab_height)
         self.close()
         self.set_speed(100)
         self.jog("Z", 1000)
-        asyncio.run(self.check_complete_loop())
 
         # move above tower, place plate in tower
-        self.move(
-            R=self.labware[tower]["pos"]["R"],
-            Z=23.5188,
-            P=self.labware[tower]["pos"]["P"],
-            Y=self.labware[tower]["pos"]["Y"],
-        )
-        # check coordinates
-        asyncio.run(self.check_complete_loop())
+        self.move_loc(tower)
+        if self.predict_tower_tops and tower in self.known_towers:
+            # The held plate lands below the top of the tower with it, the rest is found at low speed.
+            # The fast descent stops one plate higher, an extra plate would end below it.
+            height = registry.sciclops_plate(plate_type).height
+            landing_z = self.tower_top_z(tower) + height
+            self.jog("Z", round(landing_z + height + TOWER_APPROACH - SAFE_Z))
         self.set_speed(10)
         self.jog("Z", -1000)
         self.open()
         self.set_speed(100)
         self.jog("Z", 1000)
-        # check coordinates
-        asyncio.run(self.check_complete_loop())
 
-        # move to home
-        self.move(
-            R=self.labware["neutral"]["pos"]["R"],
-            Z=23.5188,
-            P=self.labware["neutral"]["pos"]["P"],
-            Y=self.labware["neutral"]["pos"]["Y"],
+        # update labware dict
+        self.update_labware("exchange", howmany=self.labware["exchange"]["howmany"] - 1)
+        self.update_labware(tower, howmany=self.labware[tower]["howmany"] + 1)
+
+    def plate_present(self):
+        """
+        Returns True if the exchange plate sensor reports a plate (GETPLATEPRESENT).
+        Raises an exception if the reply is not one of PLATE_SENSOR_READINGS, so an unknown reply is
+        never taken for an empty exchange.
+        """
+        out_msg = self.send_command("GETPLATEPRESENT\r\n")
+        present_msg = re.search(r"0000 (.*\w)", out_msg)
+        reading = present_msg[1].split()[-1].upper() if present_msg else None
+        if reading not in PLATE_SENSOR_READINGS:
+            raise Exception(f"Unrecognized GETPLATEPRESENT reply: {out_msg!r}")
+        return PLATE_SENSOR_READINGS[reading]
+
+    def wait_for_exchange(self, occupied, timeout=600, poll_interval=1.0):
+        """
+        Polls the exchange plate sensor until it reports a plate (occupied=True) or no plate (occupied=False).
+        Returns False if that did not happen within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while self.plate_present() != occupied:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    @counted_routine
+    def get_plates(
+        self,
+        location,
+        count,
+        remove_lid=False,
+        trash=False,
+        exchange_timeout=600,
+        on_plate=None,
+    ):
+        """
+        Moves count plates from a tower onto the exchange, one at a time (see get_plate for the other arguments).
+        The arm is cleared once for the whole batch. Between plates it parks at neutral at full speed and waits
+        (at most exchange_timeout seconds) until the exchange is empty again, then goes straight to the tower.
+        Returns the timing of every plate moved, each is also passed to on_plate as soon as the plate is placed.
+        The batch stops early if the exchange is not cleared in time.
+        """
+        return self._run_batch(
+            count,
+            exchange_occupied=False,
+            exchange_timeout=exchange_timeout,
+            on_plate=on_plate,
+            move_plate=lambda: self.tower_to_exchange(
+                location, remove_lid=remove_lid, trash=trash
+            ),
+            remaining=lambda: self.labware[location]["howmany"],
         )
-        # check coordinates
-        asyncio.run(self.check_complete_loop())
 
-        # update labware dict
-        self.labware["exchange"]["howmany"] -= 1
-        self.labware[tower]["howmany"] += 1
+    @counted_routine
+    def plates_to_stack(
+        self, tower, count, add_lid=False, exchange_timeout=600, on_plate=None
+    ):
+        """
+        Moves count plates from the exchange onto a tower, one at a time (see plate_to_stack for the other arguments).
+        Before every plate but the first, waits (at most exchange_timeout seconds) until a new plate is on the exchange.
+        Returns the per-plate timings like get_plates.
+        """
+
+        def move_plate():
+            if add_lid:
+                self.check_for_lid()
+                self.replace_lid()
+            self.exchange_to_tower(tower)
+
+        return self._run_batch(
+            count,
+            exchange_occupied=True,
+            exchange_timeout=exchange_timeout,
+            on_plate=on_plate,
+            move_plate=move_plate,
+            remaining=lambda: self.labware[tower]["howmany"],
+        )
 
+    def _run_batch(
+        self,
+        count,
+        exchange_occupied,
+        exchange_timeout,
+        on_plate,
+        move_plate,
+        remaining,
+    ):
+        """
+        Runs move_plate count times, waiting for the exchange sensor to report exchange_occupied between plates.
+        Raises an exception for more than one plate unless exchange_sensor is set.
+        """
+        if count > 1 and not self.exchange_sensor:
+            raise Exception(
+                "Batches of more than one plate need exchange_sensor, GETPLATEPRESENT is not confirmed "
+                "to read the exchange sensor"
+            )
+        timings = []
+        self.clear_arm()
+        for plate in range(count):
+            start = time.monotonic()
+            wait_seconds = 0.0
+            if plate:
+                self.move_loc("neutral")
+                if not self.wait_for_exchange(
+                    exchange_occupied, timeout=exchange_timeout
+                ):
+                    print(
+                        f"Exchange not ready after {exchange_timeout} s, stopping after {plate} plates"
+                    )
+                    break
+                wait_seconds = time.monotonic() - start
+            move_plate()
+            timing = {
+                "plate": plate + 1,
+                "seconds": time.monotonic() - start,
+                "wait_seconds": wait_seconds,
+                "remaining": remaining(),
+            }
+            print(f"Plate {plate + 1}/{count} done: {timing}")
+            timings.append(timing)
+            if on_plate:
+                on_plate(timing)
+
+        self.move_loc("neutral")
+        return timings
+
+    @counted_routine
     def lidnest_to_trash(self, lidnest):
         """Remove lid from lidnest, throw away"""
         # Move arm up and to neutral position to avoid hitting any objects
@@ -1075,7 +1475,6 @@ class SCICLOPS:
             P=self.labware["neutral"]["pos"]["P"],
             Y=self.labware["neutral"]["pos"]["Y"],
         )
-        asyncio.run(self.check_complete_loop())
         # check to make sure lid present
         if self.labware[lidnest]["howmany"] >= 1:  # lid in nest
             lid_type = self.labware[lidnest]["type"]
@@ -1088,7 +1487,6 @@ class SCICLOPS:
                 P=self.labware[lidnest]["pos"]["P"],
                 Y=self.labware[lidnest]["pos"]["Y"],
             )
-            asyncio.run(self.check_complete_loop())
 
             # grab lid
             self.jog("Z", -380)
@@ -1096,12 +1494,11 @@ class SCICLOPS:
             self.jog("Z", -1000)
             self.jog("Z", 10)
             self.open()
-            lid_height = self.plate_info[lid_type]["grab_lid_nest"]
+            lid_height = registry.sciclops_plate(lid_type).grab_lid_nest
             self.jog("Z", lid_height)
             self.close()
             self.set_speed(100)
             self.jog("Z", 1000)
-            asyncio.run(self.check_complete_loop())
 
             # move above trash
             self.move(
@@ -1110,13 +1507,11 @@ class SCICLOPS:
                 P=self.labware["trash"]["pos"]["P"],
                 Y=self.labware["trash"]["pos"]["Y"],
             )
-            asyncio.run(self.check_complete_loop())
 
             # drop lid
             self.jog("Z", -1000)
             self.open()
             self.jog("Z", 1000)
-            asyncio.run(self.check_complete_loop())
 
             # back to neutral
             self.move(
@@ -1125,14 +1520,14 @@ class SCICLOPS:
                 P=self.labware["neutral"]["pos"]["P"],
                 Y=self.labware["neutral"]["pos"]["Y"],
             )
-            asyncio.run(self.check_complete_loop())
 
             # update labware
-            self.labware[lidnest]["howmany"] -= 1
+            self.update_labware(lidnest, howmany=self.labware[lidnest]["howmany"] - 1)
 
         else:
             print("NO LID IN NEST")
 
+    @counted_routine
     def plate_to_trash(self, add_lid):
         """Remove plate from exchange, throw away"""
         # Move arm up and to neutral position to avoid hitting any objects
@@ -1147,7 +1542,6 @@ class SCICLOPS:
             P=self.labware["neutral"]["pos"]["P"],
             Y=self.labware["neutral"]["pos"]["Y"],
         )
-        asyncio.run(self.check_complete_loop())
         # check if plate is present
         if self.labware["exchange"]["howmany"] >= 1:
             # check if add_lid is true, if yes, add lid
@@ -1165,17 +1559,15 @@ class SCICLOPS:
                 P=self.labware["exchange"]["pos"]["P"],
                 Y=self.labware["exchange"]["pos"]["Y"],
             )
-            asyncio.run(self.check_complete_loop())
 
             # grab plate
             self.jog("Z", -380)
             self.set_speed(7)
-            grab_height = self.plate_info[plate_type]["grab_plate_exchange"]
+            grab_height = registry.sciclops_plate(plate_type).grab_exchange
             self.jog("Z", grab_height)
             self.close()
             self.set_speed(100)
             self.jog("Z", 1000)
-            asyncio.run(self.check_complete_loop())
 
             # move over trash
             self.move(
@@ -1184,13 +1576,11 @@ class SCICLOPS:
                 P=self.labware["trash"]["pos"]["P"],
                 Y=self.labware["trash"]["pos"]["Y"],
             )
-            asyncio.run(self.check_complete_loop())
 
             # drop plate
             self.jog("Z", -1000)
             self.open()
             self.jog("Z", 1000)
-            asyncio.run(self.check_complete_loop())
 
             # back to neutral
             self.move(
@@ -1199,10 +1589,11 @@ class SCICLOPS:
                 P=self.labware["neutral"]["pos"]["P"],
                 Y=self.labware["neutral"]["pos"]["Y"],
             )
-            asyncio.run(self.check_complete_loop())
 
             # update labware
-            self.labware["exchange"]["howmany"] -= 1
+            self.update_labware(
+                "exchange", howmany=self.labware["exchange"]["howmany"] - 1
+            )
 
         else:
             print("NO PLATE IN EXCHANGE")
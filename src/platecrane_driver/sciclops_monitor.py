@@ -0,0 +1,262 @@
+"""Completion monitor for the Sciclops USB link.
+
+A single reader thread owns the Sciclops reply endpoint. Every command written through the monitor
+gets a future, which the reader resolves when the command's final status frame ('0000 Success',
+or any other 4 digit status line) arrives. Waiting for a move therefore costs no extra STATUS
+transactions and no event loop setup.
+
+Endpoint packets are read into a preallocated FrameBuffer and split into lines on CR/LF in place.
+A reply without a status line is bounded by two timeouts instead of the full command timeout:
+first_byte_timeout until the first reply line arrives, inter_byte_timeout after the last one.
+Motion commands (motion_verbs) get no first_byte_timeout: the Sciclops only echoes them until the
+motion ends, and a reply cut off early would leave its late status line to the next command.
+"""
+
+import array
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import usb.core
+
+STATUS_LINE = re.compile(r"^\s*\d{4}(?:\s|$)")
+"""A final status line, e.g. '0000 Success' or an error status"""
+
+LINE_END = re.compile(rb"[\r\n]")
+"""Line terminators of the reply stream"""
+
+
+class FrameBuffer:
+    """Preallocated receive buffer that splits the reply stream into lines without copying it"""
+
+    def __init__(self, size: int = 4096):
+        """Creates a buffer of the given size (unit: bytes), it only grows for longer lines"""
+        self.buffer = bytearray(size)
+        self.start = 0
+        """Offset of the first byte not yet returned as a line"""
+        self.end = 0
+        """Offset after the last received byte"""
+
+    def append(self, packet, length: int) -> None:
+        """Copies the first length bytes of a received packet into the buffer"""
+        if self.end + length > len(self.buffer):
+            # Move the partial line to the front, grow only if it still does not fit
+            pending = self.end - self.start
+            self.buffer[:pending] = self.buffer[self.start : self.end]
+            self.start, self.end = 0, pending
+            if pending + length > len(self.buffer):
+                self.buffer.extend(bytes(pending + length - len(self.buffer)))
+        with memoryview(packet) as view:
+            self.buffer[self.end : self.end + length] = view[:length]
+        self.end += length
+
+    def lines(self):
+        """Yields every complete, non-empty line, decoded and without its line ending"""
+        while True:
+            match = LINE_END.search(self.buffer, self.start, self.end)
+            if match is None:
+                return
+            start, self.start = self.start, match.end()
+            if match.start() > start:
+                with memoryview(self.buffer)[start : match.start()] as line:
+                    yield str(line, "utf-8", "replace")
+
+
+class PendingCommand:
+    """A command written to the Sciclops whose reply has not completed yet"""
+
+    def __init__(self, command: str, first_byte_timeout: float = None):
+        """Creates a pending command with an unresolved future. first_byte_timeout None waits for the
+        first reply line without a limit."""
+        self.command = command
+        self.first_byte_timeout = first_byte_timeout
+        self.echo = command.strip("\r\n")
+        self.lines = []
+        self.future = Future()
+        self.sent_time = time.monotonic()
+        self.last_reply_time = None
+        """Time the last reply line (not the echo) arrived"""
+
+    def response(self) -> str:
+        """Returns the reply in the format of SCICLOPS.send_command"""
+        return (
+            "Write: "
+            + self.command
+            + "".join(f"Read: {line}\r\n" for line in self.lines)
+        )
+
+
+class CompletionMonitor:
+    """Writes Sciclops commands and resolves their futures from a dedicated reader thread
+
+    Reply lines are assigned to the oldest pending command, except for the echo of a command, which
+    belongs to that command (or is dropped if the command already completed). A command completes
+    on its status line, or when one of the timeouts described in the module docstring expires.
+    """
+
+    def __init__(
+        self,
+        device,
+        write_endpoint=4,
+        read_endpoint=0x83,
+        poll_timeout=20,
+        first_byte_timeout=30.0,
+        inter_byte_timeout=0.5,
+        packet_size=200,
+        motion_verbs=(),
+    ):
+        """Creates a new CompletionMonitor, call start() before sending commands
+
+        Args:
+            device: pyusb device (or an object with the same write/read methods)
+            write_endpoint (int): endpoint commands are written to
+            read_endpoint (int): endpoint replies are read from
+            poll_timeout (int): read timeout of the reader thread (unit: ms), bounds how late
+                the other timeouts and stop() take effect
+            first_byte_timeout (float): seconds to wait for the first reply line of a command
+            inter_byte_timeout (float): seconds of silence after a reply line that end a reply
+                without a status line
+            packet_size (int): bytes requested per endpoint read
+            motion_verbs ([str]): verbs of commands that move the arm, their first reply line is
+                waited for without first_byte_timeout
+        """
+        self.device = device
+        self.write_endpoint = write_endpoint
+        self.read_endpoint = read_endpoint
+        self.poll_timeout = poll_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.inter_byte_timeout = inter_byte_timeout
+        self.motion_verbs = frozenset(motion_verbs)
+        self._packet = array.array("B", bytes(packet_size))
+        self._frames = FrameBuffer()
+        self._pending = deque()
+        self._completed_echoes = deque(maxlen=8)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._running = False
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts the reader thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._read_loop, name="sciclops-monitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the reader thread and resolves every pending command with what was read so far"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_timeout / 1000 + 1)
+        with self._lock:
+            while self._pending:
+                self._finish(self._pending[0])
+
+    def submit(self, command: str) -> Future:
+        """Writes a command and returns a future that resolves to its reply"""
+        verb = command.split(" ", 1)[0].strip("\r\n").upper()
+        pending = PendingCommand(
+            command,
+            None if verb in self.motion_verbs else self.first_byte_timeout,
+        )
+        with self._lock:
+            self._pending.append(pending)
+        try:
+            self.device.write(self.write_endpoint, command)
+        except Exception as err:
+            with self._lock:
+                self._pending.remove(pending)
+                self._idle.notify_all()
+            pending.future.set_exception(err)
+        return pending.future
+
+    def send(self, command: str, timeout: float = 60) -> str:
+        """Writes a command and waits for its reply (timeout None waits without a limit).
+        On timeout, returns what was read so far."""
+        future = self.submit(command)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                for pending in self._pending:
+                    if pending.future is future:
+                        self._finish(pending)
+                        break
+            return future.result()
+
+    def busy(self) -> bool:
+        """True while any command is waiting for its reply"""
+        with self._lock:
+            return bool(self._pending)
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Blocks until every submitted command completed. Returns False on timeout."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._pending, timeout=timeout)
+
+    def _finish(self, pending: PendingCommand) -> None:
+        """Resolves a pending command with its reply so far. Must hold the lock."""
+        self._pending.remove(pending)
+        self._completed_echoes.append(pending.echo)
+        if not pending.future.done():
+            pending.future.set_result(pending.response())
+        if not self._pending:
+            self._idle.notify_all()
+
+    def _route(self, line: str, now: float) -> None:
+        """Assigns a received line to its command. Must hold the lock."""
+        for pending in self._pending:
+            if line == pending.echo:
+                pending.lines.append(line)
+                return
+        if not self._pending or line in self._completed_echoes:
+            return  # unsolicited line, or the echo trailing a completed reply
+        pending = self._pending[0]
+        pending.lines.append(line)
+        pending.last_reply_time = now
+        if STATUS_LINE.match(line):
+            self._finish(pending)
+
+    def _check_timeouts(self, now: float) -> None:
+        """Completes the oldest command if its reply stalled. Must hold the lock."""
+        if not self._pending:
+            return
+        pending = self._pending[0]
+        if pending.last_reply_time is None:
+            if (
+                pending.first_byte_timeout is not None
+                and now - pending.sent_time > pending.first_byte_timeout
+            ):
+                self._finish(pending)
+        elif now - pending.last_reply_time > self.inter_byte_timeout:
+            self._finish(pending)
+
+    def _read_loop(self) -> None:
+        """Reads the reply endpoint into the frame buffer until stopped"""
+        while self._running:
+            try:
+                length = self.device.read(
+                    self.read_endpoint, self._packet, timeout=self.poll_timeout
+                )
+            except usb.core.USBTimeoutError:
+                length = 0
+            except Exception as err:
+                if not self._running:
+                    return
+                print(f"Sciclops monitor read error: {err}")
+                time.sleep(self.poll_timeout / 1000)
+                length = 0
+
+            now = time.monotonic()
+            with self._lock:
+                if length:
+                    self._frames.append(self._packet, length)
+                    for line in self._frames.lines():
+                        self._route(line, now)
+                self._check_timeouts(now)
@@ -0,0 +1,458 @@
+"""Simulated Hudson Sciclops behind an in-process pyusb backend, for testing and benchmarking without hardware.
+
+SciclopsSimulator answers the command set used by SCICLOPS: commands arrive as bulk writes to endpoint 4,
+replies are read from endpoint 0x83. SciclopsBackend exposes the simulator as a USB device with the Sciclops
+vendor and product ID, so the driver runs against it unmodified apart from the backend it searches:
+
+    simulator = SciclopsSimulator(time_scale=0.1)
+    sciclops = SCICLOPS(backend=simulator.backend)
+
+The REST node does the same with --simulate. Unlike the PlateCrane simulator, the device only exists
+inside the process that created it.
+
+Plates in the towers are modelled when towers is given: a Z jog into a tower stops where the gripper (or
+the plate it holds) touches the top of the stack, closing the gripper below the top plate takes it and
+opening it over a tower drops the held plate onto the stack. The exchange, lid nests and trash are not
+modelled, closing the gripper low anywhere else is taken as picking up a plate of DEFAULT_PLATE_HEIGHT.
+"""
+
+import array
+import errno
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import usb.backend
+import usb.core
+import usb.util
+
+VENDOR_ID = 0x7513
+PRODUCT_ID = 0x0002
+WRITE_ENDPOINT = 0x04
+READ_ENDPOINT = 0x83
+
+AXES = ("Z", "R", "Y", "P")
+"""Joint order of GETPOS replies"""
+
+AXIS_LIMITS = {
+    "Z": (-421.8625, 23.5188),
+    "R": (0.0, 360.0),
+    "Y": (0.0, 180.0),
+    "P": (0.0, 360.0),
+}
+"""(min, max) of every axis, jogs stop at these (unit: mm for Z and Y, degrees for R and P)"""
+
+DEFAULT_VELOCITIES = {"Z": 150.0, "R": 90.0, "Y": 120.0, "P": 180.0}
+"""Axis velocities at 100% speed (unit: mm/s for Z and Y, degrees/s for R and P)"""
+
+HOME_POSE = {"Z": 23.5188, "R": 109.2741, "Y": 32.7484, "P": 98.2955}
+"""Pose after HOME, the neutral position above the exchange"""
+
+TOWER_POSES = {
+    "tower1": {"R": 133.5, "Y": 171.9895, "P": 8.6648},
+    "tower2": {"R": 151.3, "Y": 171.4872, "P": 8.4943},
+    "tower3": {"R": 169.5, "Y": 171.4810, "P": 12.4716},
+    "tower4": {"R": 187.5, "Y": 169.4470, "P": 5.9091},
+    "tower5": {"R": 205.4, "Y": 171.2082, "P": 10.8807},
+}
+"""R, Y and P above every tower, as in the default SCICLOPS labware"""
+
+TOWER_BOTTOM_Z = AXIS_LIMITS["Z"][0]
+"""Z at which the closed gripper touches the floor of an empty tower (unit: mm)"""
+
+FINGER_REACH = 12.0
+"""How far the open fingers reach below the top of a tower (unit: mm)"""
+
+DEFAULT_PLATE_HEIGHT = 16.2562
+"""Height of plates picked up outside the towers (unit: mm)"""
+
+STEPS_PER_UNIT = {"Z": 100.0, "R": 100.0, "Y": 100.0, "P": 100.0}
+"""Reported by GETSTEPSPERUNIT"""
+
+
+class SciclopsSimulator:
+    """Answers Sciclops commands written to it, see write() and read().
+
+    Every command is echoed as soon as it is written and executed in order on a worker thread, like on the
+    robot. Its reply lines end with a 4 digit status line ('0000 ...' on success) after its simulated
+    execution time. Every bulk write carries whole commands, a command without a line ending (LIMP) is
+    executed as well.
+    """
+
+    def __init__(
+        self,
+        velocities: Dict[str, float] = None,
+        time_scale: float = 1.0,
+        command_time: float = 0.005,
+        gripper_time: float = 0.3,
+        plate_present: bool = False,
+        towers: Dict[str, List[float]] = None,
+    ):
+        """Creates the simulator and starts executing commands
+
+        Args:
+            velocities ({str: float}): axis velocities at 100% speed, defaults to DEFAULT_VELOCITIES
+            time_scale (float): multiplier applied to every motion and gripper time, 0 makes them instant
+            command_time (float): seconds the robot needs to answer any command
+            gripper_time (float): seconds an OPEN or CLOSE takes
+            plate_present (bool): initial reading of the exchange plate sensor (GETPLATEPRESENT)
+            towers ({str: [float]}): plate heights in the towers of TOWER_POSES by tower name, bottom plate
+                first. Towers that are not given are not modelled.
+        """
+        self.velocities = dict(DEFAULT_VELOCITIES, **(velocities or {}))
+        self.time_scale = time_scale
+        self.command_time = command_time
+        self.gripper_time = gripper_time
+        self.plate_present = plate_present
+        """Reading of the exchange plate sensor, set it to simulate an operator"""
+
+        self.pose = dict(HOME_POSE)
+        self.points: Dict[str, Dict[str, float]] = {}
+        self.speed = 100
+        self.gripper_open = True
+        self.limp = False
+        self.towers: Dict[str, List[float]] = {
+            name: list(plates) for name, plates in (towers or {}).items()
+        }
+        """Plate heights in every modelled tower, bottom plate first"""
+        self.held: Optional[Tuple[float, float]] = None
+        """(height, distance from its top to the gripper) of the held plate, None if there is none"""
+        self.contacts: List[Tuple[str, int]] = []
+        """(tower, speed) of every move that stopped on a tower, in order"""
+        self.command_log: List[str] = []
+        """Every executed command, in order"""
+        self.busy_time = 0.0
+        """Total seconds spent moving axes and the gripper"""
+
+        self._output = bytearray()
+        self._output_ready = threading.Condition()
+        self._commands: List[Optional[str]] = []
+        self._commands_ready = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._execute_commands, name="sciclops-simulator", daemon=True
+        )
+        self._thread.start()
+        self.backend = SciclopsBackend(self)
+        """pyusb backend whose only device is this simulator"""
+
+    def close(self) -> None:
+        """Stops executing commands"""
+        self._running = False
+        with self._commands_ready:
+            self._commands.append(None)
+            self._commands_ready.notify()
+        self._thread.join(timeout=1)
+
+    def write(self, data: bytes) -> None:
+        """Echoes and queues the commands of one bulk write"""
+        text = data.decode("utf-8", errors="replace")
+        for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+            command = line.strip()
+            if not command:
+                continue
+            self._write_line(command)
+            with self._commands_ready:
+                self._commands.append(command)
+                self._commands_ready.notify()
+
+    def read(self, size: int, timeout: float) -> bytes:
+        """Returns up to size bytes of reply, waiting at most timeout seconds for any. Empty on timeout."""
+        with self._output_ready:
+            if not self._output_ready.wait_for(lambda: self._output, timeout=timeout):
+                return b""
+            data = bytes(self._output[:size])
+            del self._output[:size]
+            return data
+
+    def _write_line(self, line: str) -> None:
+        """Appends one line to the reply stream"""
+        with self._output_ready:
+            self._output += line.encode("utf-8") + b"\r\n"
+            self._output_ready.notify_all()
+
+    def _execute_commands(self) -> None:
+        """Executes queued commands one at a time"""
+        while True:
+            with self._commands_ready:
+                self._commands_ready.wait_for(lambda: self._commands)
+                command = self._commands.pop(0)
+            if command is None or not self._running:
+                return
+            time.sleep(self.command_time)
+            self.command_log.append(command)
+            for line in self.execute(command):
+                self._write_line(line)
+
+    def motion_time(self, target: Dict[str, float]) -> float:
+        """Seconds needed to move from the current pose to target. Axes move simultaneously."""
+        return (
+            self.time_scale
+            * max(
+                abs(target[axis] - self.pose[axis]) / self.velocities[axis]
+                for axis in AXES
+            )
+            / (self.speed / 100)
+        )
+
+    def tower_at(self, pose: Dict[str, float]) -> Optional[str]:
+        """Returns the modelled tower the arm is over at pose, None if there is none"""
+        for name in self.towers:
+            if all(
+                abs(pose[axis] - value) < 1e-3
+                for axis, value in TOWER_POSES[name].items()
+            ):
+                return name
+        return None
+
+    def tower_top(self, tower: str) -> float:
+        """Returns the Z at which the closed gripper touches the top of a tower"""
+        return TOWER_BOTTOM_Z + sum(self.towers[tower])
+
+    def floor_z(self, pose: Dict[str, float]) -> Optional[float]:
+        """Returns the lowest Z the arm can reach at pose, None if nothing is below it"""
+        tower = self.tower_at(pose)
+        if tower is None:
+            return None
+        top = self.tower_top(tower)
+        if self.held is not None:
+            height, grip = self.held
+            return top + height - grip
+        if self.gripper_open and self.towers[tower]:
+            return max(top - FINGER_REACH, TOWER_BOTTOM_Z)
+        return top
+
+    def move_to(self, target: Dict[str, float]) -> List[str]:
+        """Moves to target, or until the arm touches the top of a tower, and returns the reply"""
+        floor = self.floor_z(target)
+        if floor is not None and target["Z"] < floor:
+            target = dict(target, Z=floor)
+            self.contacts.append((self.tower_at(target), self.speed))
+        duration = self.motion_time(target)
+        time.sleep(duration)
+        self.busy_time += duration
+        self.pose = dict(target)
+        return ["0000 Success"]
+
+    def actuate_gripper(self, open_gripper: bool) -> List[str]:
+        """Opens or closes the gripper, taking or releasing plates, and returns the reply"""
+        duration = self.time_scale * self.gripper_time
+        time.sleep(duration)
+        self.busy_time += duration
+        self.gripper_open = open_gripper
+        tower = self.tower_at(self.pose)
+        if open_gripper:
+            if tower is not None and self.held is not None:
+                self.towers[tower].append(self.held[0])
+            self.held = None
+        elif tower is not None:
+            top = self.tower_top(tower)
+            if self.towers[tower] and top - FINGER_REACH <= self.pose["Z"] < top:
+                self.held = (self.towers[tower].pop(), top - self.pose["Z"])
+        elif self.pose["Z"] < 0:
+            self.held = (DEFAULT_PLATE_HEIGHT, DEFAULT_PLATE_HEIGHT / 2)
+        return ["0000 Success"]
+
+    def format_pose(self, pose: Dict[str, float]) -> str:
+        """Formats a pose like GETPOS"""
+        return ", ".join(f"{axis}:{pose[axis]:.4f}" for axis in AXES)
+
+    def execute(self, command: str) -> List[str]:
+        """Executes a single command and returns its reply lines"""
+        verb, _, args = command.partition(" ")
+        verb = verb.upper()
+        args = [arg.strip() for arg in args.split(",")] if args.strip() else []
+
+        try:
+            if verb == "STATUS":
+                return ["0000 Limp" if self.limp else "0000 Ready"]
+            if verb == "GETPOS":
+                return ["0000 " + self.format_pose(self.pose)]
+            if verb == "VERSION":
+                return ["0000 Sciclops simulator 1.0"]
+            if verb == "GETCONFIG":
+                return ["0000 Sciclops-3 5 towers"]
+            if verb == "GETGRIPPERLENGTH":
+                return ["0000 17.2"]
+            if verb == "GETCOLLAPSEDISTANCE":
+                return ["0000 3.35"]
+            if verb == "GETSTEPSPERUNIT":
+                return [
+                    "0000 "
+                    + ",".join(f"{axis}:{STEPS_PER_UNIT[axis]}" for axis in AXES)
+                ]
+            if verb in ("HOME", "RESET"):
+                self.speed = 100
+                return self.move_to(HOME_POSE)
+            if verb in ("OPEN", "CLOSE"):
+                return self.actuate_gripper(verb == "OPEN")
+            if verb == "GETGRIPPERISOPEN":
+                return ["0000 1" if self.gripper_open else "0000 0"]
+            if verb == "GETGRIPPERISCLOSED":
+                return ["0000 0" if self.gripper_open else "0000 1"]
+            if verb == "GETPLATEPRESENT":
+                return ["0000 1" if self.plate_present else "0000 0"]
+            if verb in ("SETSPEED", "SPEED"):
+                self.speed = max(1, min(100, int(args[0])))
+                return ["0000 Success"]
+            if verb == "LIMP":
+                self.limp = args[0].upper() == "TRUE"
+                return ["0000 Success"]
+            if verb == "LOADPOINT":
+                values = dict(arg.split(":", 1) for arg in args[1:])
+                self.points[args[0]] = {axis: float(values[axis]) for axis in AXES}
+                return ["0000 Success"]
+            if verb == "DELETEPOINT":
+                if self.points.pop(args[0], None) is None:
+                    return ["0010 Point not found"]
+                return ["0000 Success"]
+            if verb == "LISTPOINTS":
+                return [
+                    f"{name}: {self.format_pose(point)}"
+                    for name, point in self.points.items()
+                ] + ["0000 Success"]
+            if verb == "MOVE":
+                if args[0] not in self.points:
+                    return ["0010 Point not found"]
+                return self.move_to(self.points[args[0]])
+            if verb == "JOG":
+                axis = args[0].upper()
+                lower, upper = AXIS_LIMITS[axis]
+                target = dict(self.pose)
+                target[axis] = max(lower, min(upper, target[axis] + float(args[1])))
+                return self.move_to(target)
+        except (IndexError, KeyError, ValueError):
+            return ["0002 Invalid arguments"]
+        return ["0001 Unknown command"]
+
+
+class SciclopsBackend(usb.backend.IBackend):
+    """pyusb backend with a single bulk device, a SciclopsSimulator
+
+    Pass it to usb.core.find (SCICLOPS does with its backend argument). Endpoint 4 writes go to
+    SciclopsSimulator.write, endpoint 0x83 reads come from SciclopsSimulator.read.
+    """
+
+    def __init__(self, simulator: SciclopsSimulator, packet_size: int = 64):
+        """Creates the backend
+
+        Args:
+            simulator (SciclopsSimulator): the device
+            packet_size (int): wMaxPacketSize of the bulk endpoints (unit: bytes)
+        """
+        self.simulator = simulator
+        self.packet_size = packet_size
+
+    def enumerate_devices(self):
+        """Yields the only device"""
+        yield self.simulator
+
+    def get_device_descriptor(self, dev):
+        """Returns the device descriptor with the Sciclops vendor and product ID"""
+        return SimpleNamespace(
+            bLength=18,
+            bDescriptorType=usb.util.DESC_TYPE_DEVICE,
+            bcdUSB=0x0200,
+            bDeviceClass=0,
+            bDeviceSubClass=0,
+            bDeviceProtocol=0,
+            bMaxPacketSize0=64,
+            idVendor=VENDOR_ID,
+            idProduct=PRODUCT_ID,
+            bcdDevice=0x0100,
+            iManufacturer=0,
+            iProduct=0,
+            iSerialNumber=0,
+            bNumConfigurations=1,
+            address=1,
+            bus=1,
+            port_number=1,
+            port_numbers=(1,),
+            speed=usb.util.SPEED_FULL,
+        )
+
+    def get_configuration_descriptor(self, dev, config):
+        """Returns the only configuration"""
+        if config != 0:
+            raise IndexError("Invalid configuration index " + str(config))
+        return SimpleNamespace(
+            bLength=9,
+            bDescriptorType=usb.util.DESC_TYPE_CONFIG,
+            wTotalLength=32,
+            bNumInterfaces=1,
+            bConfigurationValue=1,
+            iConfiguration=0,
+            bmAttributes=0x80,
+            bMaxPower=50,
+            extra_descriptors=[],
+        )
+
+    def get_interface_descriptor(self, dev, intf, alt, config):
+        """Returns the only interface, it has no alternate settings"""
+        if intf != 0 or alt != 0 or config != 0:
+            raise IndexError("Invalid interface " + str((intf, alt, config)))
+        return SimpleNamespace(
+            bLength=9,
+            bDescriptorType=usb.util.DESC_TYPE_INTERFACE,
+            bInterfaceNumber=0,
+            bAlternateSetting=0,
+            bNumEndpoints=2,
+            bInterfaceClass=0xFF,
+            bInterfaceSubClass=0,
+            bInterfaceProtocol=0,
+            iInterface=0,
+            extra_descriptors=[],
+        )
+
+    def get_endpoint_descriptor(self, dev, ep, intf, alt, config):
+        """Returns the bulk OUT (index 0) or bulk IN (index 1) endpoint"""
+        if ep not in (0, 1) or intf != 0 or alt != 0 or config != 0:
+            raise IndexError("Invalid endpoint " + str((ep, intf, alt, config)))
+        return SimpleNamespace(
+            bLength=7,
+            bDescriptorType=usb.util.DESC_TYPE_ENDPOINT,
+            bEndpointAddress=(WRITE_ENDPOINT, READ_ENDPOINT)[ep],
+            bmAttributes=usb.util.ENDPOINT_TYPE_BULK,
+            wMaxPacketSize=self.packet_size,
+            bInterval=0,
+            bRefresh=0,
+            bSynchAddress=0,
+            extra_descriptors=[],
+        )
+
+    def open_device(self, dev):
+        """Returns the device itself as its handle"""
+        return dev
+
+    def close_device(self, dev_handle):
+        """Nothing to release"""
+
+    def set_configuration(self, dev_handle, config_value):
+        """The only configuration is always active"""
+
+    def get_configuration(self, dev_handle):
+        """Returns the bConfigurationValue of the only configuration"""
+        return 1
+
+    def set_interface_altsetting(self, dev_handle, intf, altsetting):
+        """The only interface has no alternate settings"""
+
+    def claim_interface(self, dev_handle, intf):
+        """Nothing to claim"""
+
+    def release_interface(self, dev_handle, intf):
+        """Nothing to release"""
+
+    def bulk_write(self, dev_handle, ep, intf, data, timeout):
+        """Passes the written commands to the simulator, returns the number of bytes written"""
+        dev_handle.write(data.tobytes())
+        return len(data)
+
+    def bulk_read(self, dev_handle, ep, intf, buff, timeout):
+        """Reads pending reply bytes into buff, returns their number. Raises USBTimeoutError if there are none."""
+        data = dev_handle.read(len(buff), timeout / 1000 if timeout else None)
+        if not data:
+            raise usb.core.USBTimeoutError("Operation timed out", -7, errno.ETIMEDOUT)
+        buff[: len(data)] = array.array("B", data)
+        return len(data)
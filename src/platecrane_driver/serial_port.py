@@ -1,9 +1,101 @@
 """Provides SerialPort class to interface with the plate_crane."""
 
+import re
 import time
+from collections import deque
 
 from serial import Serial, SerialException
 
+from platecrane_driver.command_metrics import CommandMetrics
+from platecrane_driver.error_codes import PLATECRANE_ERROR_CODES, PlateCraneError
+
+READ_MODES = ("legacy", "framed")
+"""Supported reply read modes for the SerialPort"""
+
+STATUS_LINE = re.compile(r"^\d{4}(?:\s|$)")
+"""A final status frame, e.g. '0000 Success'"""
+
+ERROR_REPLIES = frozenset(PLATECRANE_ERROR_CODES)
+"""Bare error codes the controller may reply with instead of a status line"""
+
+MULTILINE_COMMANDS = frozenset(["LISTPOINTS"])
+"""Commands whose replies span several lines before the final frame"""
+
+
+class ReplyFramer:
+    """
+    Description:
+    Incrementally splits the plate_crane reply stream into frames.
+
+    A reply consists of the echoed command line followed by the reply lines. For most commands
+    the first line after the echo is the final frame. Multi-line replies (see MULTILINE_COMMANDS)
+    end with a status line ('0000 ...'), a bare error code, or after the line stream goes quiet
+    for frame_gap seconds. Lines received before the echo belong to earlier commands and are dropped.
+    """
+
+    def __init__(self, command="", frame_gap=0.1):
+        """Creates a new ReplyFramer.
+        Params:
+        - command (str): The command the reply belongs to, without line endings.
+        - frame_gap (float): Seconds of silence that end a multi-line reply. Default is 0.1.
+        """
+        self.command = command
+        self.frame_gap = frame_gap
+        self.multiline = command.split(" ", 1)[0].upper() in MULTILINE_COMMANDS
+
+        self.echo_seen = False
+        self.stale_lines = []
+        self.reply_lines = []
+        self.complete = False
+        self.last_line_time = None
+        self._partial = b""
+
+    def feed(self, data):
+        """Adds received bytes to the framer. Returns True once the final frame has arrived."""
+        if self.complete or not data:
+            return self.complete
+
+        *lines, self._partial = (self._partial + data).split(b"\n")
+        for raw_line in lines:
+            line = raw_line.decode("utf-8", errors="replace").strip("\r\n")
+            if not line:
+                continue
+            self.last_line_time = time.time()
+            if not self.echo_seen:
+                if line == self.command:
+                    self.echo_seen = True
+                else:
+                    self.stale_lines.append(line)
+                continue
+            self.reply_lines.append(line)
+            if not self.multiline or self.is_final_frame(line):
+                self.complete = True
+                break
+        return self.complete
+
+    def check_quiet(self):
+        """Completes a multi-line reply once no new line has arrived for frame_gap seconds."""
+        if (
+            not self.complete
+            and self.multiline
+            and self.reply_lines
+            and time.time() - self.last_line_time >= self.frame_gap
+        ):
+            self.complete = True
+        return self.complete
+
+    @staticmethod
+    def is_final_frame(line):
+        """Checks if a reply line is a status line or a bare error code."""
+        return line in ERROR_REPLIES or STATUS_LINE.match(line) is not None
+
+    def response(self):
+        """Returns the reply text and the echoed command (empty if no echo was seen)."""
+        if self.echo_seen:
+            return "\n".join(self.reply_lines), self.command
+        # No echo arrived before the timeout, hand back whatever was read
+        return "\n".join(self.stale_lines), ""
+
 
 class SerialPort:
     """
@@ -11,14 +103,45 @@ class SerialPort:
     Python interface that allows remote commands to be executed to the plate_crane.
     """
 
-    def __init__(self, host_path="/dev/ttyUSB2", baud_rate=9600):
+    def __init__(
+        self,
+        host_path="/dev/ttyUSB2",
+        baud_rate=9600,
+        read_mode="legacy",
+        poll_interval=0.02,
+        pipeline_window=1,
+        metrics=False,
+    ):
         """Creates a new SerialPort object.
         Params:
         - host_path (str): The path to the serial port. Default is '/dev/ttyUSB2'.
         - baud_rate (int): The baud rate of the serial port. Default is 9600.
+        - read_mode (str): How replies are read. 'legacy' polls and reads lines until the port
+            times out, 'framed' returns as soon as the final reply frame arrives. Default is 'legacy'.
+        - poll_interval (float): Read timeout of the port in 'framed' mode, in seconds. Default is 0.02.
+        - pipeline_window (int): Maximum number of commands send_pipelined keeps in flight. Only used in
+            'framed' mode, 1 sends one command at a time. Default is 1.
+        - metrics (bool): Record per-command timings and byte counts in self.metrics (see command_metrics.py).
+            Default is False, in which case self.metrics is None.
         """
+        if read_mode not in READ_MODES:
+            raise ValueError(
+                f"Unknown read mode '{read_mode}', expected one of {READ_MODES}"
+            )
         self.host_path = host_path
         self.baud_rate = baud_rate
+        self.read_mode = read_mode
+        self.poll_interval = poll_interval
+        self.pipeline_window = max(1, pipeline_window)
+        self.metrics = CommandMetrics() if metrics else None
+        self.first_byte_time = None
+        """Time the first byte of the last reply arrived, None if nothing arrived"""
+        self.bytes_in = 0
+        """Number of bytes read for the last reply"""
+        self.on_send = None
+        """Optional callable, called with every command (without line endings) before it is written"""
+        self.on_reply = None
+        """Optional callable, called with every command and its reply once the reply arrived"""
         self.connection = None
 
         self.status = 0
@@ -35,7 +158,10 @@ class SerialPort:
         Connect to serial port / If wrong port entered inform user
         """
         try:
-            self.connection = Serial(self.host_path, self.baud_rate, timeout=1)
+            read_timeout = 1 if self.read_mode == "legacy" else self.poll_interval
+            self.connection = Serial(
+                self.host_path, self.baud_rate, timeout=read_timeout
+            )
             self.connection_status = Serial(self.host_path, self.baud_rate, timeout=1)
         except Exception as e:
             raise Exception("Could not establish connection") from e
@@ -57,13 +183,17 @@ class SerialPort:
         print_command = command.strip("\r\n")
         print(f"Sending command '{print_command}'")
 
+        if self.on_send is not None:
+            self.on_send(command.strip("\r\n"))
         send_time = time.time()
+        encoded_command = command.encode("utf-8")
         try:
-            self.connection.write(command.encode("utf-8"))
+            self.connection.write(encoded_command)
 
         except SerialException as err:
             print(err)
             self.robot_error = err
+        write_time = time.time()
 
         response_msg = ""
         initial_command_msg = ""
@@ -81,18 +211,25 @@ class SerialPort:
             f"Command '{print_command}': {print_response} (elapsed time: {time.time() - send_time} seconds)"
         )
 
-        error_codes = {
-            "21": "R axis error",
-            "14": "z axis error",
-            "02": "Invalid location",
-            "1400": "Z axis crash",
-            "T1": "Serial connection issue",
-            "ATS": "Serial connection issue",
-            "TU": "Serial connection issue",
-        }  # TODO: Import the full list from error_codes.py
+        if response_msg.strip() in ERROR_REPLIES:
+            print(
+                f"Command '{print_command}' failed: {PlateCraneError.from_response(response_msg)}"
+            )
 
-        if response_msg in error_codes.keys():
-            pass
+        if self.metrics is not None:
+            self.metrics.record(
+                command,
+                write_time=write_time - send_time,
+                first_byte_latency=(
+                    self.first_byte_time - write_time if self.first_byte_time else None
+                ),
+                round_trip=time.time() - send_time,
+                bytes_out=len(encoded_command),
+                bytes_in=self.bytes_in,
+                error=response_msg.strip() in ERROR_REPLIES,
+            )
+        if self.on_reply is not None:
+            self.on_reply(command.strip("\r\n"), response_msg.strip())
 
         return response_msg
 
@@ -100,16 +237,25 @@ class SerialPort:
         """
         Records the data outputted by the plate_crane and sets it to equal "" if no data is outputted in the provided time.
         """
+        if self.read_mode == "framed":
+            return self.receive_framed(
+                initial_command_msg=initial_command_msg, timeout=timeout
+            )
 
         # response_string = self.connection.read_until(expected=b'\r').decode('utf-8')
         response = ""
         response_string = ""
         response_command_msg = ""
+        self.first_byte_time = None
+        self.bytes_in = 0
 
         start_wait = time.time()
         while True:
             if self.connection.in_waiting != 0:
+                if self.first_byte_time is None:
+                    self.first_byte_time = time.time()
                 response = self.connection.readlines()
+                self.bytes_in += sum(len(line) for line in response)
                 if response[0].decode("utf-8").strip("\r\n") == initial_command_msg:
                     response_command_msg = initial_command_msg
                 if len(response) > 1:
@@ -123,3 +269,132 @@ class SerialPort:
                 break
             time.sleep(0.25)
         return response_string, response_command_msg
+
+    def receive_framed(self, initial_command_msg="", timeout=0):
+        """
+        Reads the reply to initial_command_msg frame by frame and returns as soon as the final frame arrives,
+        instead of waiting for the port to time out. Returns the same (response, echoed command) pair as receive_command.
+        """
+        framer = ReplyFramer(initial_command_msg)
+        connection = self.connection
+        self.first_byte_time = None
+        self.bytes_in = 0
+
+        start_wait = time.time()
+        while True:
+            # Blocks for at most poll_interval when nothing is waiting
+            data = connection.read(connection.in_waiting or 1)
+            if data:
+                if self.first_byte_time is None:
+                    self.first_byte_time = time.time()
+                self.bytes_in += len(data)
+            if framer.feed(data) or framer.check_quiet():
+                break
+            if time.time() - start_wait > timeout:
+                break
+        return framer.response()
+
+    def send_pipelined(self, commands, timeout=10):
+        """
+        Sends several commands back-to-back, keeping up to pipeline_window of them in flight, and returns
+        their replies in command order. Replies are matched to commands by their echoed command line,
+        so an error code is reported against the command that caused it. Falls back to one send_command
+        per command in 'legacy' mode or with a window of 1.
+        Params:
+        - commands ([str]): Commands to send, in order.
+        - timeout (float): Seconds to wait for each reply once its command is the oldest in flight.
+        """
+        if self.read_mode != "framed" or self.pipeline_window == 1:
+            return [self.send_command(command, timeout=timeout) for command in commands]
+
+        pending = deque(commands)
+        awaiting_echo = deque()  # sent, echo not seen yet
+        awaiting_reply = deque()  # echoed, final frame not seen yet
+        in_flight = deque()  # every sent command in send order
+        indexes = {}  # framer -> command index
+        timings = {}  # framer -> [write start, write end, first byte, bytes in]
+        replies = {}
+        partial = b""
+        connection = self.connection
+        send_time = time.time()
+
+        def send_next():
+            command = pending.popleft()
+            framer = ReplyFramer(command.strip("\r\n"))
+            indexes[framer] = len(commands) - len(pending) - 1
+            print(f"Sending command '{framer.command}' (pipelined)")
+            if self.on_send is not None:
+                self.on_send(framer.command)
+            write_start = time.time()
+            try:
+                connection.write(command.encode("utf-8"))
+            except SerialException as err:
+                print(err)
+                self.robot_error = err
+            timings[framer] = [write_start, time.time(), None, 0]
+            awaiting_echo.append(framer)
+            in_flight.append(framer)
+
+        def finish(framer):
+            response, _ = framer.response()
+            replies[indexes[framer]] = response
+            in_flight.remove(framer)
+            if framer in awaiting_echo:
+                awaiting_echo.remove(framer)
+            if framer in awaiting_reply:
+                awaiting_reply.remove(framer)
+            if response in ERROR_REPLIES:
+                print(f"Command '{framer.command}' failed: {response}")
+            else:
+                print(f"Command '{framer.command}': {response}")
+            if self.metrics is not None:
+                write_start, write_end, first_byte, bytes_in = timings[framer]
+                self.metrics.record(
+                    framer.command,
+                    write_time=write_end - write_start,
+                    first_byte_latency=first_byte - write_end if first_byte else None,
+                    round_trip=time.time() - write_start,
+                    bytes_out=len(framer.command) + 2,
+                    bytes_in=bytes_in,
+                    error=response in ERROR_REPLIES,
+                )
+            if self.on_reply is not None:
+                self.on_reply(framer.command, response)
+
+        def received(framer, raw_line):
+            timing = timings[framer]
+            if timing[2] is None:
+                timing[2] = time.time()
+            timing[3] += len(raw_line) + 1
+            return framer.feed(raw_line + b"\n")
+
+        head_start = time.time()
+        while pending or in_flight:
+            while pending and len(in_flight) < self.pipeline_window:
+                send_next()
+
+            data = connection.read(connection.in_waiting or 1)
+            *lines, partial = (partial + data).split(b"\n")
+            for raw_line in lines:
+                line = raw_line.decode("utf-8", errors="replace").strip("\r\n")
+                if not line:
+                    continue
+                if awaiting_echo and line == awaiting_echo[0].command:
+                    awaiting_reply.append(awaiting_echo.popleft())
+                    received(awaiting_reply[-1], raw_line)
+                elif awaiting_reply and received(awaiting_reply[0], raw_line):
+                    finish(awaiting_reply[0])
+                    head_start = time.time()
+
+            if awaiting_reply and awaiting_reply[0].check_quiet():
+                finish(awaiting_reply[0])
+                head_start = time.time()
+            elif in_flight and time.time() - head_start > timeout:
+                # The oldest command never completed, report what was read and move on
+                finish(in_flight[0])
+                head_start = time.time()
+
+        print(
+            f"Pipelined {len(commands)} commands (elapsed time: {time.time() - send_time} seconds)"
+        )
+        return [replies[index] for index in range(len(commands))]
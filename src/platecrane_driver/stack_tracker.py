@@ -0,0 +1,139 @@
+"""Tracks the plates in the PlateCrane stacks, so stack picks can skip most of the slow tap-down probe.
+
+The Z of a stack location is where the closed gripper touches the floor of the empty stack. With
+count plates of one type in it, the top of the stack is at
+
+    Z + count * plate top (plate_height_with_lid_steps if the plates have lids, else plate_height_steps)
+
+When the plate count of the source stack is known, plan_pick_plate_direct descends at full speed to
+one plate top plus APPROACH_CLEARANCE above that height and only taps the rest of the way at STACK_SPEED.
+When the count is unknown, the tap starts at the neutral height. Either way the contact height read after
+the tap sets the count, so a stack holding one plate more or any number of plates less than its count is
+picked from its actual top, and its count is corrected. Only the first pick from a stack (and the first
+after a disagreement) has to tap all the way down.
+
+A stack holding two or more plates more than its count is still hit by the full speed descent. The
+descent then stops short, the count becomes unknown and the pick taps all the way down again. Set the
+count (or let the picks probe) whenever plates are added to a stack by hand.
+"""
+
+from typing import Dict, NamedTuple, Optional
+
+from platecrane_driver.error_codes import PlateCraneError
+from platecrane_driver.resource_registry import registry
+
+APPROACH_CLEARANCE = 400
+"""Height above the predicted top of a stack plus one plate top that the full speed descent stops at
+(unit: motor steps)"""
+
+COUNT_TOLERANCE = 0.25
+"""Largest deviation of a probed stack height from a whole number of plates (unit: plate tops)
+that is still turned into a plate count"""
+
+
+class StackMismatchError(PlateCraneError):
+    """A predicted descent into a stack stopped short of its target, the stack is higher than its count"""
+
+
+class PickRecord(NamedTuple):
+    """A pick from a stack"""
+
+    stack: str
+    """Stack location name"""
+    plates: Optional[int]
+    """Plates in the stack before the pick as found by its tap, None if unknown"""
+    probed: bool
+    """True if the count was unknown and the pick tapped all the way down from the neutral height"""
+    seconds: float
+    """Duration of the transfer"""
+    saved_seconds: float
+    """Estimated seconds the prediction saved over probing, 0 if the pick probed"""
+
+
+def plate_top_steps(plate_type: str, has_lid: bool) -> int:
+    """Returns the height one plate adds to a stack (unit: motor steps)"""
+    plate = registry.plate(plate_type)
+    return plate.plate_height_with_lid_steps if has_lid else plate.plate_height_steps
+
+
+def stack_top_z(stack: str, plate_type: str, has_lid: bool, plates: int) -> int:
+    """Returns the Z at which the closed gripper touches the top of a stack of plates (unit: motor steps)"""
+    return registry.location(stack).joint_angles[1] + plates * plate_top_steps(
+        plate_type, has_lid
+    )
+
+
+class StackTracker:
+    """Plate counts of the PlateCrane stacks, None while a count is unknown"""
+
+    def __init__(self, counts: Dict[str, Optional[int]] = None):
+        """Creates a new StackTracker
+
+        Args:
+            counts ({str: int}): known plate counts by stack location name, every other stack starts unknown
+        """
+        self.counts: Dict[str, Optional[int]] = {}
+        self.on_change = None
+        """Optional callable, called with the stack and its new count whenever a count changes"""
+        for stack, count in (counts or {}).items():
+            self.set_count(stack, count)
+
+    @staticmethod
+    def is_stack(location: str) -> bool:
+        """True if location is a location of type stack"""
+        entry = registry.locations.get(location)
+        return entry is not None and entry.location_type == "stack"
+
+    def count(self, stack: str) -> Optional[int]:
+        """Returns the plate count of a stack, None if unknown"""
+        return self.counts.get(stack)
+
+    def set_count(self, stack: str, count: Optional[int]) -> None:
+        """Sets the plate count of a stack, None marks it unknown
+
+        Raises:
+            Exception: if stack is not a location of type stack or count is negative
+        """
+        if not self.is_stack(stack):
+            raise Exception(f"'{stack}' is not a stack location")
+        if count is not None and count < 0:
+            raise Exception(f"Invalid plate count {count} for '{stack}'")
+        self.counts[stack] = count
+        self._changed(stack)
+
+    def invalidate(self, stack: str) -> None:
+        """Forgets the plate count of a stack, the next pick from it probes"""
+        self.counts[stack] = None
+        self._changed(stack)
+
+    def measured(
+        self, stack: str, contact_z: int, plate_type: str, has_lid: bool
+    ) -> Optional[int]:
+        """Sets the plate count of a stack from the Z a probe touched its top at and returns it.
+        The count becomes unknown if the height is not close to a whole number of plates."""
+        top = plate_top_steps(plate_type, has_lid)
+        plates = (contact_z - registry.location(stack).joint_angles[1]) / max(top, 1)
+        count = round(plates)
+        if top <= 0 or count < 0 or abs(plates - count) > COUNT_TOLERANCE:
+            print(f"STACK {stack}: probed height {contact_z} is no whole plate count")
+            count = None
+        self.counts[stack] = count
+        self._changed(stack)
+        return count
+
+    def picked(self, stack: str) -> None:
+        """Records a plate taken from a stack"""
+        if self.counts.get(stack):
+            self.counts[stack] -= 1
+            self._changed(stack)
+
+    def placed(self, stack: str) -> None:
+        """Records a plate put onto a stack"""
+        if self.counts.get(stack) is not None:
+            self.counts[stack] += 1
+            self._changed(stack)
+
+    def _changed(self, stack: str) -> None:
+        """Reports the count of a stack to on_change"""
+        if self.on_change is not None:
+            self.on_change(stack, self.counts[stack])
@@ -0,0 +1,389 @@
+"""Joint-space travel-time model of the PlateCrane EX.
+
+Every axis follows a trapezoidal velocity profile: it accelerates at a constant rate up to its
+maximum velocity, cruises and decelerates again. A move of d motor steps at speed s (fraction of
+full speed) takes
+
+    d / (v s) + (v s) / a      if the axis reaches cruise velocity (d >= (v s)^2 / a)
+    2 sqrt(d / a)              otherwise
+
+where the SPEED setting scales the maximum velocity v but not the acceleration a. All axes of a move
+start together, so a move takes as long as its slowest axis, plus the command round trip.
+Speed changes (see SpeedManager) and gripper actions add fixed times.
+
+Default profiles cross the travel range of each axis (platecrane_joint_limits and the taught
+locations) in DEFAULT_TRAVEL_TIMES. TravelTimeModel.calibrate fits the profiles to moves recorded by
+the driver instead. Estimates walk the same motion plans that PlateCrane.transfer executes (see
+motion_plan.py), and plans are scored in bulk with NumPy, so thousands of candidate routes cost a
+few array operations.
+"""
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from platecrane_driver.motion_plan import (
+    AXES,
+    PlanStep,
+    SpeedManager,
+    merge_safe_moves,
+    plan_transfer,
+)
+from platecrane_driver.resource_registry import registry
+from platecrane_driver.safe_envelope import SafeEnvelope, joint_bounds
+
+DEFAULT_TRAVEL_TIMES = {"R": 6.0, "Z": 4.0, "P": 2.0, "Y": 2.0}
+"""Seconds each axis needs to cross its whole travel range at 100% speed"""
+
+DEFAULT_RAMP_TIME = 0.2
+"""Seconds each axis needs to reach full speed in the default profiles"""
+
+
+def travel_ranges() -> Dict[str, int]:
+    """Returns the travel range of each axis (unit: motor steps), see safe_envelope.joint_bounds"""
+    return {axis: upper - lower for axis, (lower, upper) in joint_bounds().items()}
+
+
+class MoveRecord(NamedTuple):
+    """A move executed by the driver, used for calibration"""
+
+    start: Tuple[int, int, int, int]
+    """[R, Z, P, Y] joint values before the move (unit: motor steps)"""
+    end: Tuple[int, int, int, int]
+    """[R, Z, P, Y] joint values after the move (unit: motor steps)"""
+    speed: int
+    """Speed setting during the move (unit: % of full speed)"""
+    seconds: float
+    """Time from sending the move to its reply"""
+
+
+class PlanSegments(NamedTuple):
+    """A motion plan reduced to the quantities the travel-time model needs"""
+
+    distances: np.ndarray
+    """Absolute per-axis travel of every move and jog, shape (moves, 4) (unit: motor steps)"""
+    speeds: np.ndarray
+    """Speed setting of every move, shape (moves,) (unit: fraction of full speed)"""
+    gripper_actions: int
+    """Number of gripper open/close steps"""
+    speed_changes: int
+    """Number of SPEED commands the driver sends"""
+    end_pose: Tuple[int, int, int, int]
+    """Commanded pose after the plan"""
+    end_speed: int
+    """Speed setting after the plan (unit: % of full speed)"""
+
+
+def plan_segments(
+    plan: Sequence[PlanStep], start: Sequence[int], speed: int = 100
+) -> PlanSegments:
+    """Walks a motion plan from a start pose like PlateCrane.execute_plan does
+
+    Moves to the pose the arm already holds are skipped and SPEED is only counted when the speed
+    changes, as in the driver. Probing moves (tapping the top of a stack) are counted with their
+    full distance, which is the worst case.
+
+    Args:
+        plan ([PlanStep]): motion plan, e.g. from motion_plan.plan_transfer
+        start ([int]): [R, Z, P, Y] joint values the plan starts from (unit: motor steps)
+        speed (int): default speed, which the arm moves at when the plan starts (unit: % of full speed)
+    """
+    pose = list(start)
+    distances = []
+    speeds = []
+    gripper_actions = 0
+    speed_changes = 0
+    speed_manager = SpeedManager(default_speed=speed)
+    speed_manager.acknowledged(speed)
+    for step in plan:
+        if step.action == "move":
+            target = [
+                pose[index] if value is None else value
+                for index, value in enumerate(step.joints)
+            ]
+            if target == pose and not step.probe:
+                continue
+        elif step.action == "jog":
+            target = list(pose)
+            target[AXES.index(step.axis.upper())] += step.value
+        elif step.action == "set_speed":
+            speed_manager.default_speed = step.value
+            if speed_manager.needs_change(step.value):
+                speed_changes += 1
+                speed_manager.acknowledged(step.value)
+            continue
+        else:
+            gripper_actions += 1
+            continue
+        step_speed = speed_manager.speed_for(step)
+        if speed_manager.needs_change(step_speed):
+            speed_changes += 1
+            speed_manager.acknowledged(step_speed)
+        distances.append([abs(goal - current) for current, goal in zip(pose, target)])
+        speeds.append(step_speed / 100)
+        pose = target
+    return PlanSegments(
+        distances=np.array(distances, dtype=float).reshape(-1, len(AXES)),
+        speeds=np.array(speeds, dtype=float),
+        gripper_actions=gripper_actions,
+        speed_changes=speed_changes,
+        end_pose=tuple(pose),
+        end_speed=speed_manager.current,
+    )
+
+
+class TravelTimeModel:
+    """Trapezoidal per-axis travel-time model with per-command overheads"""
+
+    def __init__(
+        self,
+        velocities: Sequence[float],
+        accelerations: Sequence[float],
+        command_time: float = 0.05,
+        gripper_time: float = 0.5,
+        speed_change_time: float = 0.05,
+    ):
+        """Creates a model from per-axis profiles
+
+        Args:
+            velocities ([float]): R, Z, P, Y maximum velocity at 100% speed (unit: motor steps/s)
+            accelerations ([float]): R, Z, P, Y acceleration (unit: motor steps/s^2), inf for none
+            command_time (float): round trip of every command on top of its motion
+            gripper_time (float): seconds an OPEN or CLOSE takes
+            speed_change_time (float): seconds a SPEED command takes
+        """
+        self.velocities = np.array(velocities, dtype=float)
+        self.accelerations = np.array(accelerations, dtype=float)
+        self.command_time = command_time
+        self.gripper_time = gripper_time
+        self.speed_change_time = speed_change_time
+
+    @classmethod
+    def from_travel_times(
+        cls,
+        travel_times: Dict[str, float] = None,
+        ramp_time: float = DEFAULT_RAMP_TIME,
+        **overheads,
+    ) -> "TravelTimeModel":
+        """Creates a model whose axes cross their travel range in the given times
+
+        Args:
+            travel_times ({str: float}): seconds per axis to cross its travel range at 100% speed,
+                defaults to DEFAULT_TRAVEL_TIMES
+            ramp_time (float): seconds every axis needs to reach full speed, 0 for instant
+            overheads: command_time, gripper_time and speed_change_time, see __init__
+        """
+        travel_times = dict(DEFAULT_TRAVEL_TIMES, **(travel_times or {}))
+        ranges = travel_ranges()
+        velocities = [ranges[axis] / travel_times[axis] for axis in AXES]
+        accelerations = [
+            velocity / ramp_time if ramp_time else np.inf for velocity in velocities
+        ]
+        return cls(velocities, accelerations, **overheads)
+
+    def profile(self) -> Dict[str, Dict[str, float]]:
+        """Returns the per-axis profiles as a JSON serializable dict, acceleration None if instant"""
+        return {
+            axis: {
+                "velocity": float(velocity),
+                "acceleration": float(acceleration)
+                if np.isfinite(acceleration)
+                else None,
+            }
+            for axis, velocity, acceleration in zip(
+                AXES, self.velocities, self.accelerations
+            )
+        }
+
+    def axis_times(self, distances: np.ndarray, speeds: np.ndarray) -> np.ndarray:
+        """Returns the seconds every axis needs for every move
+
+        Args:
+            distances (np.ndarray): per-axis travel, shape (moves, 4) (unit: motor steps)
+            speeds (np.ndarray): speed of every move, shape (moves,) (unit: fraction of full speed)
+        """
+        velocities = self.velocities * speeds[:, None]
+        cruise = distances / velocities + velocities / self.accelerations
+        ramp = 2 * np.sqrt(distances / self.accelerations)
+        return np.where(distances >= velocities**2 / self.accelerations, cruise, ramp)
+
+    def move_times(self, distances: np.ndarray, speeds: np.ndarray) -> np.ndarray:
+        """Returns the seconds of every move, including its command round trip"""
+        if not len(distances):
+            return np.zeros(0)
+        return self.axis_times(distances, speeds).max(axis=1) + self.command_time
+
+    def estimate_plans(
+        self,
+        plans: Iterable[Sequence[PlanStep]],
+        start: Optional[Sequence[int]] = None,
+        speed: int = 100,
+    ) -> np.ndarray:
+        """Returns the estimated seconds of every plan, each run from the same start pose and speed
+
+        The moves of all plans are scored in one vectorized pass.
+
+        Args:
+            plans ([[PlanStep]]): motion plans, e.g. from motion_plan.plan_transfer
+            start ([int]): [R, Z, P, Y] start pose, defaults to the Safe location
+            speed (int): speed setting at the start (unit: % of full speed)
+        """
+        if start is None:
+            start = registry.location("Safe").joint_angles
+        segments = [plan_segments(plan, start, speed) for plan in plans]
+        if not segments:
+            return np.zeros(0)
+        owners = np.repeat(np.arange(len(segments)), [len(s.speeds) for s in segments])
+        move_times = self.move_times(
+            np.concatenate([s.distances for s in segments]),
+            np.concatenate([s.speeds for s in segments]),
+        )
+        overheads = np.array(
+            [
+                s.gripper_actions * (self.gripper_time + self.command_time)
+                + s.speed_changes * self.speed_change_time
+                for s in segments
+            ]
+        )
+        return (
+            np.bincount(owners, weights=move_times, minlength=len(segments)) + overheads
+        )
+
+    def estimate_plan(
+        self,
+        plan: Sequence[PlanStep],
+        start: Optional[Sequence[int]] = None,
+        speed: int = 100,
+    ) -> float:
+        """Returns the estimated seconds of a single plan, see estimate_plans"""
+        return float(self.estimate_plans([plan], start=start, speed=speed)[0])
+
+    @classmethod
+    def calibrate(
+        cls,
+        records: Iterable[MoveRecord],
+        base: Optional["TravelTimeModel"] = None,
+        min_records: int = 2,
+    ) -> "TravelTimeModel":
+        """Fits the per-axis profiles to recorded single-axis moves
+
+        For moves that reach cruise velocity, t - command_time = (1 / v) * d / s + (v / a) * s is
+        linear in d / s and s, so every axis is a least squares fit. Moves too short to reach
+        cruise velocity under the first fit are dropped and the fit repeated once.
+
+        Args:
+            records ([MoveRecord]): moves recorded by the driver
+            base (TravelTimeModel): model whose overheads are kept and whose profiles are used for
+                axes with too few records, defaults to from_travel_times()
+            min_records (int): minimum number of single-axis moves needed to fit an axis
+        """
+        base = base or cls.from_travel_times()
+        velocities = base.velocities.copy()
+        accelerations = base.accelerations.copy()
+        records = list(records)
+        if records:
+            deltas = np.abs(
+                np.array([r.end for r in records], dtype=float)
+                - np.array([r.start for r in records], dtype=float)
+            )
+            speeds = np.array([r.speed for r in records], dtype=float) / 100
+            seconds = np.array([r.seconds for r in records]) - base.command_time
+            single_axis = np.count_nonzero(deltas, axis=1) == 1
+            for index in range(len(AXES)):
+                mask = single_axis & (deltas[:, index] > 0)
+                if mask.sum() < min_records:
+                    continue
+                fit = _fit_axis(deltas[mask, index], speeds[mask], seconds[mask])
+                if fit is not None:
+                    velocities[index], accelerations[index] = fit
+        return cls(
+            velocities,
+            accelerations,
+            command_time=base.command_time,
+            gripper_time=base.gripper_time,
+            speed_change_time=base.speed_change_time,
+        )
+
+
+def _fit_axis(
+    distances: np.ndarray, speeds: np.ndarray, seconds: np.ndarray
+) -> Optional[Tuple[float, float]]:
+    """Fits velocity and acceleration of one axis, None if the records do not determine them"""
+    for _ in range(2):
+        if len(distances) < 2:
+            return None
+        columns = np.column_stack([distances / speeds, speeds])
+        (inverse_velocity, ramp), *_ = np.linalg.lstsq(columns, seconds, rcond=None)
+        if inverse_velocity <= 0:
+            return None
+        velocity = 1 / inverse_velocity
+        acceleration = velocity / ramp if ramp > 0 else np.inf
+        cruising = distances >= (velocity * speeds) ** 2 / acceleration
+        if cruising.all():
+            break
+        distances, speeds, seconds = (
+            distances[cruising],
+            speeds[cruising],
+            seconds[cruising],
+        )
+    return float(velocity), float(acceleration)
+
+
+def estimate_transfer_time(
+    source: str,
+    target: str,
+    plate_type: str,
+    height_offset: int = 0,
+    has_lid: bool = False,
+    model: Optional[TravelTimeModel] = None,
+    start: Optional[Sequence[int]] = None,
+    speed: int = 100,
+    strict_motion: bool = False,
+) -> float:
+    """Returns the estimated seconds of PlateCrane.transfer
+
+    Args:
+        source (str): source location name defined in resource_defs.py
+        target (str): target location name defined in resource_defs.py
+        plate_type (str): plate definition name defined in resource_defs.py
+        height_offset (int): change in z height applied to the grip location (unit: mm)
+        has_lid (bool): True if the plate has a lid
+        model (TravelTimeModel): model to use, defaults to TravelTimeModel.from_travel_times()
+        start ([int]): [R, Z, P, Y] start pose, defaults to the Safe location
+        speed (int): speed setting at the start (unit: % of full speed)
+        strict_motion (bool): estimate the plan as compiled, without merging moves (see PlateCrane)
+    """
+    return score_routes(
+        [
+            {
+                "source": source,
+                "target": target,
+                "plate_type": plate_type,
+                "height_offset": height_offset,
+                "has_lid": has_lid,
+            }
+        ],
+        model=model,
+        start=start,
+        speed=speed,
+        strict_motion=strict_motion,
+    )[0]
+
+
+def score_routes(
+    routes: Iterable[dict],
+    model: Optional[TravelTimeModel] = None,
+    start: Optional[Sequence[int]] = None,
+    speed: int = 100,
+    strict_motion: bool = False,
+) -> List[float]:
+    """Returns the estimated seconds of many transfers, given as transfer keyword arguments.
+    See estimate_transfer_time for the other arguments."""
+    model = model or TravelTimeModel.from_travel_times()
+    if start is None:
+        start = registry.location("Safe").joint_angles
+    plans = [plan_transfer(**route) for route in routes]
+    if not strict_motion:
+        envelope = SafeEnvelope()
+        plans = [merge_safe_moves(plan, start, envelope) for plan in plans]
+    return model.estimate_plans(plans, start=start, speed=speed).tolist()
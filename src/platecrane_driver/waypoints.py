@@ -0,0 +1,112 @@
+"""Keeps named PlateCrane EX poses in device memory so moving to them takes a single MOVE transaction."""
+
+from typing import Dict, List, Optional, Tuple
+
+from platecrane_driver.resource_types import Location
+
+
+def derived_poses(
+    locations: Dict[str, Location], neutral: str = "Safe"
+) -> Dict[str, Tuple[int, int, int, int]]:
+    """Returns every location pose plus the derived poses transfers pass through.
+
+    For each location (R, Z, P, Y), with neutral Z and Y from the neutral location:
+        <name>      the location itself
+        <name>_ROT  base rotated toward the location, everything else neutral
+        <name>_ABV  arm extended above the location at neutral Z
+        <name>_RET  base and gripper toward the location, arm retracted
+        <name>_SAH  at the safe approach height, arm retracted (only if the location has one)
+        <name>_SAX  at the safe approach height, arm extended (only if the location has one)
+    """
+    _, neutral_z, neutral_p, neutral_y = locations[neutral].joint_angles
+    poses = {}
+    for name, location in locations.items():
+        R, Z, P, Y = location.joint_angles
+        poses[name] = (R, Z, P, Y)
+        poses[f"{name}_ROT"] = (R, neutral_z, neutral_p, neutral_y)
+        poses[f"{name}_ABV"] = (R, neutral_z, P, Y)
+        poses[f"{name}_RET"] = (R, neutral_z, P, neutral_y)
+        if location.safe_approach_height:
+            poses[f"{name}_SAH"] = (R, location.safe_approach_height, P, neutral_y)
+            poses[f"{name}_SAX"] = (R, location.safe_approach_height, P, Y)
+    return poses
+
+
+class WaypointManager:
+    """Bookkeeping for the named poses stored in PlateCrane EX device memory.
+
+    Named waypoints are loaded once (see sync_plan) and moved to by name. They are stored under a
+    reserved prefix (e.g. W_Safe for Safe), so points taught on the controller under the location
+    names are never overwritten, and move_location("Safe") still moves to the taught point. Poses
+    without a name are written into a small ring of reusable slots, so ad-hoc moves never create
+    and delete points.
+    """
+
+    def __init__(
+        self, ring_size: int = 4, ring_prefix: str = "TEMP", prefix: str = "W_"
+    ):
+        """Creates a new WaypointManager
+
+        Args:
+            ring_size (int): number of reusable slots for ad-hoc poses
+            ring_prefix (str): slot names are <ring_prefix>0 ... <ring_prefix><ring_size - 1>
+            prefix (str): named waypoints are stored in device memory as <prefix><name>
+        """
+        self.prefix = prefix
+        self.ring = [f"{ring_prefix}{index}" for index in range(ring_size)]
+        self.waypoints = {}
+        """{device name: pose} of the named waypoints that should live in device memory"""
+        self.device_points = {}
+        """{name: pose} of the points known to be stored in device memory"""
+        self._names_by_pose = {}
+        self._next_slot = 0
+
+    def sync_plan(
+        self,
+        waypoints: Dict[str, Tuple[int, int, int, int]],
+        device_points: Dict[str, Tuple[int, int, int, int]],
+    ) -> Dict[str, Tuple[int, int, int, int]]:
+        """Sets the named waypoints and returns the ones that must be (re)loaded into device memory,
+        by their device names (<prefix><name>)
+
+        Args:
+            waypoints: {name: (R, Z, P, Y)} poses to keep in device memory
+            device_points: {name: (R, Z, P, Y)} as currently reported by LISTPOINTS
+        """
+        self.waypoints = {
+            self.prefix + name: tuple(pose) for name, pose in waypoints.items()
+        }
+        self.device_points = {name: tuple(pose) for name, pose in device_points.items()}
+        self._names_by_pose = {}
+        for name, pose in self.waypoints.items():
+            self._names_by_pose.setdefault(pose, name)
+        return {
+            name: pose
+            for name, pose in self.waypoints.items()
+            if self.device_points.get(name) != pose
+        }
+
+    def loaded(self, name: str, pose: List[int]) -> None:
+        """Records that a point was written into device memory"""
+        self.device_points[name] = tuple(pose)
+
+    def deleted(self, name: str) -> None:
+        """Records that a point was removed from device memory"""
+        self.device_points.pop(name, None)
+
+    def name_for(self, pose: List[int]) -> Optional[str]:
+        """Returns the device name of a synced waypoint at exactly this pose, if any"""
+        name = self._names_by_pose.get(tuple(pose))
+        if name is not None and self.device_points.get(name) == tuple(pose):
+            return name
+        return None
+
+    def slot_for(self, pose: List[int]) -> Tuple[str, bool]:
+        """Returns (slot name, True if the slot must be loaded with the pose first)"""
+        pose = tuple(pose)
+        for slot in self.ring:
+            if self.device_points.get(slot) == pose:
+                return slot, False
+        slot = self.ring[self._next_slot]
+        self._next_slot = (self._next_slot + 1) % len(self.ring)
+        return slot, True
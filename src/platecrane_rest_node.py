@@ -4,10 +4,15 @@
 from pathlib import Path
 from typing import List, Union
 
+from fastapi import Request
 from fastapi.datastructures import State
+from platecrane_driver.device_state import StateRefresher
+from platecrane_driver.hardware_executor import QUERY, SAFETY, HardwareExecutor
 from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.route_cache import load_routes
 from typing_extensions import Annotated
 from wei.modules.rest_module import RESTModule
+from wei.types.module_types import ModuleState
 from wei.types.step_types import StepResponse, StepSucceeded
 from wei.utils import extract_version
 
@@ -19,6 +24,49 @@ rest_module = RESTModule(
 )
 
 rest_module.arg_parser.add_argument("--device", type=str, default="/dev/ttyUSB0")
+rest_module.arg_parser.add_argument(
+    "--read_mode",
+    type=str,
+    default="legacy",
+    choices=["legacy", "framed"],
+    help="How serial replies are read: 'framed' returns as soon as the final reply frame arrives",
+)
+
+rest_module.arg_parser.add_argument(
+    "--pipeline_window",
+    type=int,
+    default=1,
+    help="Number of non-motion commands kept in flight at once in 'framed' read mode (1 disables pipelining)",
+)
+rest_module.arg_parser.add_argument(
+    "--metrics",
+    action="store_true",
+    help="Record per-command serial timings, served on /metrics",
+)
+rest_module.arg_parser.add_argument(
+    "--strict_motion",
+    action="store_true",
+    help="Move one axis at a time instead of merging moves within the safe envelope",
+)
+rest_module.arg_parser.add_argument(
+    "--routes",
+    type=str,
+    default=None,
+    help="JSON file listing transfer routes to compile at startup, "
+    'e.g. [{"source": "Stack1", "target": "Solo.Position2", "plate_type": "flat_bottom_96well"}]',
+)
+rest_module.arg_parser.add_argument(
+    "--probe_stacks",
+    action="store_true",
+    help="Tap the top of the stack all the way from the neutral height on every stack pick, instead of descending at full speed to just above the top computed from the plate count",
+)
+rest_module.arg_parser.add_argument(
+    "--state_refresh_interval",
+    type=float,
+    default=0,
+    help="Seconds between STATUS and GETPOS reads that refresh the cached state while the PlateCrane is idle, "
+    "0 only updates it from the replies to actions",
+)
 
 rest_module.state.platecrane = None
 
@@ -27,10 +75,114 @@ rest_module.state.platecrane = None
 def platecrane_startup(state: State):
     """Handles initializing the platecrane driver."""
     state.platecrane = None
-    state.platecrane = PlateCrane(host_path=state.device)
+    # Only the executor thread talks to the PlateCrane, state.platecrane is for reading driver state
+    state.executor = HardwareExecutor(
+        lambda: PlateCrane(
+            host_path=state.device,
+            read_mode=state.read_mode,
+            pipeline_window=state.pipeline_window,
+            metrics=state.metrics,
+            strict_motion=state.strict_motion,
+            predict_stack_picks=not state.probe_stacks,
+            routes=load_routes(state.routes) if state.routes else (),
+        ),
+        name="platecrane",
+    )
+    state.platecrane = state.executor.start()
+    state.refresher = None
+    if state.state_refresh_interval > 0:
+        state.refresher = StateRefresher(
+            lambda: state.executor.call(PlateCrane.refresh_state, priority=QUERY),
+            interval=state.state_refresh_interval,
+            idle=lambda: not state.executor.busy(),
+        )
+        state.refresher.start()
     print("PLATECRANE online")
 
 
+@rest_module.shutdown()
+def platecrane_shutdown(state: State):
+    """Stops the state refresher, runs the queued calls and stops the platecrane executor"""
+    if state.refresher is not None:
+        state.refresher.stop()
+    state.executor.stop()
+
+
+@rest_module.state_handler()
+def platecrane_state(state: State) -> ModuleState:
+    """Returns the module status with the cached state of the platecrane, without sending any command"""
+    return ModuleState(
+        status=state.status,
+        error=state.error,
+        device=state.platecrane.state.snapshot(),
+        executor=state.executor.status(),
+    )
+
+
+@rest_module.router.get("/metrics")
+def metrics(request: Request):
+    """Returns the per-command serial timings of the platecrane, grouped by command verb"""
+    executor: HardwareExecutor = request.app.state.executor
+    if request.app.state.platecrane is None:
+        return {"enabled": False, "commands": {}}
+
+    def read_metrics(platecrane: PlateCrane):
+        """Copies the metrics on the executor thread, which is the only one recording them"""
+        if platecrane.metrics is None:
+            return {"enabled": False, "commands": {}}
+        return {"enabled": True, "commands": platecrane.metrics.snapshot()}
+
+    return executor.call(read_metrics, priority=QUERY)
+
+
+@rest_module.router.get("/stacks")
+def stacks(request: Request):
+    """Returns the known plate count of every stack (null if unknown) and the recent stack picks,
+    with the seconds the count-based picks saved over probing"""
+
+    def read_stacks(platecrane: PlateCrane):
+        """Copies the counts and picks on the executor thread, which is the only one changing them"""
+        picks = list(platecrane.stack_picks)
+        return {
+            "counts": dict(platecrane.stack_tracker.counts),
+            "picks": [pick._asdict() for pick in picks],
+            "saved_seconds": sum(pick.saved_seconds for pick in picks),
+        }
+
+    return request.app.state.executor.call(read_stacks, priority=QUERY)
+
+
+@rest_module.router.get("/estimate_transfer_time")
+def estimate_transfer_time(
+    request: Request,
+    source: str,
+    target: str,
+    plate_type: str = "96_well",
+    height_offset: int = 0,
+    has_lid: bool = False,
+    calibrate: bool = False,
+):
+    """Estimates how long a transfer would take from the current pose and speed, without moving.
+    calibrate=true first fits the travel-time model to the moves recorded so far."""
+
+    def estimate(platecrane: PlateCrane):
+        """Runs the estimate on the executor thread, the travel model is updated there"""
+        if calibrate:
+            platecrane.calibrate_travel_time()
+        return {
+            "seconds": platecrane.estimate_transfer_time(
+                source,
+                target,
+                plate_type=plate_type,
+                height_offset=height_offset,
+                has_lid=has_lid,
+            ),
+            "profile": platecrane.travel_model.profile(),
+        }
+
+    return request.app.state.executor.call(estimate, priority=QUERY)
+
+
 @rest_module.action()
 def transfer(
     state: State,
@@ -49,8 +201,8 @@ def transfer(
     ] = False,
 ) -> StepResponse:
     """This action picks up a plate from one location and transfers is to another."""
-    platecrane: PlateCrane = state.platecrane
-    platecrane.transfer(
+    state.executor.call(
+        PlateCrane.transfer,
         source,
         target,
         plate_type=plate_type,
@@ -60,6 +212,25 @@ def transfer(
     return StepSucceeded()
 
 
+@rest_module.action()
+def batch_transfer(
+    state: State,
+    transfers: Annotated[
+        List[dict],
+        "Transfers to run, each with source, target and plate_type (optional: height_offset, has_lid)",
+    ],
+    optimize_order: Annotated[
+        bool, "Reorder independent transfers to minimize base rotation"
+    ] = True,
+) -> StepResponse:
+    """This action runs several transfers one after another, ordered to minimize base rotation, and reports per-transfer and total timings."""
+    return StepSucceeded(
+        data=state.executor.call(
+            PlateCrane.batch_transfer, transfers, optimize_order=optimize_order
+        )
+    )
+
+
 @rest_module.action()
 def remove_lid(
     state: State,
@@ -75,8 +246,8 @@ def remove_lid(
     ] = 0,
 ):
     """This action picks up a plate lid from a plate and transfers is to another location."""
-    platecrane: PlateCrane = state.platecrane
-    platecrane.remove_lid(
+    state.executor.call(
+        PlateCrane.remove_lid,
         source=source,
         target=target,
         plate_type=plate_type,
@@ -100,8 +271,8 @@ def replace_lid(
     ] = 0,
 ):
     """This action picks up a plate lid from a location and places it on a plate."""
-    platecrane: PlateCrane = state.platecrane
-    platecrane.replace_lid(
+    state.executor.call(
+        PlateCrane.replace_lid,
         source=source,
         target=target,
         plate_type=plate_type,
@@ -110,13 +281,27 @@ def replace_lid(
     return StepSucceeded()
 
 
+@rest_module.action()
+def set_stack_count(
+    state: State,
+    stack: Annotated[str, "The stack location, e.g. Stack1"],
+    count: Annotated[int, "Number of plates in the stack, -1 if unknown"],
+) -> StepResponse:
+    """This action sets the number of plates in a stack, so picks from it skip tapping the top of the stack."""
+    state.executor.call(
+        lambda platecrane: platecrane.stack_tracker.set_count(
+            stack, None if count < 0 else count
+        )
+    )
+    return StepSucceeded()
+
+
 @rest_module.action()
 def move_safe(
     state: State,
 ):
-    """This action moves the arm to a safe location (the location named "Safe")."""
-    platecrane: PlateCrane = state.platecrane
-    platecrane.move_location("Safe")
+    """This action moves the arm to a safe location (the location named "Safe"), ahead of queued actions."""
+    state.executor.call(PlateCrane.move_location, "Safe", priority=SAFETY)
     return StepSucceeded()
 
 
@@ -126,8 +311,7 @@ def set_speed(
     speed: Annotated[int, "The speed at which the arm moves (as a percentage)."],
 ):
     """This action sets the speed at which the plate crane arm moves (as a percentage)"""
-    platecrane: PlateCrane = state.platecrane
-    platecrane.set_speed(speed=speed)
+    state.executor.call(PlateCrane.set_speed, speed=speed)
     return StepSucceeded()
 
 
@@ -4,11 +4,14 @@
 from pathlib import Path
 
 from fastapi.datastructures import State
+from platecrane_driver.device_state import StateRefresher
+from platecrane_driver.hardware_executor import QUERY, SAFETY, HardwareExecutor
 from platecrane_driver.sciclops_driver import SCICLOPS
+from platecrane_driver.sciclops_simulator import SciclopsSimulator
 from typing_extensions import Annotated
 from wei.modules.rest_module import RESTModule
-from wei.types.module_types import ModuleStatus
-from wei.types.step_types import StepSucceeded
+from wei.types.module_types import ModuleState, ModuleStatus
+from wei.types.step_types import StepFailed, StepSucceeded
 from wei.utils import extract_version
 
 rest_module = RESTModule(
@@ -18,6 +21,54 @@ rest_module = RESTModule(
     model="sciclops",
 )
 
+rest_module.arg_parser.add_argument(
+    "--first_byte_timeout",
+    type=float,
+    default=30.0,
+    help="Seconds to wait for the first reply line of a command other than a move before giving up on it",
+)
+rest_module.arg_parser.add_argument(
+    "--inter_byte_timeout",
+    type=float,
+    default=0.5,
+    help="Seconds of silence after a reply line that end a reply without a status line",
+)
+rest_module.arg_parser.add_argument(
+    "--labware_file",
+    type=str,
+    default=None,
+    help="JSON file the labware state (plate counts, lids) is persisted to across restarts",
+)
+rest_module.arg_parser.add_argument(
+    "--probe_towers",
+    action="store_true",
+    help="Tap the top of the tower on every pick instead of computing it from the plate count",
+)
+rest_module.arg_parser.add_argument(
+    "--exchange_sensor",
+    action="store_true",
+    help="Allow get_plates and plates_to_stack batches of more than one plate, which wait on GETPLATEPRESENT "
+    "between plates (only once it is confirmed to read the exchange sensor of this robot)",
+)
+rest_module.arg_parser.add_argument(
+    "--simulate",
+    action="store_true",
+    help="Run against a simulated Sciclops instead of the USB device",
+)
+rest_module.arg_parser.add_argument(
+    "--time_scale",
+    type=float,
+    default=1.0,
+    help="Multiplier of the simulated motion times with --simulate, 0 makes them instant",
+)
+rest_module.arg_parser.add_argument(
+    "--state_refresh_interval",
+    type=float,
+    default=0,
+    help="Seconds between STATUS and GETPOS reads that refresh the cached state while the Sciclops is idle, "
+    "0 only updates it from the replies to actions",
+)
+
 
 @rest_module.startup()
 def sciclops_startup(state: State):
@@ -31,22 +82,77 @@ def sciclops_startup(state: State):
     -------
     None"""
     print("Hello, World!")
-    state.sciclops = SCICLOPS()
+    backend = None
+    if state.simulate:
+        state.simulator = SciclopsSimulator(time_scale=state.time_scale)
+        backend = state.simulator.backend
+    # Only the executor thread talks to the Sciclops, state.sciclops is for reading driver state
+    state.executor = HardwareExecutor(
+        lambda: SCICLOPS(
+            first_byte_timeout=state.first_byte_timeout,
+            inter_byte_timeout=state.inter_byte_timeout,
+            labware_file=state.labware_file,
+            backend=backend,
+            predict_tower_tops=not state.probe_towers,
+            exchange_sensor=state.exchange_sensor,
+        ),
+        name="sciclops",
+    )
+    state.sciclops = state.executor.start()
+    state.refresher = None
+    if state.state_refresh_interval > 0:
+        state.refresher = StateRefresher(
+            lambda: state.executor.call(SCICLOPS.refresh_state, priority=QUERY),
+            interval=state.state_refresh_interval,
+            idle=lambda: not state.executor.busy(),
+        )
+        state.refresher.start()
     print("SCICLOPS online")
 
 
+@rest_module.shutdown()
+def sciclops_shutdown(state: State):
+    """Stops the state refresher, runs the queued calls and disconnects from the sciclops"""
+    if state.refresher is not None:
+        state.refresher.stop()
+    state.executor.call(SCICLOPS.disconnect_robot)
+    state.executor.stop()
+
+
+@rest_module.state_handler()
+def sciclops_state(state: State) -> ModuleState:
+    """Returns the module status with the cached state of the sciclops, without sending any command"""
+    return ModuleState(
+        status=state.status,
+        error=state.error,
+        device=state.sciclops.state.snapshot(),
+        executor=state.executor.status(),
+    )
+
+
 @rest_module.action(name="status")
 def status(state: State):
-    """Action that forces the sciclops to check its status."""
-    sciclops: SCICLOPS = state.sciclops
-    sciclops.get_status()
-    return StepSucceeded()
+    """Action that returns the last known status of the sciclops, with its cached state (pose, gripper,
+    speed, movement state, last error and plate counts). No command is sent to the sciclops."""
+    snapshot = state.sciclops.state.snapshot()
+    return StepSucceeded(data={"status": snapshot["status"], "device": snapshot})
 
 
 @rest_module.action()
 def home(state: State):
-    """Homes the sciclops"""
-    state.sciclops.home()
+    """Homes the sciclops, ahead of queued actions"""
+    state.executor.call(SCICLOPS.home, priority=SAFETY)
+    return StepSucceeded()
+
+
+@rest_module.action(name="set_tower_count")
+def set_tower_count(
+    state: State,
+    tower: Annotated[str, "Tower to set the plate count of, e.g. tower1"],
+    count: Annotated[int, "Number of plates in the tower"],
+):
+    """Sets the plate count of a tower, picks from it then skip tapping the top of the tower"""
+    state.executor.call(SCICLOPS.set_tower_count, tower, count)
     return StepSucceeded()
 
 
@@ -58,8 +164,62 @@ def get_plate(
     trash: Annotated[bool, "Whether to use the trash"] = False,
 ):
     """Get a plate from a stack position and move it to transfer point (or trash)"""
-    state.sciclops.get_plate(pos, lid, trash)
+    state.executor.call(SCICLOPS.get_plate, pos, lid, trash)
     return StepSucceeded()
 
 
+@rest_module.action(name="get_plates")
+def get_plates(
+    state: State,
+    tower: Annotated[str, "Tower to get the plates from, e.g. tower1"],
+    count: Annotated[int, "Number of plates to move to the exchange"],
+    lid: Annotated[bool, "Whether to remove the lid of every plate"] = False,
+    trash: Annotated[bool, "Whether to put removed lids in the trash"] = False,
+    exchange_timeout: Annotated[
+        float, "Seconds to wait for the exchange to be cleared between plates"
+    ] = 600,
+):
+    """Moves several plates from a tower to the exchange, one at a time, and reports per-plate timings"""
+    timings = state.executor.call(
+        SCICLOPS.get_plates,
+        tower,
+        count,
+        remove_lid=lid,
+        trash=trash,
+        exchange_timeout=exchange_timeout,
+    )
+    if len(timings) < count:
+        return StepFailed(
+            error=f"Exchange was not cleared in time, moved {len(timings)} of {count} plates",
+            data={"plates": timings},
+        )
+    return StepSucceeded(data={"plates": timings})
+
+
+@rest_module.action(name="plates_to_stack")
+def plates_to_stack(
+    state: State,
+    tower: Annotated[str, "Tower to put the plates in, e.g. tower1"],
+    count: Annotated[int, "Number of plates to take from the exchange"],
+    add_lid: Annotated[bool, "Whether to put a lid on every plate first"] = False,
+    exchange_timeout: Annotated[
+        float, "Seconds to wait for the next plate on the exchange"
+    ] = 600,
+):
+    """Moves several plates from the exchange to a tower, one at a time, and reports per-plate timings"""
+    timings = state.executor.call(
+        SCICLOPS.plates_to_stack,
+        tower,
+        count,
+        add_lid=add_lid,
+        exchange_timeout=exchange_timeout,
+    )
+    if len(timings) < count:
+        return StepFailed(
+            error=f"No plate on the exchange in time, moved {len(timings)} of {count} plates",
+            data={"plates": timings},
+        )
+    return StepSucceeded(data={"plates": timings})
+
+
 rest_module.start()
@@ -0,0 +1,53 @@
+"""Tests the asyncio serial interface of the PlateCrane against a pty."""
+
+import asyncio
+import os
+import threading
+import unittest
+
+from platecrane_driver.async_serial_port import AsyncSerialPort
+
+
+def echo_controller(master_fd):
+    """Echoes each command line and answers it with a status line."""
+    buffer = b""
+    while True:
+        try:
+            buffer += os.read(master_fd, 1024)
+        except OSError:
+            return
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            command = line.strip(b"\r")
+            os.write(master_fd, command + b"\r\n0000 " + command + b" done\r\n")
+
+
+class TestAsyncSerialPort(unittest.TestCase):
+    """Tests that AsyncSerialPort awaits framed replies."""
+
+    def test_concurrent_commands_are_serialized(self):
+        """Concurrent callers each get the reply to their own command"""
+        master_fd, slave_fd = os.openpty()
+        threading.Thread(target=echo_controller, args=[master_fd], daemon=True).start()
+
+        async def run():
+            port = AsyncSerialPort(host_path=os.ttyname(slave_fd))
+            await port.connect()
+            try:
+                return await asyncio.gather(
+                    port.send_command("OPEN\r\n"),
+                    port.send_command("CLOSE\r\n"),
+                )
+            finally:
+                await port.disconnect()
+
+        try:
+            replies = asyncio.run(run())
+        finally:
+            os.close(master_fd)
+            os.close(slave_fd)
+        assert replies == ["0000 OPEN done", "0000 CLOSE done"]
+
+
+if __name__ == "__main__":
+    unittest.main()
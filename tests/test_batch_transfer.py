@@ -0,0 +1,99 @@
+"""Tests the ordering and execution of PlateCrane batch transfers."""
+
+import unittest
+
+from platecrane_driver.batch_transfer import (
+    TransferRequest,
+    base_travel,
+    dependencies,
+    order_transfers,
+)
+from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.resource_defs import locations
+
+PLATE = "flat_bottom_96well"
+TRANSFERS = [
+    TransferRequest(source="Stack1", target="Solo.Position2", plate_type=PLATE),
+    TransferRequest(source="Stack5", target="Liconic.Nest", plate_type=PLATE),
+    TransferRequest(source="Solo.Position2", target="Stack2", plate_type=PLATE),
+]
+
+
+class TestOrderTransfers(unittest.TestCase):
+    """Tests that batches are reordered by base travel without breaking dependencies."""
+
+    def test_shared_locations_are_dependencies(self):
+        """A transfer depends on every earlier transfer that touches one of its locations"""
+        assert dependencies(TRANSFERS) == [[], [], [0]]
+
+    def test_nearest_source_first(self):
+        """The plate left on Solo.Position2 is picked up before rotating to Stack5"""
+        order = order_transfers(TRANSFERS)
+        assert order == [0, 2, 1]
+        start_r = locations["Safe"].joint_angles[0]
+        assert base_travel(TRANSFERS, order, start_r) < base_travel(
+            TRANSFERS, [0, 1, 2], start_r
+        )
+
+    def test_dependencies_are_kept(self):
+        """A dependent transfer never runs first, even when its source is closest"""
+        start_r = locations["Solo.Position2"].joint_angles[0]
+        order = order_transfers(TRANSFERS, start_r=start_r)
+        assert order.index(0) < order.index(2)
+
+    def test_ties_keep_request_order(self):
+        """Transfers from the same base angle run in the order they were requested"""
+        transfers = [
+            TransferRequest(source="Stack2", target="Stack3", plate_type=PLATE),
+            TransferRequest(source="Safe", target="Stack4", plate_type=PLATE),
+        ]
+        assert order_transfers(transfers) == [0, 1]
+
+
+class TestBatchTransfer(unittest.TestCase):
+    """Tests batch transfers against the simulated controller."""
+
+    def setUp(self):
+        """Starts an instant simulator"""
+        self.simulator = PlateCraneSimulator(time_scale=0)
+
+    def tearDown(self):
+        """Stops the simulator"""
+        self.simulator.close()
+
+    def test_batch_transfer(self):
+        """Every transfer runs once in the optimized order and is timed"""
+        platecrane = PlateCrane(self.simulator.port_path, read_mode="framed")
+        result = platecrane.batch_transfer(
+            [transfer.model_dump() for transfer in TRANSFERS]
+        )
+        assert result["order"] == [0, 2, 1]
+        assert [move["target"] for move in result["moves"]] == [
+            "Solo.Position2",
+            "Stack2",
+            "Liconic.Nest",
+        ]
+        assert result["total_seconds"] >= sum(
+            move["seconds"] for move in result["moves"]
+        )
+        assert self.simulator.pose[0] == locations["Liconic.Nest"].joint_angles[0]
+
+    def test_unknown_location_runs_nothing(self):
+        """A batch with an undefined location fails before the first move"""
+        platecrane = PlateCrane(self.simulator.port_path, read_mode="framed")
+        commands = len(self.simulator.command_log)
+        with self.assertRaisesRegex(Exception, "not defined"):
+            platecrane.batch_transfer(
+                [
+                    TRANSFERS[0],
+                    TransferRequest(
+                        source="Stack1", target="Nowhere", plate_type=PLATE
+                    ),
+                ]
+            )
+        assert len(self.simulator.command_log) == commands
+
+
+if __name__ == "__main__":
+    unittest.main()
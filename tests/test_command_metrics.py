@@ -0,0 +1,61 @@
+"""Tests the per-command metrics of the PlateCrane serial link."""
+
+import unittest
+
+from platecrane_driver.command_metrics import Histogram
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.serial_port import SerialPort
+
+
+class TestCommandMetrics(unittest.TestCase):
+    """Tests that commands are recorded by verb."""
+
+    def test_histogram_buckets(self):
+        """Values land in the first bucket whose bound is not exceeded"""
+        histogram = Histogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        assert snapshot["buckets"] == {"0.1": 2, "1.0": 1, "+Inf": 1}
+        assert (snapshot["count"], snapshot["max"]) == (4, 3.0)
+
+    def test_serial_port_records_commands(self):
+        """Every sent command is recorded under its verb, pipelined or not"""
+        simulator = PlateCraneSimulator(time_scale=0)
+        port = SerialPort(
+            host_path=simulator.port_path,
+            read_mode="framed",
+            pipeline_window=2,
+            metrics=True,
+        )
+        try:
+            port.send_command("GETPOS\r\n")
+            port.send_pipelined(["OPEN\r\n", "CLOSE\r\n", "MOVE Nowhere\r\n"])
+        finally:
+            port.connection.close()
+            port.connection_status.close()
+            simulator.close()
+
+        snapshot = port.metrics.snapshot()
+        assert set(snapshot) == {"GETPOS", "OPEN", "CLOSE", "MOVE"}
+        getpos = snapshot["GETPOS"]
+        assert getpos["commands"] == 1
+        assert getpos["bytes_out"] == len("GETPOS\r\n")
+        assert getpos["bytes_in"] > len("GETPOS\r\n")
+        assert getpos["first_byte_latency"]["count"] == 1
+        assert snapshot["MOVE"]["errors"] == 1
+
+    def test_disabled_by_default(self):
+        """Without metrics nothing is recorded"""
+        simulator = PlateCraneSimulator(time_scale=0)
+        port = SerialPort(host_path=simulator.port_path, read_mode="framed")
+        try:
+            assert port.metrics is None
+        finally:
+            port.connection.close()
+            port.connection_status.close()
+            simulator.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,18 @@
+"""Checks PlateCrane commands per transfer against the stored cycle time baselines."""
+
+import unittest
+
+from platecrane_driver import cycle_time
+
+
+class TestCycleTime(unittest.TestCase):
+    """Fails when a route needs more commands or round trips than its baseline."""
+
+    def test_no_command_regressions(self):
+        """Every benchmark route stays within its stored command and round trip counts"""
+        results = cycle_time.run_all(time_scale=0)
+        assert cycle_time.regressions(results, cycle_time.load_baseline()) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Tests the cached device state the drivers update from the command replies."""
+
+import contextlib
+import io
+import threading
+import unittest
+
+from platecrane_driver.device_state import DeviceState, StateRefresher
+from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.sciclops_driver import SCICLOPS
+from platecrane_driver.sciclops_simulator import SciclopsSimulator
+from platecrane_driver.stack_tracker import plate_top_steps
+
+
+class TestDeviceState(unittest.TestCase):
+    """Tests snapshots and the background refresher."""
+
+    def test_snapshots(self):
+        """Updates replace the snapshot, earlier snapshots stay as they were"""
+        state = DeviceState(labware={"Stack1": 3})
+        before = state.snapshot()
+        assert before is state.snapshot()
+        assert before["updated"] is None
+
+        state.update(gripper="open", speed=50)
+        state.update_labware(Stack2=1)
+        after = state.snapshot()
+        assert before["gripper"] is None and before["labware"] == {"Stack1": 3}
+        assert after["gripper"] == "open" and after["speed"] == 50
+        assert after["labware"] == {"Stack1": 3, "Stack2": 1}
+        assert after["updated"] is not None
+        with self.assertRaisesRegex(Exception, "Unknown device state fields"):
+            state.update(temperature=20)
+
+    def test_refresher_waits_for_idle(self):
+        """The refresher skips refreshes while the device is busy"""
+        busy = threading.Event()
+        busy.set()
+        refreshed = threading.Event()
+        refresher = StateRefresher(
+            refreshed.set, interval=0.01, idle=lambda: not busy.is_set()
+        )
+        refresher.start()
+        self.addCleanup(refresher.stop)
+        assert not refreshed.wait(timeout=0.1)
+        busy.clear()
+        assert refreshed.wait(timeout=5)
+        refresher.stop()
+        assert refresher.refreshes >= 1
+
+
+class TestPlateCraneState(unittest.TestCase):
+    """Runs the PlateCrane driver against the simulator and checks its state."""
+
+    def setUp(self):
+        """Starts an instant simulator with 3 plates in Stack1 and connects a driver to it"""
+        top = plate_top_steps("flat_bottom_96well", has_lid=False)
+        self.simulator = PlateCraneSimulator(time_scale=0, stacks={"Stack1": [top] * 3})
+        self.addCleanup(self.simulator.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.platecrane = PlateCrane(
+                self.simulator.port_path,
+                read_mode="framed",
+                stack_counts={"Stack1": 3},
+            )
+
+    def test_transfer(self):
+        """A transfer updates the pose, gripper and stack count without extra commands"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.platecrane.transfer(
+                "Stack1", "Solo.Position2", plate_type="flat_bottom_96well"
+            )
+        commands = len(self.simulator.command_log)
+        snapshot = self.platecrane.state.snapshot()
+        assert len(self.simulator.command_log) == commands
+        assert snapshot["pose"] == self.simulator.pose
+        assert snapshot["gripper"] == "open"
+        assert snapshot["speed"] == 100
+        assert snapshot["movement_state"] == "READY"
+        assert snapshot["labware"] == {"Stack1": 2}
+        assert snapshot["last_error"] is None
+
+    def test_error_reply(self):
+        """An error reply is kept as the last error with the command it answered"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.platecrane.move_location("Nowhere")
+        assert self.platecrane.state["movement_state"] == "ERROR"
+        assert self.platecrane.state["last_error"].startswith("MOVE Nowhere:")
+        assert self.platecrane.state["pose"] is None
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.platecrane.refresh_state()
+        assert self.platecrane.state["pose"] == self.simulator.pose
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.platecrane.move_location("Safe")
+        assert self.platecrane.state["movement_state"] == "READY"
+
+
+class TestSciclopsState(unittest.TestCase):
+    """Runs the Sciclops driver against the simulator and checks its state."""
+
+    def test_routine(self):
+        """Moves, gripper, speed and plate counts of a routine end up in the state"""
+        simulator = SciclopsSimulator(time_scale=0)
+        self.addCleanup(simulator.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sciclops = SCICLOPS(backend=simulator.backend)
+            self.addCleanup(sciclops.disconnect_robot)
+            sciclops.home()
+        pose = simulator.pose
+        snapshot = sciclops.state.snapshot()
+        assert snapshot["status"] == "Ready"
+        assert snapshot["pose"] == [pose["Z"], pose["R"], pose["Y"], pose["P"]]
+        assert snapshot["movement_state"] == "READY"
+        assert snapshot["labware"]["tower1"] == 1
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            sciclops.set_speed(30)
+            sciclops.open()
+            sciclops.set_tower_count("tower2", 4)
+            sciclops.send_command("MOVE Nowhere\r\n")
+        snapshot = sciclops.state.snapshot()
+        assert snapshot["speed"] == 30
+        assert snapshot["gripper"] == "open"
+        assert snapshot["labware"]["tower2"] == 4
+        assert snapshot["movement_state"] == "ERROR"
+        assert snapshot["last_error"] == "MOVE Nowhere: 0010 Point not found"
+
+
+if __name__ == "__main__":
+    unittest.main()
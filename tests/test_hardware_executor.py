@@ -0,0 +1,121 @@
+"""Tests the executor that owns a device driver and runs calls to it on a single thread."""
+
+import contextlib
+import io
+import threading
+import unittest
+
+from platecrane_driver.hardware_executor import (
+    ACTION,
+    QUERY,
+    SAFETY,
+    HardwareExecutor,
+)
+from platecrane_driver.sciclops_driver import SCICLOPS
+from platecrane_driver.sciclops_simulator import SciclopsSimulator
+
+
+class FakeDriver:
+    """Records the calls it gets and the threads they run on"""
+
+    def __init__(self):
+        """Creates the fake driver"""
+        self.calls = []
+        self.threads = {threading.current_thread().name}
+
+    def record(self, name):
+        """Records a call"""
+        self.threads.add(threading.current_thread().name)
+        self.calls.append(name)
+        return name
+
+    def block(self, started, release):
+        """Sets started and waits until release is set, keeping the executor busy"""
+        started.set()
+        release.wait(timeout=5)
+
+    def fail(self):
+        """Raises an error"""
+        raise Exception("gripper jammed")
+
+
+class TestHardwareExecutor(unittest.TestCase):
+    """Tests call ordering and errors."""
+
+    def setUp(self):
+        """Starts an executor with a fake driver"""
+        self.executor = HardwareExecutor(FakeDriver, name="fake")
+        self.driver = self.executor.start(timeout=5)
+        self.addCleanup(self.executor.stop, 5)
+
+    def test_priority_order(self):
+        """Queued calls run by priority and in submission order, on the executor thread only"""
+        started, release = threading.Event(), threading.Event()
+        self.executor.submit(FakeDriver.block, started, release)
+        started.wait(timeout=5)
+        futures = [
+            self.executor.submit(FakeDriver.record, "status", priority=QUERY),
+            self.executor.submit(FakeDriver.record, "transfer 1", priority=ACTION),
+            self.executor.submit(FakeDriver.record, "transfer 2", priority=ACTION),
+            self.executor.submit(FakeDriver.record, "move_safe", priority=SAFETY),
+        ]
+        assert self.executor.busy()
+        assert self.executor.status()["queued"] == 4
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        assert self.driver.calls == ["move_safe", "transfer 1", "transfer 2", "status"]
+        assert self.driver.threads == {"fake-executor"}
+
+    def test_errors(self):
+        """An exception of a call is raised to its caller and kept as the last error"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaisesRegex(Exception, "gripper jammed"):
+                self.executor.call(FakeDriver.fail)
+        assert self.executor.status()["last_error"] == "fail: gripper jammed"
+        assert self.executor.call(FakeDriver.record, "after") == "after"
+
+    def test_stopped(self):
+        """Calls are refused once the executor stopped"""
+        self.executor.stop(5)
+        with self.assertRaisesRegex(Exception, "not running"):
+            self.executor.submit(FakeDriver.record, "late")
+
+
+class TestConcurrentClients(unittest.TestCase):
+    """Runs concurrent routines and status reads against the simulated Sciclops."""
+
+    def test_no_interleaved_replies(self):
+        """Position reads from several threads during a routine all get a well-formed reply"""
+        simulator = SciclopsSimulator(time_scale=0)
+        self.addCleanup(simulator.close)
+        executor = HardwareExecutor(
+            lambda: SCICLOPS(backend=simulator.backend), name="sciclops"
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            executor.start(timeout=5)
+            self.addCleanup(executor.stop, 5)
+            self.addCleanup(executor.call, SCICLOPS.disconnect_robot)
+
+            positions = []
+
+            def poll():
+                for _ in range(5):
+                    positions.append(
+                        executor.call(SCICLOPS.get_position, priority=QUERY)
+                    )
+
+            threads = [threading.Thread(target=poll) for _ in range(4)]
+            routine = executor.submit(SCICLOPS.clear_arm)
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+            routine.result(timeout=10)
+
+        assert len(positions) == 20
+        assert all(position is not None for position in positions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Tests the journaled labware store."""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from platecrane_driver.labware_store import LabwareStore
+
+DEFAULTS = {
+    "tower1": {"howmany": 3, "type": "96_well"},
+    "exchange": {"howmany": 0, "has_lid": False},
+}
+
+
+class TestLabwareStore(unittest.TestCase):
+    """Tests persisting, replaying and compacting labware updates."""
+
+    def setUp(self):
+        """Creates a temporary directory for the store"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "labware.json"
+
+    def test_updates_survive_a_restart(self):
+        """Updates are replayed from the journal when the store is opened again without closing it"""
+        store = LabwareStore(self.path, defaults=DEFAULTS)
+        store.update("tower1", howmany=2)
+        store.update("exchange", howmany=1, has_lid=True)
+        assert not self.path.exists()
+        assert len(store.journal_path.read_text().splitlines()) == 2
+
+        reopened = LabwareStore(self.path, defaults=DEFAULTS)
+        assert reopened.labware["tower1"] == {"howmany": 2, "type": "96_well"}
+        assert reopened.labware["exchange"] == {"howmany": 1, "has_lid": True}
+        assert DEFAULTS["tower1"]["howmany"] == 3
+
+    def test_compaction(self):
+        """The journal is folded into the snapshot after compact_every updates"""
+        store = LabwareStore(self.path, defaults=DEFAULTS, compact_every=3)
+        for howmany in (2, 1, 0, 5):
+            store.update("tower1", howmany=howmany)
+        assert json.loads(self.path.read_text())["tower1"]["howmany"] == 0
+        assert store.journal_entries == 1
+        assert LabwareStore(self.path).labware["tower1"]["howmany"] == 5
+
+        store.close()
+        assert store.journal_path.read_text() == ""
+        assert json.loads(self.path.read_text())["tower1"]["howmany"] == 5
+
+    def test_incomplete_journal_entry_is_ignored(self):
+        """A journal line cut short by a crash is skipped, earlier updates are kept"""
+        store = LabwareStore(self.path, defaults=DEFAULTS)
+        store.update("tower1", howmany=2)
+        with open(store.journal_path, "a") as f:
+            f.write('{"location": "tower1", "val')
+        assert (
+            LabwareStore(self.path, defaults=DEFAULTS).labware["tower1"]["howmany"] == 2
+        )
+
+    def test_two_crashes_in_a_row(self):
+        """Updates after a torn entry are recovered after the next crash too"""
+        store = LabwareStore(self.path, defaults=DEFAULTS)
+        store.update("tower1", howmany=2)
+        with open(store.journal_path, "a") as f:
+            f.write('{"location": "tower1", "val')
+
+        recovered = LabwareStore(self.path, defaults=DEFAULTS)
+        recovered.update("tower1", howmany=1)
+        recovered.update("tower1", howmany=0)
+        assert len(recovered.journal_path.read_text().splitlines()) == 3
+
+        assert (
+            LabwareStore(self.path, defaults=DEFAULTS).labware["tower1"]["howmany"] == 0
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Tests the PlateCrane motion plan compiler and pose tracking."""
+
+import unittest
+
+from platecrane_driver import motion_plan
+from platecrane_driver.motion_plan import STACK_SPEED, PoseTracker, SpeedManager
+from platecrane_driver.resource_defs import locations
+
+
+class TestMotionPlan(unittest.TestCase):
+    """Tests that transfers compile into the expected motion plans."""
+
+    def test_transfer_plan(self):
+        """A stack to nest transfer probes the stack once and ends at neutral"""
+        plan = motion_plan.plan_transfer(
+            "Stack1", "Solo.Position2", plate_type="flat_bottom_96well"
+        )
+        moves = [step for step in plan if step.action == "move"]
+        assert [step.probe for step in moves].count(True) == 1
+        assert [step.speed for step in moves if step.probe] == [STACK_SPEED]
+        assert not any(step.action == "set_speed" for step in plan)
+        assert moves[-1].joints == (None, locations["Safe"].joint_angles[1], None, None)
+
+    def test_safe_approach_plan(self):
+        """Safe approach picks only lower the arm after rotating toward the source"""
+        plan = motion_plan.plan_pick_plate_safe_approach("Hidex.Nest", 100)
+        descriptions = [step.description for step in plan]
+        assert descriptions.index("rotate base toward Hidex.Nest") < descriptions.index(
+            "lower to safe approach height"
+        )
+
+    def test_pose_tracker_checkpoints(self):
+        """GETPOS is only needed while the pose is unknown or the verify interval elapsed"""
+        tracker = PoseTracker(verify_interval=2)
+        assert tracker.needs_checkpoint((1, None, None, None))
+        assert not tracker.needs_checkpoint((1, 2, 3, 4))
+
+        tracker.measured([0, 0, 0, 0])
+        assert not tracker.needs_checkpoint((1, None, None, None))
+        assert tracker.resolve((1, None, None, 5)) == [1, 0, 0, 5]
+
+        tracker.commanded([1, 0, 0, 5])
+        tracker.jogged("Z", 100)
+        assert tracker.pose == [1, 100, 0, 5]
+        assert tracker.needs_checkpoint((None, None, None, None))
+
+        tracker.invalidate()
+        assert tracker.pose is None
+
+    def test_speed_manager(self):
+        """SPEED is only needed when a step runs at another speed than the acknowledged one"""
+        speeds = SpeedManager()
+        assert speeds.needs_change(100)
+        speeds.acknowledged(100)
+
+        plain = motion_plan.move(Z=0)
+        slow = motion_plan.move(Z=0, speed=STACK_SPEED)
+        assert not speeds.needs_change(speeds.speed_for(plain))
+        assert speeds.needs_change(speeds.speed_for(slow))
+
+        speeds.default_speed = 30
+        assert speeds.speed_for(plain) == 30
+        speeds.invalidate()
+        assert speeds.needs_change(100)
+
+
+if __name__ == "__main__":
+    unittest.main()
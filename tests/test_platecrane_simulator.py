@@ -0,0 +1,67 @@
+"""Tests the PlateCrane driver against the simulated controller."""
+
+import unittest
+
+from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.resource_defs import locations
+
+
+class TestPlateCraneSimulator(unittest.TestCase):
+    """Tests that the unmodified driver runs against the simulator."""
+
+    def setUp(self):
+        """Starts an instant simulator of an unhomed robot"""
+        self.simulator = PlateCraneSimulator(time_scale=0, homed=False)
+
+    def tearDown(self):
+        """Stops the simulator"""
+        self.simulator.close()
+
+    def test_transfer(self):
+        """A transfer ends at neutral above the target and the tracked pose matches the device"""
+        platecrane = PlateCrane(self.simulator.port_path, read_mode="framed")
+        assert "HOME" in self.simulator.command_log
+
+        platecrane.transfer("Stack1", "Solo.Position2", plate_type="flat_bottom_96well")
+        R, _, P, _ = locations["Solo.Position2"].joint_angles
+        _, Z, _, Y = locations["Safe"].joint_angles
+        assert self.simulator.pose == [R, Z, P, Y]
+        assert platecrane.platecrane_current_position == self.simulator.pose
+        assert self.simulator.gripper_open
+
+    def test_speed_changes(self):
+        """A stack pick slows down for the tap only, and repeated speeds are not resent"""
+        platecrane = PlateCrane(self.simulator.port_path, read_mode="framed")
+        platecrane.set_speed(100)
+        start = len(self.simulator.command_log)
+
+        platecrane.transfer("Stack1", "Solo.Position2", plate_type="flat_bottom_96well")
+        speeds = [
+            command
+            for command in self.simulator.command_log[start:]
+            if command.startswith("SPEED")
+        ]
+        assert speeds == ["SPEED 50", "SPEED 100"]
+        assert self.simulator.speed == platecrane.speed == 100
+
+    def test_taught_points_are_kept(self):
+        """Syncing the waypoints leaves points taught under location names alone"""
+        self.simulator.close()
+        taught = [182000, 2400, 460, -300]
+        self.simulator = PlateCraneSimulator(
+            time_scale=0, taught_points={"Safe": taught}
+        )
+        platecrane = PlateCrane(self.simulator.port_path, read_mode="framed")
+        assert self.simulator.points["Safe"] == taught
+        assert self.simulator.points["W_Safe"] == list(locations["Safe"].joint_angles)
+        platecrane.move_location("Safe")
+        assert self.simulator.pose == taught
+
+    def test_unknown_point(self):
+        """Moving to a point that is not in device memory is answered with an error code"""
+        assert self.simulator.execute("MOVE Nowhere") == ["02"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests the resource registry."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from platecrane_driver.resource_defs import locations
+from platecrane_driver.resource_registry import (
+    RESOURCE_DIR,
+    ResourceRegistry,
+    registry,
+)
+from platecrane_driver.resource_types import PlateResource
+
+
+class TestResourceRegistry(unittest.TestCase):
+    """Tests lookups, precomputed steps and hot reloading."""
+
+    def setUp(self):
+        """Copies the packaged Sciclops plate file to a temporary directory"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        name = "sciclops_plate_resources.json"
+        shutil.copy(RESOURCE_DIR / name, self.directory / name)
+        self.registry = ResourceRegistry(
+            sciclops_plate_file=self.directory / "sciclops_plate_resources.json",
+            check_interval=0,
+        )
+
+    def test_lookups(self):
+        """Entries are frozen and carry their heights in motor steps"""
+        plate = registry.plate("flat_bottom_96well")
+        assert plate.grip_height_steps == PlateResource.convert_to_steps(
+            plate.grip_height
+        )
+        location = registry.location("Stack1")
+        assert location.joint_angles == tuple(locations["Stack1"].joint_angles)
+        with self.assertRaises(AttributeError):
+            location.location_type = "nest"
+        with self.assertRaises(TypeError):
+            registry.locations["Stack1"] = location
+        assert registry.sciclops_plate("96_well").grab_tower == -18
+        with self.assertRaisesRegex(Exception, "not defined"):
+            registry.location("Nowhere")
+
+    def test_json_hot_reload(self):
+        """A changed file mtime reloads the file and increments the generation"""
+        path = self.directory / "sciclops_plate_resources.json"
+        generation = self.registry.generation
+        plates = json.loads(path.read_text())
+        plates["96_well"]["grab_tower"] = -20
+        path.write_text(json.dumps(plates))
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+        assert self.registry.sciclops_plate("96_well").grab_tower == -20
+        assert self.registry.generation == generation + 1
+        assert self.registry.refresh() == generation + 1
+
+    def test_definition_edit_is_reloaded_on_refresh(self):
+        """Editing a resource_defs location is picked up by refresh()"""
+        generation = self.registry.generation
+        location = locations["Stack2"]
+        original = list(location.joint_angles)
+        try:
+            location.joint_angles[0] += 1
+            assert self.registry.refresh() == generation + 1
+            assert self.registry.location("Stack2").joint_angles[0] == original[0] + 1
+        finally:
+            location.joint_angles[:] = original
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""Tests the PlateCrane reply parsers."""
+
+import unittest
+
+from platecrane_driver.error_codes import (
+    InvalidLocationError,
+    MalformedReplyError,
+    ZAxisCrashError,
+)
+from platecrane_driver.response_parser import (
+    parse_point_list,
+    parse_position,
+    parse_status,
+)
+
+
+class TestResponseParser(unittest.TestCase):
+    """Tests that replies are parsed into typed results or typed errors."""
+
+    def test_position(self):
+        """Positions are parsed from framed and legacy replies, skipping leftover lines"""
+        assert parse_position("182220, 2500, 460, -308") == (182220, 2500, 460, -308)
+        assert parse_position("\n0000 Success\n1 -2 3 -4") == (1, -2, 3, -4)
+
+    def test_position_errors(self):
+        """Error codes raise their own exception, anything else is malformed"""
+        with self.assertRaises(ZAxisCrashError):
+            parse_position("\n1400")
+        with self.assertRaises(InvalidLocationError):
+            parse_position("02")
+        with self.assertRaises(MalformedReplyError):
+            parse_position("0000 Success")
+        with self.assertRaises(MalformedReplyError):
+            parse_position("__import__('os')")
+
+    def test_status(self):
+        """The status line is split into code and message"""
+        status = parse_status("1:Safe, 1, 2, 3, 4\n0000 Success")
+        assert (status.code, status.message) == (0, "Success")
+
+    def test_point_list(self):
+        """LISTPOINTS entries are parsed, other lines are ignored"""
+        assert parse_point_list(
+            "LISTPOINTS\n28:SealerNest, 210256, -1050, 491, 5730\n0000 Success"
+        ) == {"SealerNest": (210256, -1050, 491, 5730)}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Tests the PlateCrane transfer route cache."""
+
+import unittest
+
+from platecrane_driver.resource_defs import locations
+from platecrane_driver.route_cache import RouteCache
+
+ROUTE = {
+    "source": "Stack1",
+    "target": "Solo.Position2",
+    "plate_type": "flat_bottom_96well",
+}
+
+
+class TestRouteCache(unittest.TestCase):
+    """Tests that compiled routes are reused until resource_defs changes."""
+
+    def test_warm_routes_are_reused(self):
+        """A warmed route is compiled once and returned as the same immutable plan"""
+        cache = RouteCache([ROUTE])
+        assert (cache.misses, len(cache)) == (1, 1)
+        plan = cache.get(**ROUTE)
+        assert cache.hits == 1
+        assert isinstance(plan, tuple)
+        assert cache.get(**ROUTE) is plan
+        assert cache.get(**ROUTE, has_lid=True) is not plan
+
+    def test_resource_change_invalidates(self):
+        """Editing a location drops the compiled routes"""
+        cache = RouteCache([ROUTE])
+        location = locations["Solo.Position2"]
+        original = list(location.joint_angles)
+        try:
+            location.joint_angles[0] += 1
+            plan = cache.get(**ROUTE)
+        finally:
+            location.joint_angles[:] = original
+        assert cache.misses == 2
+        assert original[0] + 1 in [step.joints[0] for step in plan if step.joints]
+
+    def test_unknown_location_is_rejected(self):
+        """Routes to undefined locations fail before anything is executed"""
+        with self.assertRaisesRegex(Exception, "not defined"):
+            RouteCache([dict(ROUTE, target="Nowhere")])
+
+
+if __name__ == "__main__":
+    unittest.main()
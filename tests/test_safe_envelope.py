@@ -0,0 +1,104 @@
+"""Tests the PlateCrane safe envelope and the merging of moves within it."""
+
+import unittest
+
+from platecrane_driver.motion_plan import merge_safe_moves, plan_transfer
+from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.resource_defs import locations
+from platecrane_driver.safe_envelope import SafeEnvelope
+
+SAFE = list(locations["Safe"].joint_angles)
+HIDEX = list(locations["Hidex.Nest"].joint_angles)
+HIDEX_APPROACH = locations["Hidex.Nest"].safe_approach_height
+ROUTE = {
+    "source": "Hidex.Nest",
+    "target": "Peeler.Nest",
+    "plate_type": "flat_bottom_96well",
+}
+
+
+def moves(plan):
+    """Returns the move steps of a plan"""
+    return [step for step in plan if step.action == "move"]
+
+
+class TestSafeEnvelope(unittest.TestCase):
+    """Tests which pose pairs the envelope accepts."""
+
+    def setUp(self):
+        """Builds the envelope of the packaged resource definitions"""
+        self.envelope = SafeEnvelope()
+
+    def test_rotation_at_travel_height(self):
+        """Base and gripper rotate together with the arm retracted at neutral height"""
+        R, _, P, _ = HIDEX
+        assert self.envelope.contains(SAFE, [R, SAFE[1], P, SAFE[3]])
+        assert not self.envelope.contains(SAFE, [R, HIDEX_APPROACH, P, SAFE[3]])
+        assert not self.envelope.contains(
+            [SAFE[0], SAFE[1], SAFE[2], HIDEX[3]], [R, SAFE[1], P, HIDEX[3]]
+        )
+
+    def test_extension_above_approach_height(self):
+        """The arm extends over a location only at or above its safe approach height"""
+        R, Z, P, Y = HIDEX
+        retracted = [R, SAFE[1], P, SAFE[3]]
+        assert self.envelope.contains(retracted, [R, HIDEX_APPROACH, P, Y])
+        assert not self.envelope.contains(retracted, [R, Z, P, Y])
+        stack = list(locations["Stack1"].joint_angles)
+        assert not self.envelope.contains(
+            [stack[0], SAFE[1], stack[2], SAFE[3]], [stack[0], SAFE[1], *stack[2:]]
+        )
+
+    def test_unknown_axes(self):
+        """Nothing is safe while an axis is unknown"""
+        assert not self.envelope.contains([None, *SAFE[1:]], SAFE)
+
+
+class TestMergeSafeMoves(unittest.TestCase):
+    """Tests merging plans and running them against the simulator."""
+
+    def test_safe_approach_merges(self):
+        """Rotation, approach and retraction of a safe approach pick become single moves"""
+        plan = plan_transfer(**ROUTE)
+        merged = merge_safe_moves(plan, SAFE)
+        assert len(moves(merged)) == len(moves(plan)) - 4
+        assert [step.action for step in merged if step.action != "move"] == [
+            step.action for step in plan if step.action != "move"
+        ]
+        R, _, P, Y = HIDEX
+        assert moves(merged)[0].joints == (R, None, P, None)
+        assert moves(merged)[1].joints == (None, HIDEX_APPROACH, None, Y)
+
+    def test_unknown_start(self):
+        """Without a start pose, moves are only merged once every axis is set"""
+        plan = plan_transfer(**ROUTE)
+        merged = merge_safe_moves(plan, None)
+        assert moves(merged)[:2] == moves(plan)[:2]
+
+    def test_strict_motion(self):
+        """Merged and strict transfers end in the same pose, strict mode sends more moves"""
+        poses = {}
+        move_counts = {}
+        for strict_motion in (False, True):
+            simulator = PlateCraneSimulator(time_scale=0)
+            try:
+                platecrane = PlateCrane(
+                    simulator.port_path,
+                    read_mode="framed",
+                    strict_motion=strict_motion,
+                )
+                platecrane.transfer(**ROUTE)
+                poses[strict_motion] = simulator.pose
+                move_counts[strict_motion] = sum(
+                    command.startswith("MOVE") for command in simulator.command_log
+                )
+            finally:
+                simulator.close()
+        assert poses[False] == poses[True]
+        # The merged arm neutral move is a no-op that strict mode skips anyway
+        assert move_counts[False] == move_counts[True] - 3
+
+
+if __name__ == "__main__":
+    unittest.main()
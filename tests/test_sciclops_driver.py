@@ -0,0 +1,148 @@
+"""Tests the Sciclops driver against a fake USB device."""
+
+import array
+import queue
+import tempfile
+import unittest
+from pathlib import Path
+
+import usb.core
+from platecrane_driver.sciclops_driver import SCICLOPS
+
+
+class FakeSciclopsDevice:
+    """Echoes every command and answers it with '0000 Success'."""
+
+    def __init__(self):
+        """Creates the fake device"""
+        self.replies = queue.Queue()
+        self.written = []
+
+    def write(self, endpoint, command):
+        """Queues the echo and reply of a command"""
+        self.written.append(command.strip())
+        self.replies.put(command.strip() + "\r\n0000 Success\r\n")
+
+    def read(self, endpoint, buffer, timeout=None):
+        """Reads the next reply into buffer like pyusb, returns its length"""
+        try:
+            data = self.replies.get(timeout=timeout / 1000).encode()
+        except queue.Empty:
+            raise usb.core.USBTimeoutError("Operation timed out") from None
+        buffer[: len(data)] = array.array("B", data)
+        return len(data)
+
+
+class FakeSCICLOPS(SCICLOPS):
+    """SCICLOPS connected to a FakeSciclopsDevice"""
+
+    def connect_sciclops(self):
+        """Returns a fake device instead of searching the USB bus"""
+        return FakeSciclopsDevice()
+
+
+class TestCoalescedMoves(unittest.TestCase):
+    """Tests that routines send fewer commands with coalesce_moves."""
+
+    def run_get_plate(self, coalesce_moves):
+        """Runs get_plate twice and returns the driver"""
+        sciclops = FakeSCICLOPS(coalesce_moves=coalesce_moves)
+        self.addCleanup(sciclops.disconnect_robot)
+        sciclops.labware["tower2"]["howmany"] = 2
+        sciclops.get_plate("tower2")
+        sciclops.get_plate("tower2")
+        return sciclops
+
+    def test_get_plate_uses_named_points(self):
+        """Labware locations are loaded once and then reached with a single MOVE"""
+        sciclops = self.run_get_plate(coalesce_moves=True)
+        written = sciclops.host_path.written
+        assert written.count("MOVE W_neutral") == 4
+        assert (
+            sum(command.startswith("LOADPOINT W_neutral") for command in written) == 1
+        )
+        assert not any(command.startswith("DELETEPOINT") for command in written)
+        speeds = [command for command in written if command.startswith("SETSPEED")]
+        assert all(a != b for a, b in zip(speeds, speeds[1:]))
+
+    def test_command_count_drops(self):
+        """get_plate needs fewer commands than without coalescing, and fewer once its points are loaded"""
+        legacy = self.run_get_plate(coalesce_moves=False)
+        coalesced = self.run_get_plate(coalesce_moves=True)
+        count = coalesced.routine_command_counts["get_plate"]
+        assert count < legacy.routine_command_counts["get_plate"]
+        assert len(coalesced.host_path.written) < len(legacy.host_path.written)
+        assert count <= legacy.routine_command_counts["get_plate"] - 6
+
+
+class TestBatches(unittest.TestCase):
+    """Tests the multi-plate batch routines."""
+
+    def setUp(self):
+        """Creates a driver on a fake device whose exchange is always cleared right away"""
+        self.sciclops = FakeSCICLOPS(exchange_sensor=True)
+        self.addCleanup(self.sciclops.disconnect_robot)
+        self.sensor_reads = 0
+        self.sciclops.plate_present = self.exchange_empty
+        self.sciclops.update_labware("tower2", howmany=3)
+
+    def exchange_empty(self):
+        """Fake plate sensor reporting an empty exchange"""
+        self.sensor_reads += 1
+        return False
+
+    def test_get_plates(self):
+        """A batch clears the arm once and reports every plate"""
+        progress = []
+        timings = self.sciclops.get_plates("tower2", 3, on_plate=progress.append)
+        assert [timing["plate"] for timing in timings] == [1, 2, 3]
+        assert progress == timings
+        assert [timing["remaining"] for timing in timings] == [2, 1, 0]
+        assert self.sciclops.host_path.written.count("SETSPEED 12") == 1
+        assert self.sensor_reads == 2
+
+    def test_batch_stops_if_exchange_is_not_cleared(self):
+        """The batch ends early, with the placed plates reported, if the exchange stays occupied"""
+        self.sciclops.plate_present = lambda: True
+        timings = self.sciclops.get_plates("tower2", 3, exchange_timeout=0)
+        assert len(timings) == 1
+        assert self.sciclops.labware["tower2"]["howmany"] == 2
+
+    def test_batches_need_exchange_sensor(self):
+        """Without exchange_sensor, only single plate batches run"""
+        self.sciclops.exchange_sensor = False
+        with self.assertRaisesRegex(Exception, "exchange_sensor"):
+            self.sciclops.get_plates("tower2", 2)
+        assert self.sciclops.labware["tower2"]["howmany"] == 3
+        assert len(self.sciclops.get_plates("tower2", 1)) == 1
+        assert self.sensor_reads == 0
+
+    def test_unrecognized_sensor_reply(self):
+        """A GETPLATEPRESENT reply that is no sensor reading raises instead of reporting no plate"""
+        with self.assertRaisesRegex(Exception, "Unrecognized GETPLATEPRESENT reply"):
+            SCICLOPS.plate_present(self.sciclops)
+
+
+class TestLabwareFile(unittest.TestCase):
+    """Tests that labware counters persist across driver restarts."""
+
+    def test_counts_survive_restart(self):
+        """Plate counts changed by get_plate are loaded again by a new driver"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        labware_file = Path(directory.name) / "labware.json"
+
+        sciclops = FakeSCICLOPS(labware_file=labware_file)
+        sciclops.update_labware("tower2", howmany=3)
+        sciclops.get_plate("tower2")
+        sciclops.monitor.stop()  # simulate a crash, the journal is not compacted
+
+        restarted = FakeSCICLOPS(labware_file=labware_file)
+        self.addCleanup(restarted.disconnect_robot)
+        assert restarted.labware["tower2"]["howmany"] == 2
+        assert restarted.labware["exchange"]["howmany"] == 1
+        assert restarted.labware["exchange"]["has_lid"] is True
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Tests the Sciclops completion monitor."""
+
+import array
+import queue
+import threading
+import time
+import unittest
+
+import usb.core
+from platecrane_driver.sciclops_monitor import CompletionMonitor, FrameBuffer
+
+
+class FakeDevice:
+    """Answers every command with a status line followed by its echo, like the Sciclops."""
+
+    def __init__(self):
+        """Creates the fake device"""
+        self.replies = queue.Queue()
+        self.written = []
+
+    def write(self, endpoint, command):
+        """Queues the reply of a command, SILENT commands get a reply without status line and
+        HOME echoes at once and reports its status line after a second, like a slow move"""
+        self.written.append(command)
+        verb = command.split()[0]
+        if verb == "MUTE":
+            return
+        if verb == "HOME":
+            self.replies.put(command)
+            threading.Timer(1.0, self.replies.put, ["0000 HOME done\r\n"]).start()
+            return
+        if verb == "SILENT":
+            self.replies.put("partial reply\r\n")
+        else:
+            self.replies.put(f"0000 {verb} done\r\n")
+        self.replies.put(command)
+
+    def read(self, endpoint, buffer, timeout=None):
+        """Reads the next reply chunk into buffer like pyusb, returns its length"""
+        try:
+            chunk = self.replies.get(timeout=timeout / 1000)
+        except queue.Empty:
+            raise usb.core.USBTimeoutError("Operation timed out") from None
+        data = chunk.encode()
+        buffer[: len(data)] = array.array("B", data)
+        return len(data)
+
+
+class TestFrameBuffer(unittest.TestCase):
+    """Tests splitting the reply stream into lines."""
+
+    def test_lines_across_packets(self):
+        """Lines split over several packets are returned once complete, CR, LF and CRLF all end a line"""
+        frames = FrameBuffer(size=16)
+        frames.append(b"0000 Suc", 8)
+        assert list(frames.lines()) == []
+        frames.append(b"cess\r\nLINE2\rLINE3\nxyz", 21)
+        assert list(frames.lines()) == ["0000 Success", "LINE2", "LINE3"]
+        frames.append(b"\r\n" + b"a" * 40 + b"\n", 43)
+        assert list(frames.lines()) == ["xyz", "a" * 40]
+
+
+class TestCompletionMonitor(unittest.TestCase):
+    """Tests that replies resolve the futures of their commands."""
+
+    def setUp(self):
+        """Starts a monitor on a fake device"""
+        self.device = FakeDevice()
+        self.monitor = CompletionMonitor(
+            self.device,
+            poll_timeout=10,
+            first_byte_timeout=0.5,
+            inter_byte_timeout=0.1,
+            motion_verbs=["HOME"],
+        )
+        self.monitor.start()
+
+    def tearDown(self):
+        """Stops the monitor"""
+        self.monitor.stop()
+
+    def test_futures_resolve_in_order(self):
+        """Each future gets the reply of its own command, and the monitor goes idle afterwards"""
+        first = self.monitor.submit("MOVE R:1\r\n")
+        second = self.monitor.submit("JOG Z,10\r\n")
+        assert "0000 MOVE done" in first.result(timeout=2)
+        assert "0000 JOG done" in second.result(timeout=2)
+        assert self.monitor.wait_idle(timeout=2)
+        assert not self.monitor.busy()
+
+    def test_send_returns_send_command_format(self):
+        """send() returns the reply in the format SCICLOPS.send_command always returned"""
+        response = self.monitor.send("STATUS\r\n", timeout=2)
+        assert response.startswith("Write: STATUS\r\nRead: 0000 STATUS done")
+        assert self.device.written == ["STATUS\r\n"]
+
+    def test_reply_without_status_line_ends_after_inter_byte_timeout(self):
+        """A reply that never sends a status line ends after inter_byte_timeout, not the send timeout"""
+        start = time.monotonic()
+        response = self.monitor.send("SILENT\r\n", timeout=10)
+        assert "Read: partial reply" in response
+        assert time.monotonic() - start < 2
+
+    def test_no_reply_ends_after_first_byte_timeout(self):
+        """A command without any reply ends after first_byte_timeout"""
+        start = time.monotonic()
+        response = self.monitor.send("MUTE\r\n", timeout=10)
+        assert response == "Write: MUTE\r\n"
+        assert 0.5 <= time.monotonic() - start < 2
+
+    def test_slow_move_waits_for_its_status_line(self):
+        """A move outlasting first_byte_timeout keeps its status line, the next command gets its own"""
+        response = self.monitor.send("HOME\r\n", timeout=None)
+        assert response == "Write: HOME\r\nRead: HOME\r\nRead: 0000 HOME done\r\n"
+        response = self.monitor.send("STATUS\r\n", timeout=2)
+        assert "0000 STATUS done" in response and "HOME" not in response
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""Tests the simulated Sciclops and runs the Sciclops driver against it through pyusb."""
+
+import array
+import unittest
+
+import usb.core
+from platecrane_driver import sciclops_cycle_time
+from platecrane_driver.resource_registry import registry
+from platecrane_driver.sciclops_driver import SCICLOPS
+from platecrane_driver.sciclops_simulator import (
+    AXIS_LIMITS,
+    HOME_POSE,
+    PRODUCT_ID,
+    READ_ENDPOINT,
+    VENDOR_ID,
+    WRITE_ENDPOINT,
+    SciclopsSimulator,
+)
+
+HEIGHT = registry.sciclops_plate("96_well").height
+
+
+class TestSciclopsSimulator(unittest.TestCase):
+    """Tests the simulated command set."""
+
+    def setUp(self):
+        """Starts an instant simulator"""
+        self.simulator = SciclopsSimulator(time_scale=0)
+        self.addCleanup(self.simulator.close)
+
+    def test_usb_device(self):
+        """The simulator is found like the Sciclops and echoes commands before their reply"""
+        device = usb.core.find(
+            idVendor=VENDOR_ID, idProduct=PRODUCT_ID, backend=self.simulator.backend
+        )
+        assert device is not None
+        device.write(WRITE_ENDPOINT, "VERSION\r\n")
+        packet = array.array("B", bytes(200))
+        received = b""
+        while not received.endswith(b"Sciclops simulator 1.0\r\n"):
+            length = device.read(READ_ENDPOINT, packet, timeout=1000)
+            received += packet[:length].tobytes()
+        assert received == b"VERSION\r\n0000 Sciclops simulator 1.0\r\n"
+        with self.assertRaises(usb.core.USBTimeoutError):
+            device.read(READ_ENDPOINT, packet, timeout=10)
+        usb.util.dispose_resources(device)
+
+    def test_points_and_jogs(self):
+        """Points are moved to by name and jogs stop at the axis limits"""
+        execute = self.simulator.execute
+        assert execute("MOVE tower1") == ["0010 Point not found"]
+        assert execute("LOADPOINT tower1, Z:10, P:8, Y:170, R:133.5") == [
+            "0000 Success"
+        ]
+        execute("MOVE tower1")
+        assert self.simulator.pose == {"Z": 10, "R": 133.5, "Y": 170, "P": 8}
+        execute("JOG Z,-1000")
+        assert self.simulator.pose["Z"] == AXIS_LIMITS["Z"][0]
+        assert execute("GETPOS")[0].startswith("0000 Z:-421.8625, R:133.5000")
+        assert execute("HOME") == ["0000 Success"]
+        assert self.simulator.pose == HOME_POSE
+        assert execute("FLY") == ["0001 Unknown command"]
+
+    def test_motion_time(self):
+        """Moves take as long as their slowest axis, scaled by the speed"""
+        simulator = SciclopsSimulator(time_scale=1.0, velocities={"Z": 100.0})
+        self.addCleanup(simulator.close)
+        target = dict(HOME_POSE, Z=HOME_POSE["Z"] - 50)
+        assert simulator.motion_time(target) == 0.5
+        simulator.execute("SETSPEED 50")
+        assert simulator.motion_time(target) == 1.0
+
+
+class TestSciclopsDriver(unittest.TestCase):
+    """Runs SCICLOPS routines against the simulator."""
+
+    def setUp(self):
+        """Connects a driver to an instant simulator"""
+        self.simulator = SciclopsSimulator(time_scale=0)
+        self.addCleanup(self.simulator.close)
+        self.sciclops = SCICLOPS(backend=self.simulator.backend)
+        self.addCleanup(self.sciclops.disconnect_robot)
+
+    def test_get_plate_and_back(self):
+        """A plate moved to the exchange and back ends up in the tower, with the arm at neutral"""
+        self.simulator.towers["tower2"] = [HEIGHT]
+        self.sciclops.labware["tower2"]["howmany"] = 1
+        self.sciclops.get_plate("tower2", remove_lid=True)
+        assert self.sciclops.labware["exchange"]["howmany"] == 1
+        assert self.sciclops.labware["lidnest1"]["howmany"] == 1
+        self.sciclops.plate_to_stack("tower2", add_lid=True)
+        assert self.sciclops.labware["tower2"]["howmany"] == 1
+        assert self.sciclops.labware["lidnest1"]["howmany"] == 0
+        assert self.simulator.towers["tower2"] == [HEIGHT]
+
+        self.sciclops.get_position()
+        neutral = self.sciclops.labware["neutral"]["pos"]
+        assert self.sciclops.current_pos == [neutral[axis] for axis in "ZRYP"]
+        assert "LIMP" not in " ".join(self.simulator.command_log)
+
+    def test_named_points(self):
+        """Taught points keep their coordinates, points of an earlier run are not loaded again"""
+        self.simulator.execute("LOADPOINT neutral, Z:0, P:0, Y:0, R:0")
+        self.sciclops.move_loc("neutral")
+        assert self.simulator.points["neutral"] == dict.fromkeys("ZRYP", 0.0)
+        neutral = self.sciclops.labware["neutral"]["pos"]
+        assert self.simulator.points["W_neutral"] == neutral
+        assert self.simulator.pose == neutral
+
+        self.sciclops.disconnect_robot()
+        self.sciclops = SCICLOPS(backend=self.simulator.backend)
+        self.addCleanup(self.sciclops.disconnect_robot)
+        assert (
+            "W_neutral" in self.sciclops.points
+            and "neutral" not in self.sciclops.points
+        )
+        commands = len(self.simulator.command_log)
+        self.sciclops.move_loc("neutral")
+        assert self.simulator.command_log[commands:] == ["MOVE W_neutral"]
+
+    def test_queries(self):
+        """Query replies are parsed by the driver"""
+        self.sciclops.get_steps_per_unit()
+        assert self.sciclops.STEPSPERUNIT == [100.0, 100.0, 100.0, 100.0]
+        self.simulator.plate_present = True
+        assert self.sciclops.plate_present()
+        self.sciclops.limp(True)
+        assert self.simulator.command_log[-1] == "LIMP FALSE"
+
+
+class TestSciclopsCycleTime(unittest.TestCase):
+    """Fails when a routine needs more commands than its baseline."""
+
+    def test_no_command_regressions(self):
+        """Every benchmark routine stays within its stored command count"""
+        results = sciclops_cycle_time.run_all(time_scale=0)
+        assert (
+            sciclops_cycle_time.regressions(
+                results, sciclops_cycle_time.load_baseline()
+            )
+            == []
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Tests Sciclops tower picks and places that descend to the tower top computed from the plate count."""
+
+import contextlib
+import io
+import unittest
+
+from platecrane_driver.resource_registry import registry
+from platecrane_driver.sciclops_driver import SCICLOPS, TOWER_BOTTOM_Z
+from platecrane_driver.sciclops_simulator import SciclopsSimulator
+
+HEIGHT = registry.sciclops_plate("96_well").height
+PROBE = "JOG Z,-1000"
+
+
+class TestSciclopsTowers(unittest.TestCase):
+    """Runs tower routines against a simulator with plates in tower2 and tower3."""
+
+    def setUp(self):
+        """Connects a driver to an instant simulator with 5 plates in tower2 and 1 in tower3"""
+        self.simulator = SciclopsSimulator(
+            time_scale=0, towers={"tower2": [HEIGHT] * 5, "tower3": [HEIGHT]}
+        )
+        self.addCleanup(self.simulator.close)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.sciclops = SCICLOPS(backend=self.simulator.backend)
+        self.addCleanup(self.sciclops.disconnect_robot)
+
+    def run_quietly(self, routine, *args, **kwargs):
+        """Runs a routine without its output and returns the commands it sent"""
+        commands = len(self.simulator.command_log)
+        with contextlib.redirect_stdout(io.StringIO()):
+            routine(*args, **kwargs)
+        return self.simulator.command_log[commands:]
+
+    def test_learned_count(self):
+        """The first pick taps the tower and corrects its count, the next one skips the tap"""
+        self.sciclops.labware["tower2"]["howmany"] = 3
+        probing = self.run_quietly(self.sciclops.get_plate, "tower2")
+        assert PROBE in probing
+        assert self.sciclops.labware["tower2"]["howmany"] == 4
+        assert "tower2" in self.sciclops.known_towers
+
+        predicted = self.run_quietly(self.sciclops.get_plate, "tower2")
+        assert PROBE not in predicted
+        assert len(predicted) < len(probing)
+        assert self.sciclops.labware["tower2"]["howmany"] == 3
+        assert len(self.simulator.towers["tower2"]) == 3
+        assert self.simulator.held is None
+
+    def test_higher_tower_falls_back_to_tapping(self):
+        """A tower one plate higher than its count stops the slow part of the descent, the pick then taps
+        and corrects the count"""
+        self.sciclops.set_tower_count("tower2", 4)
+        commands = self.run_quietly(self.sciclops.get_plate, "tower2")
+        assert PROBE in commands
+        assert self.sciclops.labware["tower2"]["howmany"] == 4
+        assert len(self.simulator.towers["tower2"]) == 4
+        # The tower is only ever touched at low speed, by the descent and by the tap
+        contacts = [
+            speed for tower, speed in self.simulator.contacts if tower == "tower2"
+        ]
+        assert contacts and max(contacts) < 100
+
+    def test_predicted_place(self):
+        """A plate placed onto a tower with a known count lands on it and keeps the count known"""
+        self.sciclops.set_tower_count("tower3", 1)
+        self.sciclops.labware["exchange"].update(howmany=1, type="96_well")
+        commands = self.run_quietly(
+            self.sciclops.plate_to_stack, "tower3", add_lid=False
+        )
+        # The full speed descent comes before the slow one
+        slow = len(commands) - 1 - commands[::-1].index("SETSPEED 10")
+        fast = commands[slow - 1]
+        assert fast.startswith("JOG Z,-") and fast != PROBE
+        assert self.simulator.towers["tower3"] == [HEIGHT, HEIGHT]
+        assert all(speed < 100 for _, speed in self.simulator.contacts)
+        assert self.sciclops.labware["tower3"]["howmany"] == 2
+        assert self.sciclops.tower_known("tower3")
+
+    def test_measure_tower(self):
+        """Tapped heights close to whole plates set the count, others stop trusting it"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert (
+                self.sciclops.measure_tower("tower2", TOWER_BOTTOM_Z + 2 * HEIGHT) == 2
+            )
+            assert (
+                self.sciclops.measure_tower("tower2", TOWER_BOTTOM_Z + 2.5 * HEIGHT)
+                is None
+            )
+        assert self.sciclops.labware["tower2"]["howmany"] == 2
+        assert not self.sciclops.tower_known("tower2")
+        with self.assertRaisesRegex(Exception, "Invalid plate count"):
+            self.sciclops.set_tower_count("tower2", -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Tests the reply framing of the PlateCrane SerialPort."""
+
+import os
+import threading
+import time
+import unittest
+
+from platecrane_driver.serial_port import ReplyFramer, SerialPort
+
+
+def echo_first_controller(master_fd):
+    """Echoes every command as soon as it arrives and answers them in order afterwards.
+    JOG commands past the travel limit are answered with the '14' (z axis) error code."""
+    buffer = b""
+    while True:
+        try:
+            buffer += os.read(master_fd, 1024)
+        except OSError:
+            return
+        commands = []
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            commands.append(line.strip(b"\r"))
+            os.write(master_fd, commands[-1] + b"\r\n")
+        for command in commands:
+            time.sleep(0.01)
+            reply = b"14" if command.endswith(b"-99999") else b"0000 " + command
+            os.write(master_fd, reply + b"\r\n")
+
+
+class TestReplyFramer(unittest.TestCase):
+    """Tests that replies are split into frames correctly."""
+
+    def test_single_line_reply(self):
+        """The first line after the echo completes a single line reply"""
+        framer = ReplyFramer("GETPOS")
+        assert not framer.feed(b"GETPOS\r\n182220, 2500")
+        assert framer.feed(b", 460, -308\r\n")
+        assert framer.response() == ("182220, 2500, 460, -308", "GETPOS")
+
+    def test_stale_lines_are_dropped(self):
+        """Lines that arrive before the echo belong to an earlier command"""
+        framer = ReplyFramer("GETPOS")
+        assert framer.feed(b"SPEED 50\r\n0000 Success\r\nGETPOS\r\n1, 2, 3, 4\r\n")
+        assert framer.response() == ("1, 2, 3, 4", "GETPOS")
+
+    def test_multiline_reply_ends_on_status(self):
+        """Multi-line replies end on a status line"""
+        framer = ReplyFramer("LISTPOINTS")
+        assert not framer.feed(b"LISTPOINTS\r\n1:Safe, 1, 2, 3, 4\r\n")
+        assert framer.feed(b"2:Stack1, 5, 6, 7, 8\r\n0000 Success\r\n")
+        assert framer.response()[0].splitlines()[-1] == "0000 Success"
+
+    def test_multiline_reply_ends_when_quiet(self):
+        """Multi-line replies without a status line end after the frame gap"""
+        framer = ReplyFramer("LISTPOINTS", frame_gap=0)
+        assert not framer.feed(b"LISTPOINTS\r\n1:Safe, 1, 2, 3, 4\r\n")
+        assert framer.check_quiet()
+
+    def test_no_echo(self):
+        """Without an echo the raw lines are returned"""
+        framer = ReplyFramer("GETPOS")
+        assert not framer.feed(b"T1\r\n")
+        assert framer.response() == ("T1", "")
+
+
+class TestPipelinedCommands(unittest.TestCase):
+    """Tests that pipelined replies are matched to their commands."""
+
+    def test_replies_follow_command_order(self):
+        """Each reply, including an error code, is returned for the command that caused it"""
+        master_fd, slave_fd = os.openpty()
+        threading.Thread(
+            target=echo_first_controller, args=[master_fd], daemon=True
+        ).start()
+        port = SerialPort(
+            host_path=os.ttyname(slave_fd), read_mode="framed", pipeline_window=3
+        )
+        commands = ["OPEN\r\n", "JOG Z,-99999\r\n", "CLOSE\r\n", "JOG Z,100\r\n"]
+        try:
+            replies = port.send_pipelined(commands, timeout=2)
+        finally:
+            port.connection.close()
+            port.connection_status.close()
+            os.close(master_fd)
+            os.close(slave_fd)
+        assert replies == ["0000 OPEN", "14", "0000 CLOSE", "0000 JOG Z,100"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+"""Tests stack plate counts and stack picks predicted from them."""
+
+import contextlib
+import io
+import unittest
+
+from platecrane_driver.motion_plan import STACK_SPEED, plan_pick_plate_direct
+from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.resource_defs import locations
+from platecrane_driver.stack_tracker import (
+    APPROACH_CLEARANCE,
+    StackTracker,
+    plate_top_steps,
+    stack_top_z,
+)
+
+PLATE = "flat_bottom_96well"
+TOP = plate_top_steps(PLATE, has_lid=True)
+STACK_Z = locations["Stack1"].joint_angles[1]
+
+
+class TestStackTracker(unittest.TestCase):
+    """Tests counting plates and inferring counts from probed heights."""
+
+    def test_measured(self):
+        """Probed heights close to whole plates set the count, others make it unknown"""
+        tracker = StackTracker()
+        assert tracker.measured("Stack1", STACK_Z + 3 * TOP + 100, PLATE, True) == 3
+        assert tracker.count("Stack1") == 3
+        assert tracker.measured("Stack1", STACK_Z + TOP // 2, PLATE, True) is None
+        assert tracker.count("Stack1") is None
+
+    def test_pick_and_place(self):
+        """Picks and places change known counts only"""
+        tracker = StackTracker({"Stack1": 1})
+        tracker.picked("Stack1")
+        tracker.picked("Stack1")
+        tracker.placed("Stack2")
+        assert tracker.count("Stack1") == 0
+        assert tracker.count("Stack2") is None
+        with self.assertRaisesRegex(Exception, "not a stack"):
+            tracker.set_count("Safe", 1)
+
+    def test_predicted_plan(self):
+        """A predicted pick is a probing one that first descends at full speed to one plate above the top"""
+        grip = 241
+        probing = plan_pick_plate_direct("Stack1", "stack", PLATE, grip, has_lid=True)
+        predicted = plan_pick_plate_direct(
+            "Stack1", "stack", PLATE, grip, has_lid=True, plates=3
+        )
+        (descent,) = [step for step in predicted if step not in probing]
+        assert [step for step in predicted if step is not descent] == probing
+        top = stack_top_z("Stack1", PLATE, True, 3)
+        assert descent.joints[1] == top + TOP + APPROACH_CLEARANCE
+        assert descent.verify and descent.speed is None
+        assert predicted.index(descent) < predicted.index(
+            next(step for step in predicted if step.probe)
+        )
+        assert plan_pick_plate_direct("Stack1", "stack", PLATE, grip, True, plates=0)
+
+
+class TestStackPicks(unittest.TestCase):
+    """Runs stack transfers against a simulator with plates in its stacks."""
+
+    def setUp(self):
+        """Starts an instant simulator with 4 plates in Stack1"""
+        self.simulator = PlateCraneSimulator(
+            time_scale=0, stacks={"Stack1": [TOP] * 4, "Stack2": [TOP] * 3}
+        )
+        self.addCleanup(self.simulator.close)
+
+    def transfer(self, platecrane, source, target):
+        """Runs a transfer quietly and returns the commands it sent"""
+        commands = len(self.simulator.command_log)
+        with contextlib.redirect_stdout(io.StringIO()):
+            platecrane.transfer(source, target, PLATE, has_lid=True)
+        return self.simulator.command_log[commands:]
+
+    def test_learned_count(self):
+        """The first pick probes and learns the count, the next one skips the probe"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            platecrane = PlateCrane(self.simulator.port_path, read_mode="framed")
+        probing = self.transfer(platecrane, "Stack1", "Solo.Position2")
+        self.transfer(platecrane, "Solo.Position2", "Stack3")
+        predicted = self.transfer(platecrane, "Stack1", "Solo.Position2")
+
+        first, second = platecrane.stack_picks
+        assert first.probed and first.plates == 4
+        assert not second.probed and second.plates == 3
+        assert second.saved_seconds > 0
+        assert [speed for _, speed in self.simulator.contacts] == [STACK_SPEED] * 2
+
+        def moves_before_tap(commands):
+            """Counts the moves before the speed drops for the tap"""
+            tap = commands.index(f"SPEED {STACK_SPEED}")
+            return sum(command.startswith("MOVE") for command in commands[:tap])
+
+        # One extra move: the full speed descent
+        assert moves_before_tap(predicted) == moves_before_tap(probing) + 1
+        assert platecrane.stack_tracker.count("Stack1") == 2
+        assert len(self.simulator.stacks["Stack1"]) == 2
+        assert self.simulator.held is None
+
+    def test_higher_stack(self):
+        """A stack one plate higher than its count is tapped at STACK_SPEED, the tap corrects the count"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            platecrane = PlateCrane(
+                self.simulator.port_path,
+                read_mode="framed",
+                stack_counts={"Stack2": 2},
+            )
+        self.transfer(platecrane, "Stack2", "Solo.Position2")
+        (pick,) = platecrane.stack_picks
+        assert not pick.probed and pick.plates == 3
+        assert [speed for _, speed in self.simulator.contacts] == [STACK_SPEED]
+        assert platecrane.stack_tracker.count("Stack2") == 2
+        assert len(self.simulator.stacks["Stack2"]) == 2
+
+    def test_shorter_stack(self):
+        """A stack with fewer plates than its count is picked from its actual top and its count corrected"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            platecrane = PlateCrane(
+                self.simulator.port_path,
+                read_mode="framed",
+                stack_counts={"Stack2": 5},
+            )
+        self.transfer(platecrane, "Stack2", "Solo.Position2")
+        (pick,) = platecrane.stack_picks
+        assert not pick.probed and pick.plates == 3
+        assert platecrane.stack_tracker.count("Stack2") == 2
+        assert len(self.simulator.stacks["Stack2"]) == 2
+
+    def test_two_extra_plates(self):
+        """A stack two plates higher than its count stops the full speed descent, the pick then taps
+        all the way down and corrects the count"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            platecrane = PlateCrane(
+                self.simulator.port_path,
+                read_mode="framed",
+                stack_counts={"Stack2": 1},
+            )
+        self.transfer(platecrane, "Stack2", "Solo.Position2")
+        (pick,) = platecrane.stack_picks
+        assert pick.probed and pick.plates == 3
+        assert platecrane.stack_tracker.count("Stack2") == 2
+        assert len(self.simulator.stacks["Stack2"]) == 2
+
+
+if __name__ == "__main__":
+    unittest.main()
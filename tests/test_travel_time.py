@@ -0,0 +1,145 @@
+"""Tests the PlateCrane travel-time model."""
+
+import unittest
+
+import numpy as np
+from platecrane_driver.motion_plan import plan_transfer
+from platecrane_driver.platecrane_driver import PlateCrane
+from platecrane_driver.platecrane_simulator import PlateCraneSimulator
+from platecrane_driver.travel_time import (
+    MoveRecord,
+    TravelTimeModel,
+    estimate_transfer_time,
+    score_routes,
+)
+
+ROUTE = {
+    "source": "Stack1",
+    "target": "Solo.Position2",
+    "plate_type": "flat_bottom_96well",
+}
+
+
+class TestTravelTimeModel(unittest.TestCase):
+    """Tests the trapezoidal profiles, bulk scoring and calibration."""
+
+    def setUp(self):
+        """Creates a model with round numbers"""
+        self.model = TravelTimeModel(
+            velocities=[1000, 1000, 1000, 1000],
+            accelerations=[2000, 2000, 2000, 2000],
+            command_time=0,
+        )
+
+    def test_trapezoid(self):
+        """Long moves cruise, short moves never reach full velocity"""
+        distances = np.array([[2000, 0, 0, 0], [200, 0, 0, 0], [2000, 0, 0, 0]])
+        speeds = np.array([1.0, 1.0, 0.5])
+        times = self.model.move_times(distances, speeds)
+        np.testing.assert_allclose(times, [2.5, 2 * np.sqrt(0.1), 4.25])
+
+    def test_slowest_axis(self):
+        """Axes move together, so a move takes as long as its longest axis"""
+        times = self.model.move_times(np.array([[2000, 500, 0, 3000]]), np.ones(1))
+        np.testing.assert_allclose(times, [3.5])
+
+    def test_bulk_scoring(self):
+        """Scoring many plans at once equals scoring them one by one"""
+        routes = [
+            ROUTE,
+            dict(ROUTE, source="Stack5", target="Liconic.Nest"),
+            dict(ROUTE, source="Solo.Position2", target="Stack2", has_lid=True),
+        ]
+        model = TravelTimeModel.from_travel_times()
+        scores = score_routes(routes, model=model)
+        assert scores == [
+            estimate_transfer_time(**route, model=model) for route in routes
+        ]
+        assert all(score > 0 for score in scores)
+
+    def test_speed_steps(self):
+        """Slow stack segments lengthen a plan and each speed change costs speed_change_time"""
+        model = TravelTimeModel.from_travel_times(ramp_time=0, speed_change_time=0)
+        plan = plan_transfer(**ROUTE)
+        assert model.estimate_plan(plan, speed=50) > model.estimate_plan(plan)
+        full_speed = [step.model_copy(update={"speed": None}) for step in plan]
+        assert model.estimate_plan(plan) > model.estimate_plan(full_speed)
+        without_changes = model.estimate_plan(plan)
+        model.speed_change_time = 1.0
+        # Down to 50% for the stack tap and back up for the jogs
+        self.assertAlmostEqual(model.estimate_plan(plan) - without_changes, 2.0)
+
+    def test_calibrate(self):
+        """Profiles fitted to recorded moves reproduce the profiles that generated them"""
+        true_model = TravelTimeModel(
+            velocities=[40000, 9000, 3000, 3500],
+            accelerations=[200000, 45000, 15000, 17500],
+            command_time=0.05,
+        )
+        records = []
+        start = (0, 0, 0, 0)
+        for axis in range(4):
+            for distance in (50, 4000, 9000, 20000):
+                for speed in (50, 100):
+                    end = [0, 0, 0, 0]
+                    end[axis] = distance
+                    delta = np.array([end], dtype=float)
+                    seconds = true_model.move_times(delta, np.array([speed / 100]))
+                    records.append(
+                        MoveRecord(start, tuple(end), speed, float(seconds[0]))
+                    )
+        records.append(MoveRecord(start, (5000, 5000, 0, 0), 100, 99.0))
+
+        model = TravelTimeModel.calibrate(
+            records, base=TravelTimeModel([1] * 4, [1] * 4)
+        )
+        np.testing.assert_allclose(model.velocities, true_model.velocities, rtol=1e-6)
+        np.testing.assert_allclose(
+            model.accelerations, true_model.accelerations, rtol=1e-6
+        )
+
+    def test_calibrate_without_records(self):
+        """Axes without records keep the base profiles"""
+        model = TravelTimeModel.calibrate([], base=self.model)
+        np.testing.assert_array_equal(model.velocities, self.model.velocities)
+
+
+class TestDriverEstimates(unittest.TestCase):
+    """Tests estimates and recorded moves of the driver against the simulator."""
+
+    def setUp(self):
+        """Starts a fast simulator"""
+        self.simulator = PlateCraneSimulator(time_scale=0.001, command_time=0)
+
+    def tearDown(self):
+        """Stops the simulator"""
+        self.simulator.close()
+
+    def test_estimate_matches_simulator(self):
+        """With the simulator's profiles, the estimate equals the simulated busy time"""
+        platecrane = PlateCrane(
+            self.simulator.port_path,
+            read_mode="framed",
+            travel_model=TravelTimeModel.from_travel_times(
+                self.simulator.travel_times,
+                ramp_time=0,
+                command_time=0,
+                gripper_time=self.simulator.gripper_time,
+                speed_change_time=0,
+            ),
+        )
+        platecrane.get_position()
+        estimate = platecrane.estimate_transfer_time(**ROUTE)
+        busy_time = self.simulator.busy_time
+        platecrane.transfer(**ROUTE)
+        simulated = (self.simulator.busy_time - busy_time) / self.simulator.time_scale
+        self.assertAlmostEqual(estimate, simulated, places=6)
+
+        assert platecrane.recorded_moves
+        record = platecrane.recorded_moves[-1]
+        assert list(record.end) == platecrane.platecrane_current_position
+        assert record.speed == 100 and record.seconds > 0
+
+
+if __name__ == "__main__":
+    unittest.main()
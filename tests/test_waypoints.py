@@ -0,0 +1,47 @@
+"""Tests the PlateCrane waypoint bookkeeping."""
+
+import unittest
+
+from platecrane_driver.resource_defs import locations
+from platecrane_driver.waypoints import WaypointManager, derived_poses
+
+
+class TestWaypoints(unittest.TestCase):
+    """Tests that named waypoints are only loaded when missing or stale."""
+
+    def test_sync_plan_skips_matching_points(self):
+        """Points already stored with the same joint values are not reloaded"""
+        poses = derived_poses(locations)
+        manager = WaypointManager()
+        to_load = manager.sync_plan(
+            poses, {"W_Safe": poses["Safe"], "W_Stack1": (0,) * 4}
+        )
+        assert "W_Safe" not in to_load
+        assert "W_Stack1" in to_load
+        assert manager.name_for(poses["Safe"]) == "W_Safe"
+        assert manager.name_for(poses["Stack1"]) is None
+
+        manager.loaded("W_Stack1", list(poses["Stack1"]))
+        assert manager.name_for(poses["Stack1"]) == "W_Stack1"
+
+    def test_taught_points_are_kept(self):
+        """Points taught under location names are never part of the sync"""
+        poses = derived_poses(locations)
+        manager = WaypointManager()
+        to_load = manager.sync_plan(poses, {"Safe": (1, 2, 3, 4)})
+        assert "Safe" not in to_load
+        assert all(name.startswith("W_") for name in to_load)
+        assert manager.name_for(poses["Safe"]) is None
+
+    def test_ring_slots_are_reused(self):
+        """Ad-hoc poses rotate through the ring and reuse a slot holding the same pose"""
+        manager = WaypointManager(ring_size=2)
+        slot, needs_load = manager.slot_for([1, 2, 3, 4])
+        assert (slot, needs_load) == ("TEMP0", True)
+        manager.loaded(slot, [1, 2, 3, 4])
+        assert manager.slot_for([1, 2, 3, 4]) == ("TEMP0", False)
+        assert manager.slot_for([5, 6, 7, 8]) == ("TEMP1", True)
+
+
+if __name__ == "__main__":
+    unittest.main()